@@ -5,17 +5,22 @@ import os
 from dotenv import load_dotenv
 from lib.openai_client import OpenAIClient
 from lib.agent import Agent
+from lib.model_router import ModelRouter, FAST_MODEL
+from lib.prefetch import SearchPrefetcher
 from lib.serper_client import SerperClient
 from lib.message_factory import system_user_message, zero_shot_message
 from lib.eval_swarm import EvalSwarm
 from lib.portfolio import Portfolio
+from lib.portfolio_analytics import PortfolioAnalytics
 from lib.research_tools import ResearchTools
+from lib.metrics import metrics
 
 # Load environment variables from .env file if it exists
 load_dotenv()
 
 # Get API keys from environment variables
 ex_model_name = "claude-3-7-sonnet-20250219"
+fast_model_name = os.environ.get("FAST_MODEL", FAST_MODEL)
 ex_api_key = os.environ.get("ANTHROPIC_API_KEY")
 if not ex_api_key:
     raise ValueError("ANTHROPIC_API_KEY environment variable is required")
@@ -87,7 +92,10 @@ You are a deep research agent focused on finding public companies that meet the
 
 Research Tools:
 - parallel_websearch: Searches the web for information (max 50 queries at a time)
+- screen_universe: Instantly filters listed companies on the structured attributes listed in its description. Use it to narrow the candidate pool before swarm_research
 - swarm_research: Dispatches a swarm of agents to evaluate a query across a list of companies, returning a sorted list of companies by relevance to the query
+- swarm_research_multi: Evaluates several queries over the same companies in one run, sharing searches between them, and returns a company x query score matrix. Prefer it to several swarm_research calls over the same list
+- query_swarm_results: Filters, sorts and pages every swarm result from this session, including low scores that swarm_research leaves out. Use it instead of re-running a swarm; re-running swarm_research with the same query and searches only evaluates companies that are new
 
 Portfolio Tools:
 - add_companies: Adds a list of companies to the portfolio
@@ -95,15 +103,19 @@ Portfolio Tools:
 - get_portfolio: Returns the current portfolio
 - change_weight: Changes the weight of a company in the portfolio
 - weight_by: Weights the portfolio by the given metric
+- portfolio_analytics: Backtests the portfolio (or hypothetical weights) on local price history, returning return, volatility, max drawdown and risk contributions
 
 The user can see the portfolio in the UI next to you. Instead of writing out the portfolio, you can use the Portfolio Tools to add, remove, and change the weight of companies in the portfolio.
+Use portfolio_analytics to check performance and risk instead of searching the web for it; pass weights to try changes before applying them.
 """
 
 
 portfolio = Portfolio()
+portfolio_analytics = PortfolioAnalytics(portfolio)
 research_tools = ResearchTools(
     openai_api_key=os.environ.get("OPENAI_API_KEY"),
-    serper_api_key=os.environ.get("SERPER_API_KEY")
+    serper_api_key=os.environ.get("SERPER_API_KEY"),
+    session_id=os.environ.get("SESSION_ID")
 )
 
 if not os.environ.get("OPENAI_API_KEY"):
@@ -111,22 +123,43 @@ if not os.environ.get("OPENAI_API_KEY"):
 if not os.environ.get("SERPER_API_KEY"):
     raise ValueError("SERPER_API_KEY environment variable is required")
 
-portfolio_schemas, portfolio_functions = portfolio.get_schemas_and_functions()
-research_tools_schemas, research_tools_functions = research_tools.get_schemas_and_functions()
+# Tools only registered when their local data is installed; their prompt lines go with them
+OPTIONAL_TOOLS = ("screen_universe", "portfolio_analytics")
 
-agent = Agent(
-    ex_model_name, 
-    ex_api_key, 
-    new_system, 
-    [*research_tools_schemas, *portfolio_schemas], 
-    [*research_tools_functions, *portfolio_functions]
-)
+
+def system_prompt(tool_names: list[str]) -> str:
+    """new_system without the lines about optional tools that weren't registered."""
+    missing = [tool for tool in OPTIONAL_TOOLS if tool not in tool_names]
+    return "\n".join(line for line in new_system.split("\n") if not any(tool in line for tool in missing))
+
+
+def build_agent(research_tools: ResearchTools, portfolio: Portfolio, portfolio_analytics: PortfolioAnalytics, **kwargs) -> Agent:
+    """An agent over the given tools. batch.py builds one per query around a shared ResearchTools.
+    Simple portfolio turns go to FAST_MODEL (set it empty to send every turn to the primary model),
+    and responses are streamed to a SearchPrefetcher (pass prefetcher=None to turn it off)."""
+    portfolio_schemas, portfolio_functions = portfolio.get_schemas_and_functions()
+    analytics_schemas, analytics_functions = portfolio_analytics.get_schemas_and_functions()
+    research_tools_schemas, research_tools_functions = research_tools.get_schemas_and_functions()
+    if fast_model_name and "router" not in kwargs:
+        kwargs["router"] = ModelRouter(fast_model_name, simple_tools=[schema["name"] for schema in [*portfolio_schemas, *analytics_schemas]])
+    if "prefetcher" not in kwargs:
+        # Starts the searches for the candidate pool while the agent is still writing it
+        kwargs["prefetcher"] = SearchPrefetcher(research_tools.serper)
+
+    return Agent(
+        ex_model_name, 
+        ex_api_key, 
+        system_prompt([schema["name"] for schema in [*research_tools_schemas, *analytics_schemas]]),
+        [*research_tools_schemas, *portfolio_schemas, *analytics_schemas], 
+        [*research_tools_functions, *portfolio_functions, *analytics_functions],
+        **kwargs
+    )
+
+
+agent = build_agent(research_tools, portfolio, portfolio_analytics)
 
 # t = time.time()
 # agent.input_loop()
 # # agent.inpt("companies whose CEO has a podcast")
-# print(f"Agent costs: ${round(agent.get_costs()['cost'], 4)}")
-# print(f"LLM costs: ${round(research_tools.llm.get_costs()['cost'], 4)}")
-# print(f"Serper costs: ${round(research_tools.serper.get_costs()['cost'], 4)}")
+# print(metrics.report())
 # print(f"Total time: {round(time.time() - t, 2)}s")
-# print(f"Total costs: ${round(agent.get_costs()['cost'] + research_tools.serper.get_costs()['cost'] + research_tools.llm.get_costs()['cost'], 4)}")
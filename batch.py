@@ -0,0 +1,174 @@
+"""
+Headless batch runner for research queries, e.g. weekly thematic screens run from cron.
+
+    python batch.py queries.jsonl --out answers.jsonl --concurrency 4 --max-dollars 20
+
+Each input line is {"query": "...", "id": "optional stable id"}. Every query runs as its own
+Agent session, several at a time on threads, all sharing the ResearchTools from
+agentic_parallel_web: one set of HTTP clients, one run store and criterion cache, and one set
+of swarm limits, queued fairly across queries. Each finished query is appended to the output as a JSON line with the
+final answer, the portfolio the agent built and its cost, token and latency stats.
+
+Re-running with the same output file skips queries that are already done, so an interrupted
+batch picks up where it stopped and failed queries are retried. Ctrl-C stops starting new
+queries and waits for the ones in flight (Ctrl-C again abandons them). --max-dollars caps the
+spend of the whole batch: every swarm run is capped to what is left of it, and once it is reached
+the remaining queries are left for the next run.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from lib.budget import Budget, enclosing_budget
+from lib.metrics import current_session, metrics
+from lib.portfolio import Portfolio
+from lib.portfolio_analytics import PortfolioAnalytics
+from lib.run_store import make_run_id
+from agentic_parallel_web import build_agent, research_tools, portfolio_analytics
+
+
+def load_queries(path: str) -> list[dict]:
+    queries = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                queries.append({"id": item.get("id") or make_run_id("batch", item["query"], []), "query": item["query"]})
+    return queries
+
+
+def load_done(path: str) -> set[str]:
+    """Ids already answered in an earlier run; the last record for an id wins."""
+    if not os.path.exists(path):
+        return set()
+    status = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                status[record["id"]] = record["status"]
+    return {id for id, s in status.items() if s == "done"}
+
+
+def answer_text(result) -> str:
+    """Agent.run returns a text block, or a list of content blocks when it ran out of iterations."""
+    if hasattr(result, "text"):
+        return result.text
+    return "\n".join(block.text for block in result or [] if getattr(block, "type", "") == "text")
+
+
+class BatchRunner:
+    def __init__(self, out_path: str, max_dollars: float = None, max_iterations: int = 10, verbose: bool = False):
+        self.out_path = out_path
+        self.max_dollars = max_dollars
+        self.max_iterations = max_iterations
+        self.verbose = verbose
+        self.stopping = threading.Event()
+        self.counts = {"done": 0, "failed": 0, "skipped": 0}
+        self._lock = threading.Lock()
+        # Measured across every query's session
+        self.budget = Budget(max_dollars=max_dollars)
+
+    def spent(self) -> float:
+        return self.budget.spent()["dollars"]
+
+    def write(self, record: dict):
+        with self._lock:
+            self.counts[record["status"]] += 1
+            with open(self.out_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+            print(f"[{record['status']}] {record['id']} ${record['stats']['cost_usd']} {record['stats']['wall_seconds']}s: {record['query'][:80]}")
+
+    def run_query(self, item: dict):
+        if self.stopping.is_set():
+            return
+        if self.max_dollars is not None and self.spent() >= self.max_dollars:
+            with self._lock:
+                self.counts["skipped"] += 1
+            return
+        # Labels every provider call made for this query, including inside swarm tasks
+        token = current_session.set(item["id"])
+        budget_token = enclosing_budget.set(self.budget)
+        start = time.perf_counter()
+        portfolio = Portfolio()
+        agent, result, error = None, None, None
+        try:
+            # Price history is loaded once and shared; the portfolio is the query's own
+            analytics = PortfolioAnalytics(portfolio, history=portfolio_analytics.history)
+            agent = build_agent(research_tools, portfolio, analytics, max_iterations=self.max_iterations, verbose=self.verbose)
+            result = agent.run(item["query"])
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            enclosing_budget.reset(budget_token)
+            current_session.reset(token)
+        messages = agent.messages if agent else []
+        self.write({
+            "id": item["id"],
+            "query": item["query"],
+            "status": "failed" if error else "done",
+            "answer": None if error else answer_text(result),
+            "portfolio": portfolio.portfolio,
+            "error": error,
+            "stats": {
+                "cost_usd": round(metrics.cost(session=item["id"]), 5),
+                "wall_seconds": round(time.perf_counter() - start, 2),
+                "input_tokens": int(metrics.get("input_tokens_total", session=item["id"])),
+                "output_tokens": int(metrics.get("output_tokens_total", session=item["id"])),
+                "searches": int(metrics.get("requests_total", provider="serper", session=item["id"])),
+                "tool_calls": sum(
+                    1 for m in messages if m["role"] == "user" and isinstance(m["content"], list)
+                    for block in m["content"] if isinstance(block, dict) and block.get("type") == "tool_result"
+                ),
+            },
+        })
+
+    def run(self, queries: list[dict], concurrency: int):
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as pool:
+            futures = [pool.submit(self.run_query, item) for item in queries]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except KeyboardInterrupt:
+                self.stopping.set()
+                pool.shutdown(wait=False, cancel_futures=True)
+                print("\nInterrupted: finishing the queries in flight; re-run to resume the rest")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("queries", help="JSONL file of {\"query\", \"id\"} lines")
+    parser.add_argument("--out", default="batch_results.jsonl")
+    parser.add_argument("--concurrency", type=int, default=4, help="Agent sessions running at once")
+    parser.add_argument("--max-dollars", type=float, default=None, help="Spend cap for the whole batch")
+    parser.add_argument("--swarm-max-dollars", type=float, default=None, help="Spend cap for each swarm run")
+    parser.add_argument("--swarm-deadline", type=float, default=None, help="Deadline in seconds for each swarm run")
+    parser.add_argument("--max-iterations", type=int, default=10, help="Tool-use turns per query")
+    parser.add_argument("--verbose", action="store_true", help="Print every agent's conversation and swarm progress")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries)
+    done = load_done(args.out)
+    todo = [q for q in queries if q["id"] not in done]
+    print(f"{len(queries)} queries, {len(queries) - len(todo)} already done, running {len(todo)} with concurrency {args.concurrency}")
+
+    limits = {"max_dollars": args.swarm_max_dollars, "deadline_seconds": args.swarm_deadline}
+    research_tools.swarm_budget.update({k: v for k, v in limits.items() if v is not None})
+    if not args.verbose:
+        research_tools.swarm.subscribers.clear()
+
+    runner = BatchRunner(args.out, args.max_dollars, args.max_iterations, args.verbose)
+    start = time.perf_counter()
+    runner.run(todo, args.concurrency)
+    print(f"\nDone {runner.counts['done']}, failed {runner.counts['failed']}, skipped {runner.counts['skipped']} "
+          f"in {round(time.perf_counter() - start, 1)}s for ${round(runner.spent(), 4)}")
+    print(metrics.report())
+    if os.environ.get("METRICS_PATH"):
+        with open(os.environ["METRICS_PATH"], "w") as f:
+            f.write(metrics.to_json())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Offline throughput benchmark for the swarm and research tools.
+
+Starts local stand-in Serper/OpenAI/Anthropic/Firecrawl servers (lib/mock_servers.py), points the
+clients at them and runs ResearchTools.swarm_research and parallel_websearch at several company
+counts. Results are written as JSON so runs can be compared for regressions:
+
+    python benchmark.py --sizes 50 500 5000 --out bench.json
+    python benchmark.py --sizes 50 500 --compare bench.json
+"""
+import argparse
+import json
+import platform
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+from lib.metrics import metrics
+from lib.mock_servers import MockServers, DEFAULT_CONFIG
+from lib.research_tools import ResearchTools
+from lib.run_store import RunStore
+
+SEARCHES = ["{company} revenue growth", "{company} market share"]
+QUERY = "companies with growing revenue and a leading market share"
+
+
+def run_case(tools: ResearchTools, servers: MockServers, target: str, size: int, trace_memory: bool) -> dict:
+    companies = [f"Company {i:05d}" for i in range(size)]
+    servers.reset()
+    metrics.reset()
+    if trace_memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    if target == "swarm_research":
+        tools.swarm_research({"query": QUERY, "companies": companies, "searches": SEARCHES})
+        completed = int(metrics.get("swarm_companies_total", status="ok"))
+    else:
+        output = tools.parallel_websearch({"queries": [f"{company} news" for company in companies]})
+        completed = size - output.count("Search failed: ")
+    wall = time.perf_counter() - start
+
+    peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    if trace_memory:
+        tracemalloc.stop()
+
+    server = servers.stats()
+    request_latency = metrics.histogram("request_latency", provider="serper")
+    company_latency = metrics.histogram("swarm_company_latency", swarm=type(tools.swarm).__name__)
+    return {
+        "target": target,
+        "size": size,
+        "wall_seconds": round(wall, 3),
+        "completed": completed,
+        "failed": size - completed,
+        "companies_per_second": round(completed / wall, 2) if wall else None,
+        "company_latency": company_latency.to_dict() if company_latency and target == "swarm_research" else {"p50": None, "p95": None, "p99": None},
+        "serper_latency": request_latency.to_dict() if request_latency else None,
+        "cost_usd": round(metrics.cost(), 4),
+        "peak_traced_memory_mb": round(peak / 1e6, 2) if peak is not None else None,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+        "server": server,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float):
+    """Print throughput deltas against a previous results file and count regressions."""
+    previous = {(r["target"], r["size"]): r for r in baseline["runs"]}
+    regressions = 0
+    for run in current["runs"]:
+        base = previous.get((run["target"], run["size"]))
+        if not base or not base["companies_per_second"] or not run["companies_per_second"]:
+            continue
+        delta = run["companies_per_second"] / base["companies_per_second"] - 1
+        flag = "REGRESSION" if delta < -tolerance else ""
+        regressions += bool(flag)
+        print(f"{run['target']:>20} {run['size']:>6}: {base['companies_per_second']:>9} -> {run['companies_per_second']:>9} companies/s ({delta:+.1%}) {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500, 5000])
+    parser.add_argument("--targets", nargs="+", default=["swarm_research", "parallel_websearch"], choices=["swarm_research", "parallel_websearch"])
+    parser.add_argument("--serper-latency", type=float, default=DEFAULT_CONFIG["serper"]["median_latency"], help="Median Serper latency in seconds")
+    parser.add_argument("--openai-latency", type=float, default=DEFAULT_CONFIG["openai"]["median_latency"], help="Median OpenAI latency in seconds")
+    parser.add_argument("--sigma", type=float, default=0.5, help="Lognormal latency spread")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--rate-limit-rps", type=float, default=None, help="Requests per second per provider above which the servers answer 429")
+    parser.add_argument("--trace-memory", action="store_true", help="Track peak Python allocations with tracemalloc (slows the run)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", help="Previous results file to compare throughput against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed throughput drop before flagging a regression")
+    args = parser.parse_args()
+
+    provider = lambda latency: {"median_latency": latency, "sigma": args.sigma, "error_rate": args.error_rate, "rate_limit_rps": args.rate_limit_rps}
+    config = {"serper": provider(args.serper_latency), "openai": provider(args.openai_latency)}
+
+    results = {"timestamp": time.time(), "python": platform.python_version(), "config": config, "runs": []}
+    with MockServers(config, seed=args.seed) as servers:
+        for size in args.sizes:
+            for target in args.targets:
+                # Fresh tools, caches and a throwaway run store for every case, so nothing is resumed
+                tools = ResearchTools(
+                    openai_api_key="mock", serper_api_key="mock", firecrawl_api_key="mock",
+                    openai_base_url=servers.openai_base_url, serper_base_url=servers.url, firecrawl_base_url=servers.firecrawl_base_url,
+                    run_store=RunStore(os.path.join(tempfile.mkdtemp(), "runs.sqlite")),
+                )
+                run = run_case(tools, servers, target, size, args.trace_memory)
+                results["runs"].append(run)
+                print(f"\n{target} x {size}: {run['companies_per_second']} companies/s, company p95 {run['company_latency']['p95']}s, "
+                      f"{run['server']['connections_seen']} connections (peak {run['server']['peak_connections']})")
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(results, json.load(f), args.tolerance):
+                raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
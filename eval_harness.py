@@ -0,0 +1,207 @@
+"""
+Quality-vs-cost evaluation of EvalSwarm configurations.
+
+Runs every configuration over a labeled dataset of (query, searches, company, expected score)
+rows and reports score agreement next to cost and latency, so a cheaper or faster setting can be
+accepted or rejected on evidence:
+
+    python eval_harness.py --backend mock
+    python eval_harness.py --backend live --record data/eval.cassette     # once, with real keys
+    python eval_harness.py --backend cassette --cassette data/eval.cassette
+
+A configuration is a dict of overrides on the baseline (see data/eval_configs.json): model,
+max_tokens, rag_tokens, results_per_search, max_searches (use only the first N search templates
+of each query), per_criterion, pack and pipeline. Every configuration gets fresh clients, metrics
+and run store, so nothing is resumed or cached between them. A cassette only answers requests it
+has recorded: record every configuration once before comparing them offline. The mock backend
+answers with pseudo-random scores, so it exercises the harness but says nothing about accuracy.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from collections import defaultdict
+import numpy as np
+from lib.cassette import Cassette
+from lib.eval_swarm import EvalSwarm
+from lib.metrics import MetricsRegistry
+from lib.mock_servers import MockServers
+from lib.openai_client import OpenAIClient
+from lib.rag import RagBuilder
+from lib.run_store import RunStore, make_run_id
+from lib.serper_client import SerperClient
+
+DEFAULT_DATASET = os.path.join("data", "eval_set.jsonl")
+DEFAULT_CONFIGS = os.path.join("data", "eval_configs.json")
+BASELINE = {
+    "model": "gpt-4o-mini",
+    "max_tokens": 250,
+    "rag_tokens": 600,
+    "results_per_search": 10,
+    "max_searches": None,
+    "per_criterion": True,
+    "pack": False,
+    "pipeline": True,
+}
+# A score above this counts as "meets the query", as in swarm_research's output
+THRESHOLD = 50
+
+
+def load_dataset(path: str) -> list[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def agreement(pairs: list[tuple[float, float]], total: int) -> dict:
+    """Agreement between (predicted, expected) scores; `total` counts pairs that got no score too."""
+    if not pairs:
+        return {"coverage": 0.0, "mae": None, "accuracy": None, "correlation": None}
+    predicted, expected = np.array(pairs, dtype=float).T
+    varied = len(pairs) > 1 and predicted.std() > 0 and expected.std() > 0
+    return {
+        "coverage": round(len(pairs) / total, 3),
+        "mae": round(float(np.abs(predicted - expected).mean()), 2),
+        "accuracy": round(float(((predicted > THRESHOLD) == (expected > THRESHOLD)).mean()), 3),
+        "correlation": round(float(np.corrcoef(predicted, expected)[0, 1]), 3) if varied else None,
+    }
+
+
+async def run_config(config: dict, rows: list[dict], clients) -> dict:
+    settings = {**BASELINE, **{k: v for k, v in config.items() if k != "name"}}
+    registry = MetricsRegistry()
+    llm, serper = clients(registry)
+    store = RunStore(os.path.join(tempfile.mkdtemp(), "runs.sqlite"))
+    swarm = EvalSwarm(
+        llm, serper,
+        run_store=store,
+        pipeline=settings["pipeline"],
+        per_criterion=settings["per_criterion"],
+        model=settings["model"],
+        max_tokens=settings["max_tokens"],
+        rag_builder=RagBuilder(token_budget=settings["rag_tokens"], results_per_search=settings["results_per_search"], metrics=registry),
+    )
+    swarm.subscribers = []
+
+    queries = {}
+    for row in rows:
+        entry = queries.setdefault(row["query"], {"query": row["query"], "searches": row["searches"][:settings["max_searches"]], "companies": []})
+        if row["company"] not in entry["companies"]:
+            entry["companies"].append(row["company"])
+
+    predicted, evaluated = {}, 0
+    start = time.perf_counter()
+    if settings["pack"]:
+        # One pass over every company, packing all queries into each company's model call
+        companies = list(dict.fromkeys(c for q in queries.values() for c in q["companies"]))
+        multi = [{"query": q["query"], "searches": q["searches"]} for q in queries.values()]
+        run_id = make_run_id("eval_harness", json.dumps(multi), [])
+        await swarm.research_multi(multi, companies, pack=True, run_id=run_id)
+        for company, answers in store.completed(run_id).items():
+            for query, answer in answers.items():
+                predicted[(query, company)] = answer["final_score"]
+        evaluated = len(companies) * len(multi)
+    else:
+        for q in queries.values():
+            run_id = make_run_id("eval_harness", q["query"], q["searches"])
+            await swarm.research(q["query"], q["companies"], q["searches"], run_id=run_id)
+            for company, answer in store.completed(run_id).items():
+                predicted[(q["query"], company)] = answer["final_score"]
+            evaluated += len(q["companies"])
+    wall = time.perf_counter() - start
+
+    scored = [(predicted[(r["query"], r["company"])], r["expected"]) for r in rows if (r["query"], r["company"]) in predicted]
+    latency = registry.histogram("swarm_company_latency", swarm="EvalSwarm")
+    tokens = registry.get("input_tokens_total") + registry.get("output_tokens_total")
+    structured = registry.get("structured_outputs_total")
+    return {
+        "name": config.get("name", json.dumps(config)),
+        "settings": settings,
+        **agreement(scored, len(rows)),
+        "cost_usd": round(registry.cost(), 5),
+        "cost_per_company": round(registry.cost() / evaluated, 6) if evaluated else None,
+        "tokens_per_company": round(tokens / evaluated, 1) if evaluated else None,
+        "searches": int(registry.get("requests_total", provider="serper")),
+        "lost_rate": round(registry.get("structured_outputs_total", outcome="lost") / structured, 4) if structured else None,
+        "latency_p50": round(latency.quantile(0.5), 3) if latency else None,
+        "latency_p95": round(latency.quantile(0.95), 3) if latency else None,
+        "wall_seconds": round(wall, 2),
+    }
+
+
+def report(results: list[dict]):
+    """Print the configurations side by side, with changes relative to the first one."""
+    base = results[0]
+    columns = [("mae", "MAE", "{:.1f}"), ("accuracy", "acc", "{:.1%}"), ("coverage", "cover", "{:.0%}"),
+               ("cost_per_company", "$/company", "{:.5f}"), ("latency_p95", "p95 s", "{:.2f}")]
+    width = max(len(r["name"]) for r in results) + 2
+    print("".join(["config".ljust(width), *(f"{label:>22}" for _, label, _ in columns)]))
+    for result in results:
+        cells = []
+        for key, _, fmt in columns:
+            value, reference = result[key], base[key]
+            if value is None:
+                cells.append(f"{'-':>22}")
+                continue
+            text = fmt.format(value)
+            if result is not base and reference:
+                text += f" ({value / reference - 1:+.0%})"
+            cells.append(f"{text:>22}")
+        print("".join([result["name"].ljust(width), *cells]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", default=DEFAULT_DATASET, help="JSONL rows of query, searches, company, expected")
+    parser.add_argument("--configs", default=DEFAULT_CONFIGS, help="JSON file with a list of configurations; the first is the baseline")
+    parser.add_argument("--only", nargs="+", help="Only run the configurations with these names")
+    parser.add_argument("--backend", choices=["mock", "cassette", "live"], default="mock")
+    parser.add_argument("--cassette", help="Cassette to replay (cassette backend)")
+    parser.add_argument("--record", help="Record the live run into this cassette")
+    parser.add_argument("--out", default="eval_results.json")
+    args = parser.parse_args()
+
+    rows = load_dataset(args.dataset)
+    with open(args.configs) as f:
+        configs = json.load(f)["configs"]
+    if args.only:
+        configs = [c for c in configs if c.get("name") in args.only]
+
+    if args.backend == "cassette":
+        if not args.cassette:
+            parser.error("--backend cassette needs --cassette")
+        cassette = Cassette(args.cassette, "replay")
+    elif args.backend == "live" and args.record:
+        cassette = Cassette(args.record, "record")
+    else:
+        # Explicitly off, whatever CASSETTE_PATH says
+        cassette = Cassette()
+
+    servers = MockServers().start() if args.backend == "mock" else None
+    try:
+        def clients(registry):
+            if servers is not None:
+                return (OpenAIClient("mock", base_url=servers.openai_base_url, metrics=registry, cassette=cassette),
+                        SerperClient("mock", base_url=servers.url, metrics=registry, cassette=cassette))
+            return (OpenAIClient(os.environ.get("OPENAI_API_KEY", "replay"), metrics=registry, cassette=cassette),
+                    SerperClient(os.environ.get("SERPER_API_KEY", "replay"), metrics=registry, cassette=cassette))
+
+        results = []
+        for config in configs:
+            result = asyncio.run(run_config(config, rows, clients))
+            results.append(result)
+            print(f"{result['name']}: MAE {result['mae']}, accuracy {result['accuracy']}, ${result['cost_usd']} in {result['wall_seconds']}s")
+    finally:
+        if servers is not None:
+            servers.stop()
+
+    print()
+    report(results)
+    with open(args.out, "w") as f:
+        json.dump({"timestamp": time.time(), "backend": args.backend, "dataset": args.dataset, "rows": len(rows), "results": results}, f, indent=2)
+    print(f"\nResults written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
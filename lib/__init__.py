@@ -9,7 +9,24 @@ from .message_factory import system_user_message, zero_shot_message
 from .eval_swarm import EvalSwarm
 from .answer_swarm import AnswerSwarm
 from .portfolio import Portfolio
+from .portfolio_analytics import PortfolioAnalytics, PriceHistory
 from .symbols import active_instruments
 from .research_tools import ResearchTools
+from .metrics import MetricsRegistry, metrics
+from .tracing import Tracer, tracer
+from .mock_servers import MockServers
+from .run_store import RunStore
+from .work_queue import WorkQueue, SharedRateLimiter
+from .budget import Budget
+from .concurrency import AdaptiveConcurrency
+from .hedging import Hedger
+from .endpoints import EndpointPool
+from .model_router import ModelRouter
+from .search_cache import SearchCache
+from .prefetch import SearchPrefetcher
+from .progress import Progress, ConsoleProgress
+from .cassette import Cassette
+from .swarm_results import SwarmResults
+from .screener import Screener, AttributeTable
 
-__all__ = ['Agent', 'SerperClient', 'OpenAIClient', 'system_user_message', 'zero_shot_message', 'EvalSwarm', 'AnswerSwarm', 'Portfolio', 'ResearchTools', 'active_instruments'   ] 
\ No newline at end of file
+__all__ = ['Agent', 'SerperClient', 'OpenAIClient', 'system_user_message', 'zero_shot_message', 'EvalSwarm', 'AnswerSwarm', 'Portfolio', 'PortfolioAnalytics', 'PriceHistory', 'ResearchTools', 'Screener', 'AttributeTable', 'MetricsRegistry', 'metrics', 'Tracer', 'tracer', 'MockServers', 'RunStore', 'WorkQueue', 'SharedRateLimiter', 'Budget', 'AdaptiveConcurrency', 'Hedger', 'EndpointPool', 'ModelRouter', 'SearchCache', 'SearchPrefetcher', 'Progress', 'ConsoleProgress', 'Cassette', 'SwarmResults', 'active_instruments'   ] 
\ No newline at end of file
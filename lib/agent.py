@@ -1,15 +1,44 @@
-from anthropic import Anthropic
+import anthropic.types
+import pydantic
+from anthropic import Anthropic, DefaultHttpxClient
 from termcolor import colored
 import json
 from typing import Callable
+import threading
+import time
+from lib.metrics import MetricsRegistry, TOKEN_PRICING, current_tool, token_cost, metrics as default_metrics
+from lib.tracing import tracer
+from lib.cassette import Cassette, cassette as default_cassette
+from lib.model_router import ModelRouter
+from lib.prefetch import SearchPrefetcher
 
 
 
+def _build_response_models():
+    """The SDK defers building its response models until first use, which isn't thread-safe:
+    concurrent first streams (e.g. batch.py's sessions) can lose a message's content. Build
+    them all up front instead."""
+    for name in dir(anthropic.types):
+        model = getattr(anthropic.types, name)
+        if isinstance(model, type) and issubclass(model, pydantic.BaseModel):
+            model.model_rebuild()
+
+
+_build_response_models()
+
+
 class Agent:
-    def __init__(self, model_name: str, api_key: str, system: str, tools: list[dict], funcs: dict[str, Callable], max_iterations: int = 10, temperature: float = 0.0):
+    def __init__(self, model_name: str, api_key: str, system: str, tools: list[dict], funcs: dict[str, Callable], max_iterations: int = 10, temperature: float = 0.0, metrics: MetricsRegistry = None, base_url: str = None, timeout: float = 120.0, cassette: Cassette = None, verbose: bool = True, router: ModelRouter = None, prefetcher: SearchPrefetcher = None):
+        """model_name is the primary model. With a router, turns it deems simple go to its fast
+        model instead, and are escalated back to the primary model when the fast answer won't do.
+        With a prefetcher, responses are streamed to it so it can start likely searches early."""
         self.model_name = model_name
         self.api_key = api_key
-        self.client = Anthropic(api_key=api_key)
+        # Record or replay model calls when a cassette is configured (see lib.cassette)
+        self.cassette = cassette or default_cassette
+        http_client = DefaultHttpxClient(transport=self.cassette.transport("anthropic")) if self.cassette.conn is not None else None
+        # base_url also falls back to ANTHROPIC_BASE_URL inside the SDK
+        self.client = Anthropic(api_key=api_key, base_url=base_url, timeout=timeout, http_client=http_client)
         self.system = system
         self.tools = tools
         self.funcMap = self.map_to_tools(tools, funcs)
@@ -18,39 +47,88 @@ class Agent:
         self.messages = []
         self.input_tokens = 0
         self.output_tokens = 0
+        self.metrics = metrics or default_metrics
+        self.router = router
+        self.prefetcher = prefetcher
+        # Usage per model tier: {"primary" | "fast": {"model", "calls", "input_tokens", "output_tokens"}}
+        self.tiers = {}
+        # Print the conversation as it happens; off for headless runs
+        self.verbose = verbose
 
     def map_to_tools(self, tools: list[dict], funcs: dict[str, Callable]) -> dict[str, Callable]:
         return {tool["name"]: func for tool, func in zip(tools, funcs)}
     
     def process_tool_call(self, tool_name, tool_input):
         if tool_name in self.funcMap:
-            return self.funcMap[tool_name](tool_input)
+            # Attribute any provider usage inside the tool to it
+            token = current_tool.set(tool_name)
+            try:
+                with tracer.span(f"tool:{tool_name}", "tool"), self.metrics.timer("tool_latency", tool=tool_name):
+                    return self.funcMap[tool_name](tool_input)
+            finally:
+                current_tool.reset(token)
         else:
             raise ValueError(f"Unexpected tool name: {tool_name}")
     
 
     def model_call(self, allow_tools: bool = True, max_tokens: int = 5000):
-        if allow_tools:
-            response = self.client.messages.create(
-                model=self.model_name,
-                messages=self.messages,
-                max_tokens=max_tokens,
-                system = self.system,
-                tool_choice={"type": "auto"},
-                tools=self.tools,
-            )
-        else:
-            response = self.client.messages.create(
-                model=self.model_name,
-                messages=self.messages,
-                max_tokens=max_tokens,
-                system = self.system,
-            )
+        if self.router is None:
+            return self._model_call(self.model_name, "primary", "default", allow_tools, max_tokens)
+        tier, reason = self.router.classify(self.messages, allow_tools)
+        if tier == "fast":
+            response = self._model_call(self.router.fast_model, tier, reason, allow_tools, min(max_tokens, self.router.fast_max_tokens))
+            escalation = self.router.escalation(response, self.messages)
+            if escalation is None:
+                return response
+            self.metrics.inc("model_escalations_total", reason=escalation)
+            reason = "escalated"
+        return self._model_call(self.model_name, "primary", reason, allow_tools, max_tokens)
+
+    def _model_call(self, model: str, tier: str, reason: str, allow_tools: bool, max_tokens: int):
+        self.metrics.inc("model_route_total", tier=tier, reason=reason)
+        start = time.perf_counter()
+        with tracer.span("anthropic.messages", "http", model=model, tier=tier), self.metrics.timer("request_latency", provider="anthropic", model=model):
+            kwargs = {"model": model, "messages": self.messages, "max_tokens": max_tokens, "system": self.system}
+            if allow_tools:
+                kwargs.update(tool_choice={"type": "auto"}, tools=self.tools)
+            response = self.client.messages.create(**kwargs) if self.prefetcher is None else self._stream(kwargs)
+        self.metrics.observe("model_turn_latency", time.perf_counter() - start, tier=tier)
         self.input_tokens += response.usage.input_tokens
         self.output_tokens += response.usage.output_tokens
+        usage = self.tiers.setdefault(tier, {"model": model, "calls": 0, "input_tokens": 0, "output_tokens": 0})
+        usage["calls"] += 1
+        usage["input_tokens"] += response.usage.input_tokens
+        usage["output_tokens"] += response.usage.output_tokens
+        self.metrics.record_tokens("anthropic", model, response.usage.input_tokens, response.usage.output_tokens)
+        self.metrics.inc("model_tier_cost_usd_total", token_cost("anthropic", model, response.usage.input_tokens, response.usage.output_tokens), tier=tier)
+        return response
+
+    def _stream(self, kwargs: dict):
+        """Stream a response, feeding its text and tool inputs to the prefetcher as they arrive."""
+        with self.client.messages.stream(**kwargs) as stream:
+            for event in stream:
+                if event.type == "text":
+                    self.prefetcher.feed(event.text)
+                elif event.type == "input_json":
+                    self.prefetcher.feed_json(stream.current_message_snapshot.content[-1].name, event.partial_json)
+            response = stream.get_final_message()
+        self.prefetcher.flush()
         return response
 
     def run(self, input):
+        if self.prefetcher is not None:
+            self.prefetcher.reset()
+        checkpoint = len(self.messages)
+        try:
+            with tracer.session("agent_run"), tracer.span("agent.run", "agent", input=input[:200]):
+                return self._run(input)
+        except KeyboardInterrupt:
+            # Drop the interrupted turn so the history never ends on a tool call without its result.
+            # Tools running swarms have already cancelled their in-flight requests by now.
+            del self.messages[checkpoint:]
+            raise
+
+    def _run(self, input):
         # add the user message to history
         self.messages.append({"role":"user", "content":input})
 
@@ -59,7 +137,8 @@ class Agent:
         while iter < self.max_iterations:
 
             # run the completion
-            response = self.model_call()
+            with tracer.span("model_turn", "agent", iteration=iter):
+                response = self.model_call()
             # print(response)
             self.messages.append({"role": "assistant", "content": response.content})
 
@@ -84,51 +163,86 @@ class Agent:
                 function_name = tool_use.name
                 function_input = tool_use.input
                 if text:
-                    print(colored(text.text, "blue"))
+                    self._print(text.text, "blue")
                 # can replace this with callbacks
-                print(colored(f"Using {function_name} with input:\n {json.dumps(function_input, indent=4)}", "yellow"))
+                self._print(f"Using {function_name} with input:\n {json.dumps(function_input, indent=4)}", "yellow")
 
-                # call the function
-                results = self.process_tool_call(function_name, function_input)
+                if self.prefetcher is not None:
+                    self.prefetcher.tool_call(function_name, function_input)
+                # call the function; a failure goes back to the model as an error result it can recover from
+                is_error = False
+                try:
+                    results = self.process_tool_call(function_name, function_input)
+                except Exception as e:
+                    results, is_error = f"{type(e).__name__}: {e}", True
 
                 # this is for debug
-                print(colored(results, "red"))
+                self._print(results, "red")
 
                 # add the function results to the chat history
-                self.messages.append({"role":"user","content": [
-                    {
-                        "type": "tool_result",
-                        "tool_use_id": tool_use.id,
-                        "content": results,
-                    }
-                ]})
+                tool_result = {
+                    "type": "tool_result",
+                    "tool_use_id": tool_use.id,
+                    "content": results,
+                }
+                if is_error:
+                    tool_result["is_error"] = True
+                self.messages.append({"role":"user","content": [tool_result]})
                 # then return to recall the model, +1 iterations
                 iter = iter + 1
 
             # otherwise print the response and get user input
             else:
-                print(colored(text.text, "blue"))
+                self._print(text.text, "blue")
                 return text
 
         # when iterations max out, kill the loop
 
         response = self.model_call(allow_tools=False)
         self.messages.append({"role": "assistant", "content": response.content})
-        print(response.content[0].text)
+        self._print(response.content[0].text)
         return response.content
+
+    def _print(self, text, color: str = None):
+        if self.verbose:
+            print(colored(text, color) if color else text)
     
     def input_loop(self):
         while True:
-            i = input("Enter a query: ")
+            try:
+                i = input("Enter a query: ")
+            except (KeyboardInterrupt, EOFError):
+                print()
+                break
             if i == "exit":
                 break
-            self.run(i)
-
-    def get_costs(self, input_cpm: float = 3.0, output_cpm: float = 15.0):
+            try:
+                self.run(i)
+            except KeyboardInterrupt:
+                # Ctrl-C cancels the current query, Ctrl-C at the prompt exits
+                print(colored("\nQuery cancelled", "yellow"))
+
+    def get_costs(self, input_cpm: float = None, output_cpm: float = None):
+        """Token usage and cost, in total and per model tier. Each model is priced from TOKEN_PRICING
+        unless rates are given."""
+        def rates(model):
+            prices = TOKEN_PRICING["anthropic"].get(model, TOKEN_PRICING["anthropic"]["default"])
+            return (prices[0] if input_cpm is None else input_cpm), (prices[1] if output_cpm is None else output_cpm)
+
+        tiers = {}
+        for tier, usage in self.tiers.items():
+            tier_input_cpm, tier_output_cpm = rates(usage["model"])
+            tiers[tier] = {
+                **usage,
+                "input_cost": usage["input_tokens"] * tier_input_cpm / 1000000,
+                "output_cost": usage["output_tokens"] * tier_output_cpm / 1000000,
+            }
+            tiers[tier]["cost"] = tiers[tier]["input_cost"] + tiers[tier]["output_cost"]
         return {
             "input_tokens": self.input_tokens,
             "output_tokens": self.output_tokens,
-            "input_cost": self.input_tokens * input_cpm / 1000000,
-            "output_cost": self.output_tokens * output_cpm / 1000000,
-            "cost": self.input_tokens * input_cpm / 1000000 + self.output_tokens * output_cpm / 1000000,
+            "input_cost": sum(t["input_cost"] for t in tiers.values()),
+            "output_cost": sum(t["output_cost"] for t in tiers.values()),
+            "cost": sum(t["cost"] for t in tiers.values()),
+            "tiers": tiers,
         }
@@ -6,8 +6,17 @@ from lib.openai_client import OpenAIClient
 from lib.serper_client import SerperClient
 from lib.message_factory import system_user_message
 from lib.swarm import Swarm
+from lib.run_store import RunStore
+from lib.concurrency import AdaptiveConcurrency
+from lib.rag import RagBuilder
+from lib.tracing import tracer
 
 DEFAULT_ANSWER_SYSTEM = "Your job is to answer the query about the company.\nYou will be given a company name, a query, and a list of search results.\nYou will need to provide a clear answer to the query and indicate your confidence level.\nYou will need to return a confidence score between 0 and 100, and an answer based on the search results and your own knowledge.\nDon't over index on the search results, use your own knowledge as well.\nAnswer should be concise as possible and data dense; 10-20 words. Only include data that is relevant to the query.\nYour answer should be in JSON format with values company, answer, confidence"
+ANSWER_SCHEMA = {
+    "title": "answer",
+    "type": "object",
+    "properties": {"company": {"type": "string"}, "answer": {"type": "string"}, "confidence": {"type": "integer", "minimum": 0, "maximum": 100}},
+}
 DEFAULT_ANSWER_USER = "Company: {company}\nQuery: {query}\nSearch results: {rag}\n\nAnswer the query based on the search results and your own knowledge.\n\nAnswer:"
 
 class AnswerSwarm(Swarm):
@@ -15,23 +24,29 @@ class AnswerSwarm(Swarm):
                  llm: OpenAIClient, serper: SerperClient, 
                  answer_system: str = DEFAULT_ANSWER_SYSTEM,
                  answer_user: str = DEFAULT_ANSWER_USER,
+                 answer_schema: dict = ANSWER_SCHEMA,
                  max_workers: int = 50,
-                 requests_per_second: int = 50
+                 requests_per_second: int = 50,
+                 run_store: RunStore = None,
+                 concurrency: AdaptiveConcurrency = None,
+                 llm_requests_per_second: int = None,
+                 pipeline: bool = True,
+                 rag_builder: RagBuilder = None,
+                 deadline_seconds: float = None,
+                 subscribers: list = None
                  ):
-        super().__init__(llm, serper, max_workers, requests_per_second)
+        super().__init__(llm, serper, max_workers, requests_per_second, run_store, concurrency, llm_requests_per_second, pipeline,
+                         rag_builder=rag_builder, deadline_seconds=deadline_seconds, subscribers=subscribers)
         self.answer_system = answer_system
         self.answer_user = answer_user
+        self.answer_schema = answer_schema
 
-    async def query(self, query: str, company: str, searches: list[str]) -> str:
-        rag = ""
-        for search in searches:
-            search_query = search.format(company=company)
-            search_results = await self.serper.search_async(search_query)
-            rag += f"{search_query}\n{search_results}\n\n"
-        answer_results = await self.llm.chat_completion_async(
-            system_user_message(self.answer_system, self.answer_user.format(company=company, query=query, rag=rag)), 
-            max_tokens=250, 
-            json_response=True
-        )
-        print(".", end="", flush=True)
+    async def evaluate(self, query: str, company: str, rag: str):
+        with tracer.span("answer", "swarm", company=company):
+            answer_results = await self.llm.chat_completion_async(
+                system_user_message(self.answer_system, self.answer_user.format(company=company, query=query, rag=rag)), 
+                max_tokens=250, 
+                json_response=True,
+                schema=self.answer_schema
+            )
         return answer_results 
\ No newline at end of file
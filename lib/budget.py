@@ -0,0 +1,129 @@
+import time
+from contextvars import ContextVar
+from lib.metrics import MetricsRegistry, REQUEST_PRICING, current_session, token_cost, metrics as default_metrics
+
+# Per-company guesses used until the first companies finish and live averages take over
+PRIOR_INPUT_TOKENS = 1500
+PRIOR_OUTPUT_TOKENS = 150
+
+# Budget of the work enclosing the current code (e.g. a whole batch): swarm runs started under it
+# are capped to what is left of it
+enclosing_budget: ContextVar["Budget"] = ContextVar("enclosing_budget", default=None)
+
+
+def spend_totals(metrics: MetricsRegistry, **labels) -> dict:
+    """Dollars, Serper searches and LLM tokens recorded in the registry so far, optionally for matching labels only."""
+    return {
+        "dollars": metrics.cost(**labels),
+        "searches": metrics.get("requests_total", provider="serper", **labels),
+        "tokens": metrics.get("input_tokens_total", **labels) + metrics.get("output_tokens_total", **labels),
+    }
+
+
+class Budget:
+    """
+    Spend and time caps for one swarm run.
+
+    Spend is measured from the metrics registry (delta since the budget was created), so every
+    client that reports there counts against it. Before dispatching a company the swarm asks
+    `allows()`, which projects current spend plus the estimated cost of everything in flight and
+    the next company. Once a cap would be exceeded, the remaining companies are skipped and
+    listed in `skipped`, with the cap that ran out in `exhausted`.
+    """
+    def __init__(self,
+                 max_dollars: float = None,
+                 max_searches: int = None,
+                 max_tokens: int = None,
+                 deadline_seconds: float = None,
+                 searches_per_company: int = 1,
+                 model: str = "gpt-4o-mini",
+                 metrics: MetricsRegistry = None):
+        self.max_dollars = max_dollars
+        self.max_searches = max_searches
+        self.max_tokens = max_tokens
+        self.deadline_seconds = deadline_seconds
+        self.searches_per_company = searches_per_company
+        self.model = model
+        self.metrics = metrics or default_metrics
+        # With several sessions sharing the registry, only this session's spend counts
+        self.session = current_session.get()
+        self.started = time.monotonic()
+        self._baseline = self._totals()
+        self.finished = set()
+        self.skipped = []
+        self.exhausted = None
+
+    @classmethod
+    def from_dict(cls, limits: dict, **kwargs):
+        keys = ("max_dollars", "max_searches", "max_tokens", "deadline_seconds")
+        return cls(**{k: limits[k] for k in keys if limits.get(k) is not None}, **kwargs)
+
+    def _totals(self) -> dict:
+        return spend_totals(self.metrics, session=self.session)
+
+    def spent(self) -> dict:
+        totals = self._totals()
+        return {k: totals[k] - self._baseline[k] for k in totals}
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining_seconds(self) -> float:
+        if self.deadline_seconds is None:
+            return None
+        return max(self.deadline_seconds - self.elapsed(), 0.0)
+
+    def remaining(self) -> dict:
+        """What is left of each spend cap that is set, as limits for a nested budget."""
+        spent = self.spent()
+        caps = (("dollars", self.max_dollars), ("searches", self.max_searches), ("tokens", self.max_tokens))
+        return {f"max_{key}": max(limit - spent[key], 0) for key, limit in caps if limit is not None}
+
+    def per_company(self) -> dict:
+        """Estimated spend per company: live average once companies finished, priors before."""
+        if self.finished:
+            spent = self.spent()
+            return {k: v / len(self.finished) for k, v in spent.items()}
+        searches = self.searches_per_company
+        return {
+            "dollars": searches * REQUEST_PRICING["serper"] + token_cost("openai", self.model, PRIOR_INPUT_TOKENS, PRIOR_OUTPUT_TOKENS),
+            "searches": searches,
+            "tokens": PRIOR_INPUT_TOKENS + PRIOR_OUTPUT_TOKENS,
+        }
+
+    def allows(self, in_flight: int = 0) -> bool:
+        """Whether one more company can start without the projected spend breaking a cap."""
+        if self.exhausted:
+            return False
+        if self.deadline_seconds is not None and self.elapsed() >= self.deadline_seconds:
+            self.exhausted = "deadline_seconds"
+            return False
+        spent, estimate = self.spent(), self.per_company()
+        for key, limit in (("dollars", self.max_dollars), ("searches", self.max_searches), ("tokens", self.max_tokens)):
+            if limit is not None and spent[key] + estimate[key] * (in_flight + 1) > limit:
+                self.exhausted = f"max_{key}"
+                return False
+        return True
+
+    def affordable(self, count: int) -> int:
+        """How many of `count` companies fit the spend caps at the current per-company estimate."""
+        spent, estimate = self.spent(), self.per_company()
+        for key, limit in (("dollars", self.max_dollars), ("searches", self.max_searches), ("tokens", self.max_tokens)):
+            if limit is not None and estimate[key] > 0:
+                fits = max(int((limit - spent[key]) // estimate[key]), 0)
+                if fits < count:
+                    count = fits
+                    self.exhausted = f"max_{key}"
+        return count
+
+    def summary(self) -> dict:
+        spent = self.spent()
+        return {
+            "exhausted": self.exhausted,
+            "finished": len(self.finished),
+            "skipped": len(self.skipped),
+            "spent_dollars": round(spent["dollars"], 4),
+            "spent_searches": int(spent["searches"]),
+            "spent_tokens": int(spent["tokens"]),
+            "elapsed_seconds": round(self.elapsed(), 1),
+        }
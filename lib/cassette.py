@@ -0,0 +1,290 @@
+"""
+Record / replay of every outbound API call, for deterministic offline runs.
+
+In record mode the Anthropic, OpenAI, Serper and Firecrawl clients save each response into a
+cassette; in replay mode they are served from it without touching the network, so a whole
+`Agent.run` session can be re-run (and profiled) on a laptop for free. Usage and costs are
+still counted from the replayed responses, so metrics reports match the recorded session.
+
+A cassette is an SQLite file with one zlib-compressed response per row, indexed by a hash of
+the request's method, path, query string and canonical JSON body. Hosts and headers are not
+part of the key (so API keys are never stored, and a session recorded against the mock
+servers replays against the real base URLs); repeated identical requests are replayed in the
+order they were recorded. Set CASSETTE_PATH and CASSETTE_MODE=record|replay in the
+environment to turn it on for every client, and CASSETTE_LATENCY to replay with the recorded
+latencies scaled by that factor (default 0, as fast as possible). The clients still require
+API keys in replay mode; any placeholder will do. Swarm runs already in the run store are
+resumed from it rather than replayed, so benchmark replays against a fresh run store.
+
+While recording, responses pass through to the client as they arrive (streamed model turns
+included) and are saved once read to the end. Replayed responses arrive in one piece after
+their delay, so code fed by a stream (e.g. the search prefetcher) sees each turn all at once.
+The cassette file is opened when the first client using it is created.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlsplit
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+MODES = ("record", "replay")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS interactions (
+    key TEXT,
+    seq INTEGER,
+    provider TEXT,
+    method TEXT,
+    path TEXT,
+    status INTEGER,
+    headers TEXT,
+    body BLOB,
+    latency REAL,
+    recorded_at REAL,
+    PRIMARY KEY (key, seq)
+);
+"""
+
+# Describe the raw transfer rather than the (already decoded) body that is stored
+_DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive", "set-cookie"}
+# Same connection limits as the OpenAI and Anthropic SDKs' default transports
+_LIMITS = httpx.Limits(max_connections=1000, max_keepalive_connections=100)
+
+
+class CassetteMiss(Exception):
+    """A request that isn't in the cassette being replayed."""
+
+
+def _canonical(body) -> bytes:
+    if not body:
+        return b""
+    if isinstance(body, str):
+        body = body.encode()
+    try:
+        return json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode()
+    except ValueError:
+        return body
+
+
+class Cassette:
+    def __init__(self, path: str = None, mode: str = "replay", latency: float = 0.0):
+        """Without a path the cassette is off and clients talk to the network as usual."""
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}; expected one of {', '.join(MODES)}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._played = {}
+        self._recorded = {}
+        self._open_lock = threading.Lock()
+        self._conn = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The cassette database, opened on first use; None when the cassette is off."""
+        if self.path and self._conn is None:
+            with self._open_lock:
+                if self._conn is None:
+                    if self.mode == "replay" and not os.path.exists(self.path):
+                        raise FileNotFoundError(f"No cassette to replay at {self.path}")
+                    os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                    conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("PRAGMA synchronous=NORMAL")
+                    conn.executescript(SCHEMA)
+                    self._conn = conn
+        return self._conn
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.environ.get("CASSETTE_PATH"), os.environ.get("CASSETTE_MODE", "replay"), float(os.environ.get("CASSETTE_LATENCY", 0)))
+
+    @property
+    def recording(self) -> bool:
+        return self.conn is not None and self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.conn is not None and self.mode == "replay"
+
+    @staticmethod
+    def key(method: str, url: str, body=None) -> tuple[str, str]:
+        parts = urlsplit(str(url))
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        digest = hashlib.sha1(f"{method.upper()} {path}\n".encode() + _canonical(body)).hexdigest()
+        return digest, path
+
+    def record(self, provider: str, method: str, url: str, body, status: int, headers, content: bytes, latency: float):
+        key, path = self.key(method, url, body)
+        kept = {k.lower(): v for k, v in dict(headers).items() if k.lower() not in _DROPPED_HEADERS}
+        with self._lock:
+            if key not in self._recorded:
+                row = self.conn.execute("SELECT MAX(seq) FROM interactions WHERE key = ?", (key,)).fetchone()
+                self._recorded[key] = -1 if row[0] is None else row[0]
+            self._recorded[key] += 1
+            self.conn.execute(
+                "INSERT INTO interactions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, self._recorded[key], provider, method.upper(), path, status, json.dumps(kept), zlib.compress(content), latency, time.time()),
+            )
+
+    def play(self, method: str, url: str, body=None) -> dict:
+        """The next recorded response for this request: status, headers, content and the delay to apply."""
+        key, path = self.key(method, url, body)
+        with self._lock:
+            seq = self._played.get(key, 0)
+            row = self.conn.execute(
+                "SELECT status, headers, body, latency FROM interactions WHERE key = ? AND seq <= ? ORDER BY seq DESC LIMIT 1", (key, seq)
+            ).fetchone()
+            if row is None:
+                raise CassetteMiss(f"No recorded response for {method.upper()} {path}")
+            # Requests repeated more often than recorded (e.g. hedges) get the last recording again
+            self._played[key] = seq + 1
+        status, headers, content, latency = row
+        return {"status": status, "headers": json.loads(headers), "content": zlib.decompress(content), "delay": latency * self.latency}
+
+    def stats(self) -> dict:
+        rows = self.conn.execute("SELECT provider, COUNT(*), SUM(LENGTH(body)), SUM(latency) FROM interactions GROUP BY provider").fetchall()
+        return {provider: {"responses": n, "bytes": size, "latency_seconds": round(latency, 3)} for provider, n, size, latency in rows}
+
+    def transport(self, provider: str) -> httpx.BaseTransport:
+        """A transport for the sync httpx clients inside the OpenAI and Anthropic SDKs, or None when off."""
+        if self.conn is None:
+            return None
+        return _Transport(self, provider, httpx.HTTPTransport(limits=_LIMITS))
+
+    def async_transport(self, provider: str) -> httpx.AsyncBaseTransport:
+        if self.conn is None:
+            return None
+        return _AsyncTransport(self, provider, httpx.AsyncHTTPTransport(limits=_LIMITS))
+
+    def session(self, provider: str) -> requests.Session:
+        """A requests session, recording or replaying through the cassette when it is on."""
+        session = requests.Session()
+        if self.conn is not None:
+            adapter = _Adapter(self, provider)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        return session
+
+
+def _passed_headers(response: httpx.Response) -> list:
+    # The body is passed on decoded, so the headers describing the raw transfer no longer apply
+    return [(k, v) for k, v in response.headers.multi_items() if k.lower() not in _DROPPED_HEADERS - {"set-cookie"}]
+
+
+class _RecordingStream(httpx.SyncByteStream):
+    """Passes a live response body through chunk by chunk, and records it once read to the end
+    (a response closed early isn't recorded)."""
+    def __init__(self, response: httpx.Response, record):
+        self.response = response
+        self.record = record
+
+    def __iter__(self):
+        chunks = []
+        for chunk in self.response.iter_bytes():
+            chunks.append(chunk)
+            yield chunk
+        self.record(b"".join(chunks))
+
+    def close(self):
+        self.response.close()
+
+
+class _AsyncRecordingStream(httpx.AsyncByteStream):
+    def __init__(self, response: httpx.Response, record):
+        self.response = response
+        self.record = record
+
+    async def __aiter__(self):
+        chunks = []
+        async for chunk in self.response.aiter_bytes():
+            chunks.append(chunk)
+            yield chunk
+        self.record(b"".join(chunks))
+
+    async def aclose(self):
+        await self.response.aclose()
+
+
+class _Transport(httpx.BaseTransport):
+    def __init__(self, cassette: Cassette, provider: str, inner: httpx.BaseTransport):
+        self.cassette = cassette
+        self.provider = provider
+        self.inner = inner
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        if self.cassette.replaying:
+            played = self.cassette.play(request.method, request.url, body)
+            time.sleep(played["delay"])
+            return httpx.Response(played["status"], headers=played["headers"], content=played["content"], request=request)
+        start = time.perf_counter()
+        response = self.inner.handle_request(request)
+
+        def record(content: bytes):
+            self.cassette.record(self.provider, request.method, request.url, body, response.status_code, response.headers, content, time.perf_counter() - start)
+        return httpx.Response(response.status_code, headers=_passed_headers(response), stream=_RecordingStream(response, record), request=request)
+
+    def close(self):
+        self.inner.close()
+
+
+class _AsyncTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cassette: Cassette, provider: str, inner: httpx.AsyncBaseTransport):
+        self.cassette = cassette
+        self.provider = provider
+        self.inner = inner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        if self.cassette.replaying:
+            played = self.cassette.play(request.method, request.url, body)
+            await asyncio.sleep(played["delay"])
+            return httpx.Response(played["status"], headers=played["headers"], content=played["content"], request=request)
+        start = time.perf_counter()
+        response = await self.inner.handle_async_request(request)
+
+        def record(content: bytes):
+            self.cassette.record(self.provider, request.method, request.url, body, response.status_code, response.headers, content, time.perf_counter() - start)
+        return httpx.Response(response.status_code, headers=_passed_headers(response), stream=_AsyncRecordingStream(response, record), request=request)
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+class _Adapter(HTTPAdapter):
+    def __init__(self, cassette: Cassette, provider: str):
+        super().__init__()
+        self.cassette = cassette
+        self.provider = provider
+
+    def send(self, request, **kwargs):
+        if not self.cassette.replaying:
+            start = time.perf_counter()
+            response = super().send(request, **kwargs)
+            self.cassette.record(self.provider, request.method, request.url, request.body, response.status_code, response.headers, response.content, time.perf_counter() - start)
+            return response
+        played = self.cassette.play(request.method, request.url, request.body)
+        time.sleep(played["delay"])
+        response = requests.Response()
+        response.status_code = played["status"]
+        response.headers = CaseInsensitiveDict(played["headers"])
+        response._content = played["content"]
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers) or "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+
+# Process-wide default, configured from CASSETTE_PATH / CASSETTE_MODE / CASSETTE_LATENCY (nothing is
+# opened until a client uses it)
+cassette = Cassette.from_env()
@@ -0,0 +1,225 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import aiohttp
+import openai
+from lib.metrics import MetricsRegistry, current_session, metrics as default_metrics
+
+# Statuses that mean the provider wants us to slow down
+THROTTLE_STATUSES = ("408", "429")
+THROTTLE_ERRORS = (asyncio.TimeoutError, aiohttp.ServerTimeoutError, openai.APITimeoutError, openai.RateLimitError)
+
+# Throttling statuses seen by the calls of the current tracked_throttles() block
+_throttles: ContextVar[list] = ContextVar("throttles", default=None)
+
+
+def note_throttle(status):
+    """Called by clients for each retryable response, so the tracked call it belongs to (including
+    retries the SDK absorbs) counts as throttled."""
+    throttles = _throttles.get()
+    if throttles is not None and str(status) in THROTTLE_STATUSES:
+        throttles.append(str(status))
+
+
+@contextmanager
+def tracked_throttles():
+    """Collect the throttling statuses clients report for calls made inside the block, and in
+    tasks started from it, into the yielded list. Other calls running at the same time don't count."""
+    throttles = []
+    token = _throttles.set(throttles)
+    try:
+        yield throttles
+    finally:
+        _throttles.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("future", "loop", "session", "queued", "granted")
+
+    def __init__(self, session: str):
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+        self.session = session
+        self.queued = time.monotonic()
+        self.granted = False
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on how many companies a swarm works on at once.
+
+    Every finished request is reported with `observe()`. While latency stays within
+    `latency_tolerance` x the best recent latency and few requests fail, the limit grows by
+    about one per round trip (additive increase). A 429 or a timeout cuts it by `backoff`
+    (multiplicative decrease), at most once per round trip so a burst of throttled responses
+    counts as one signal. The current limit is exported as the `concurrency_limit` gauge and
+    every decision is counted in `concurrency_decisions_total`.
+
+    Waiting requests are tagged with their session (metrics.current_session) and slots are handed
+    out by weighted fair queueing across sessions rather than FIFO: each session gets a share of
+    the slots in proportion to its weight (default 1) while several are waiting, and all of them
+    when it's alone. A session's 20-company swarm therefore isn't stuck behind another's 2,000
+    queued companies. Time spent waiting for a slot is kept per session in the
+    `queue_wait_seconds` histogram and waiting requests in the `queue_depth` gauge.
+
+    One controller can be shared by swarms running on different threads and event loops (see
+    Swarm.for_session), which is how sessions share provider quotas.
+    """
+    def __init__(self,
+                 min_limit: int = 2,
+                 max_limit: int = 200,
+                 initial_limit: int = 10,
+                 backoff: float = 0.5,
+                 latency_tolerance: float = 2.0,
+                 max_error_rate: float = 0.1,
+                 name: str = "swarm",
+                 metrics: MetricsRegistry = None,
+                 weights: dict[str, float] = None):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.max_error_rate = max_error_rate
+        self.name = name
+        self.metrics = metrics or default_metrics
+        self.in_use = 0
+        self.weights = dict(weights or {})
+        self._lock = threading.Lock()
+        self._queues = {}       # session -> its waiters, oldest first
+        self._finish = {}       # session -> virtual finish time of its latest slot
+        self._vtime = 0.0
+        self._latency = None   # smoothed recent latency
+        self._baseline = None  # best recent latency, drifts up slowly so it can recover
+        self._error_rate = 0.0
+        self._last_backoff = 0.0
+        self._publish()
+
+    def _publish(self):
+        self.metrics.set_gauge("concurrency_limit", int(self.limit), limiter=self.name)
+        self.metrics.set_gauge("concurrency_in_use", self.in_use, limiter=self.name)
+
+    def set_weight(self, session: str, weight: float):
+        """Give a session a larger (or smaller) share of the slots while other sessions are waiting."""
+        with self._lock:
+            self.weights[session] = weight
+
+    def _tag(self, session: str) -> float:
+        # A session that has been idle doesn't bank credit: it starts from the current virtual time
+        return max(self._vtime, self._finish.get(session, 0.0))
+
+    def _grant(self, session: str, queued: float):
+        self._vtime = self._tag(session)
+        self._finish[session] = self._vtime + 1.0 / self.weights.get(session, 1.0)
+        for idle in [s for s, finish in self._finish.items() if finish <= self._vtime]:
+            del self._finish[idle]
+        self.in_use += 1
+        self.metrics.observe("queue_wait_seconds", time.monotonic() - queued, limiter=self.name, session=session)
+
+    def _depth(self, session: str):
+        self.metrics.set_gauge("queue_depth", len(self._queues.get(session, ())), limiter=self.name, session=session)
+
+    async def acquire(self):
+        session = current_session.get()
+        with self._lock:
+            if self.in_use < int(self.limit) and not self._queues:
+                self._grant(session, time.monotonic())
+                self._publish()
+                return
+            waiter = _Waiter(session)
+            self._queues.setdefault(session, deque()).append(waiter)
+            self._depth(session)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    # Woken and cancelled at the same time: hand the slot back
+                    self._release()
+                else:
+                    queue = self._queues[session]
+                    queue.remove(waiter)
+                    if not queue:
+                        del self._queues[session]
+                    self._depth(session)
+            raise
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free right now, without queueing for it."""
+        with self._lock:
+            if self.in_use < int(self.limit) and not self._queues:
+                self._grant(current_session.get(), time.monotonic())
+                self._publish()
+                return True
+            return False
+
+    def release(self):
+        with self._lock:
+            self._release()
+
+    def _release(self):
+        self.in_use -= 1
+        self._wake()
+        self._publish()
+
+    def _wake(self):
+        while self._queues and self.in_use < int(self.limit):
+            # The session whose next slot comes first in virtual time
+            session = min(self._queues, key=self._tag)
+            queue = self._queues[session]
+            waiter = queue.popleft()
+            if not queue:
+                del self._queues[session]
+            self._depth(session)
+            self._grant(session, waiter.queued)
+            waiter.granted = True
+            try:
+                # The waiter may be on another thread's event loop
+                waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+            except RuntimeError:
+                # Its loop has closed, so nobody will use the slot
+                self.in_use -= 1
+
+    def observe(self, latency: float, throttled: bool = False, failed: bool = False) -> str:
+        """Feed one request outcome to the controller and return the decision it made."""
+        with self._lock:
+            return self._observe(latency, throttled, failed)
+
+    def _observe(self, latency: float, throttled: bool, failed: bool) -> str:
+        now = time.monotonic()
+        self._error_rate = 0.9 * self._error_rate + 0.1 * (failed or throttled)
+        if not failed and not throttled:
+            self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+            self._baseline = latency if self._baseline is None else min(latency, self._baseline * 1.01)
+
+        if throttled:
+            if now - self._last_backoff < (self._latency or latency):
+                decision = "hold"
+            else:
+                self._last_backoff = now
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                decision = "decrease"
+        elif failed or self._error_rate > self.max_error_rate:
+            decision = "hold"
+        elif self._latency > self.latency_tolerance * self._baseline:
+            # Latency climbing means requests are queueing somewhere; stop growing
+            decision = "hold"
+        elif self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            decision = "increase"
+        else:
+            decision = "hold"
+
+        self.metrics.inc("concurrency_decisions_total", limiter=self.name, decision=decision)
+        self._wake()
+        self._publish()
+        return decision
+
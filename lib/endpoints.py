@@ -0,0 +1,175 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from lib.metrics import MetricsRegistry, metrics as default_metrics
+
+
+class Endpoint:
+    """One API key at one base URL, with the health, load and usage the pool tracks for it."""
+    def __init__(self, api_key: str, base_url: str = None, name: str = None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.name = name or f"...{(api_key or '')[-4:]}@{urlsplit(base_url).netloc if base_url else 'default'}"
+        self.in_flight = 0
+        self.latency = None       # smoothed latency of successful requests
+        self.quota = None         # fraction of the rate limit left, from the last response's headers
+        self.quota_seen = 0.0
+        self.failures = 0         # consecutive
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.searches = 0
+
+    def config(self) -> dict:
+        return {"api_key": self.api_key, "base_url": self.base_url, "name": self.name}
+
+    def __repr__(self):
+        return f"Endpoint({self.name})"
+
+
+class EndpointPool:
+    """
+    Load balancing over several API keys and base URLs (e.g. a second key, or an OpenAI-compatible
+    stand-in server) for one provider.
+
+    Each request goes to the healthy endpoint with the lowest smoothed latency x (requests in
+    flight + 1), divided by the share of its rate limit left according to the last response's
+    x-ratelimit-* headers. Endpoints that haven't answered yet are tried at the best known latency.
+    After `eject_after` consecutive failures (connection errors, timeouts, throttling, 5xx: see
+    `is_failure`) an endpoint is ejected for `eject_seconds`, then gets one request to prove itself.
+    If every endpoint is ejected, the one coming back first is used rather than failing outright.
+
+    Requests, failures and ejections are counted per endpoint in `endpoint_requests_total` and
+    `endpoint_ejections_total`; endpoints are labelled by name (default: last four characters of
+    the key and the host), never by the full key. Names must be unique within a pool.
+    """
+    def __init__(self, provider: str, endpoints: list[Endpoint], is_failure=lambda error: True, eject_after: int = 3, eject_seconds: float = 30.0, quota_ttl: float = 60.0, metrics: MetricsRegistry = None):
+        if not endpoints:
+            raise ValueError(f"No {provider} endpoints configured")
+        names = [e.name for e in endpoints]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            # Metrics and stats are labelled by name, so endpoints sharing one would be merged
+            raise ValueError(f"Duplicate {provider} endpoint names: {', '.join(duplicates)}; give each endpoint a unique \"name\"")
+        self.provider = provider
+        self.endpoints = list(endpoints)
+        self.is_failure = is_failure
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.quota_ttl = quota_ttl
+        self.metrics = metrics or default_metrics
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, provider: str, api_key: str = None, base_url: str = None, endpoints: list[dict] = None, **kwargs):
+        """Endpoints from a list of {"api_key", "base_url", "name"} dicts, else from the JSON list in
+        {PROVIDER}_ENDPOINTS, else the single api_key / base_url."""
+        if endpoints is None and os.environ.get(f"{provider.upper()}_ENDPOINTS"):
+            endpoints = json.loads(os.environ[f"{provider.upper()}_ENDPOINTS"])
+        if endpoints is None:
+            endpoints = [{"api_key": api_key, "base_url": base_url}]
+        return cls(provider, [Endpoint(e.get("api_key") or api_key, e.get("base_url") or base_url, e.get("name")) for e in endpoints], **kwargs)
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    @property
+    def primary(self) -> Endpoint:
+        return self.endpoints[0]
+
+    def config(self) -> list[dict]:
+        """The endpoints as dicts, e.g. to rebuild the pool in a worker process."""
+        return [e.config() for e in self.endpoints]
+
+    def _score(self, endpoint: Endpoint, now: float, default_latency: float) -> float:
+        latency = endpoint.latency if endpoint.latency is not None else default_latency
+        quota = endpoint.quota if endpoint.quota is not None and now - endpoint.quota_seen < self.quota_ttl else 1.0
+        return latency * (endpoint.in_flight + 1) / max(quota, 0.01)
+
+    def pick(self, exclude: list[Endpoint] = ()) -> Endpoint:
+        """Choose an endpoint for the next request and count it as in flight."""
+        with self._lock:
+            now = time.monotonic()
+            candidates = [e for e in self.endpoints if e not in exclude] or self.endpoints
+            healthy = [e for e in candidates if e.ejected_until <= now]
+            if healthy:
+                known = [e.latency for e in healthy if e.latency is not None]
+                default = min(known) if known else 1.0
+                endpoint = min(healthy, key=lambda e: self._score(e, now, default))
+            else:
+                endpoint = min(candidates, key=lambda e: e.ejected_until)
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def finish(self, endpoint: Endpoint, latency: float, error: BaseException = None):
+        """Report how a request picked from the pool went."""
+        failed = error is not None and self.is_failure(error)
+        with self._lock:
+            endpoint.in_flight -= 1
+            if error is None:
+                endpoint.failures = 0
+                endpoint.latency = latency if endpoint.latency is None else 0.8 * endpoint.latency + 0.2 * latency
+            elif failed:
+                endpoint.errors += 1
+                endpoint.failures += 1
+                # Requests that were already in flight when it was ejected don't extend the ejection
+                if endpoint.failures >= self.eject_after and endpoint.ejected_until <= time.monotonic():
+                    endpoint.ejected_until = time.monotonic() + self.eject_seconds
+                    self.metrics.inc("endpoint_ejections_total", provider=self.provider, endpoint=endpoint.name)
+        # Cancelled requests (e.g. the losing half of a hedge) say nothing about the endpoint
+        if error is None or isinstance(error, Exception):
+            self.metrics.inc("endpoint_requests_total", provider=self.provider, endpoint=endpoint.name, outcome="failed" if failed else "ok")
+
+    @contextmanager
+    def use(self, exclude: list[Endpoint] = ()):
+        """Pick an endpoint for the duration of the block, timing it and reporting the outcome."""
+        endpoint = self.pick(exclude)
+        start, error = time.perf_counter(), None
+        try:
+            yield endpoint
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.finish(endpoint, time.perf_counter() - start, error)
+
+    def failover(self, error: Exception, tried: list[Endpoint]) -> bool:
+        """Whether a failed request should be retried on an endpoint it hasn't tried yet."""
+        now = time.monotonic()
+        return self.is_failure(error) and any(e not in tried and e.ejected_until <= now for e in self.endpoints)
+
+    def observe_headers(self, endpoint: Endpoint, headers):
+        """Track the share of the rate limit left from x-ratelimit-remaining-* / x-ratelimit-limit-* headers."""
+        fractions = []
+        for suffix in ("-requests", "-tokens", ""):
+            remaining, limit = headers.get(f"x-ratelimit-remaining{suffix}"), headers.get(f"x-ratelimit-limit{suffix}")
+            try:
+                if remaining is not None and limit and float(limit) > 0:
+                    fractions.append(float(remaining) / float(limit))
+            except ValueError:
+                continue
+        if fractions:
+            with self._lock:
+                endpoint.quota = min(fractions)
+                endpoint.quota_seen = time.monotonic()
+
+    def stats(self) -> list[dict]:
+        now = time.monotonic()
+        return [
+            {
+                "endpoint": e.name,
+                "requests": e.requests,
+                "errors": e.errors,
+                "in_flight": e.in_flight,
+                "latency": None if e.latency is None else round(e.latency, 3),
+                "quota": e.quota,
+                "ejected_seconds": round(max(e.ejected_until - now, 0.0), 1),
+            }
+            for e in self.endpoints
+        ]
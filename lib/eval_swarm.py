@@ -3,10 +3,15 @@
 # Output: company, score, reason
 
 import json
+import time
 from lib.openai_client import OpenAIClient
 from lib.serper_client import SerperClient
 from lib.message_factory import system_user_message
 from lib.swarm import Swarm
+from lib.run_store import RunStore
+from lib.concurrency import AdaptiveConcurrency
+from lib.rag import RagBuilder
+from lib.tracing import tracer
 
 ANSWER_FORMAT = {
     "company": "company name",
@@ -27,6 +32,39 @@ ANSWER_FORMAT = {
     "reason": "short reason for the score",
 }
 
+_SCORE = {"type": "integer", "minimum": 0, "maximum": 100}
+# Strict structured output schemas for the formats above and below (see lib.structured)
+EVAL_SCHEMA = {
+    "title": "evaluation",
+    "type": "object",
+    "properties": {
+        "company": {"type": "string"},
+        "query": {"type": "string"},
+        "crieria_decomposition": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"criteria": {"type": "string"}, "score": _SCORE, "reason": {"type": "string"}},
+            },
+        },
+        "final_score": _SCORE,
+        "reason": {"type": "string"},
+    },
+}
+PACKED_EVAL_SCHEMA = {"title": "packed_evaluation", "type": "object", "properties": {"results": {"type": "array", "items": EVAL_SCHEMA}}}
+CRITERION_SCHEMA = {"title": "criterion", "type": "object", "properties": {"score": _SCORE, "reason": {"type": "string"}}}
+DECOMPOSE_SCHEMA = {
+    "title": "decomposition",
+    "type": "object",
+    "properties": {
+        "operator": {"type": "string", "enum": ["and", "or"]},
+        "criteria": {
+            "type": "array",
+            "items": {"type": "object", "properties": {"criteria": {"type": "string"}, "searches": {"type": "array", "items": {"type": "string"}}}},
+        },
+    },
+}
+
 DEFAULT_EVAL_SYSTEM = f"""Your job is to evaluate whether the company meets the condition(s) in the query.
 You will be given a company name, a query, and a list of search results.
 You will need to evaluate whether the company meets the condition by returning a score between 0 and 100, and a short reason for the score.
@@ -46,32 +84,224 @@ Answer the query based on the search results and your own knowledge.
 
 Answer:"""
 
+DEFAULT_PACKED_EVAL_USER = """Company: {company}
+Search results: {rag}
+
+Evaluate the company against each of these queries separately:
+{queries}
+
+Return one answer per query, in the same order, as {{"results": [answer, ...]}} where each answer uses the JSON format above.
+
+Answer:"""
+
+DEFAULT_DECOMPOSE_SYSTEM = """Your job is to split a company screening query into the individual criteria a company must meet.
+Say whether the criteria combine with "and" (every criterion must hold) or "or" (any one is enough).
+Each criterion should be a short self-contained condition, phrased the same way whenever it means the same thing.
+For each criterion, list which of the given searches are relevant to it, copied exactly.
+Your answer should be in the following JSON format:
+{"operator": "and", "criteria": [{"criteria": "criterion", "searches": ["search", "..."]}]}
+"""
+
+DEFAULT_DECOMPOSE_USER = """Query: {query}
+Searches: {searches}
+
+Answer:"""
+
+DEFAULT_CRITERION_SYSTEM = """Your job is to evaluate whether the company meets a single criterion.
+You will be given a company name, the criterion, and a list of search results.
+Return a score between 0 and 100 and a short reason for the score. If the criterion is clearly not met, the score should be 0.
+Don't over index on the search results, use your own knowledge as well.
+Reasoning should be concise as possible and data dense; 10-20 words.
+Your answer should be in the following JSON format:
+{"score": "score between 0 and 100", "reason": "short reason for the score"}
+"""
+
+DEFAULT_CRITERION_USER = """Company: {company}
+Criterion: {criterion}
+Search results: {rag}
+
+Answer:"""
+
 class EvalSwarm(Swarm):
     def __init__(self, 
                  llm: OpenAIClient, serper: SerperClient, 
                  eval_system: str = DEFAULT_EVAL_SYSTEM,
                  eval_user: str = DEFAULT_EVAL_USER,
+                 eval_schema: dict = EVAL_SCHEMA,
                  max_workers: int = 50,
-                 requests_per_second: int = 50
+                 requests_per_second: int = 50,
+                 run_store: RunStore = None,
+                 concurrency: AdaptiveConcurrency = None,
+                 llm_requests_per_second: int = None,
+                 pipeline: bool = True,
+                 per_criterion: bool = False,
+                 model: str = "gpt-4o-mini",
+                 max_tokens: int = 250,
+                 rag_builder: RagBuilder = None,
+                 criterion_ttl: float = 24 * 3600,
+                 deadline_seconds: float = None,
+                 subscribers: list = None
                  ):
-        super().__init__(llm, serper, max_workers, requests_per_second)
+        """With per_criterion, research() decomposes the query into criteria once and scores each
+        (company, criterion) separately: scores are cached for criterion_ttl seconds for reuse by
+        later queries sharing a criterion and its searches, and a company stops being evaluated
+        once a failing AND criterion settles it.
+        model and max_tokens apply to every evaluation call (max_tokens per query when packed).
+        eval_schema is the structured output schema for eval_system's answer format; pass None
+        with a prompt asking for another format to get plain JSON mode."""
+        super().__init__(llm, serper, max_workers, requests_per_second, run_store, concurrency, llm_requests_per_second, pipeline,
+                         rag_builder=rag_builder, deadline_seconds=deadline_seconds, subscribers=subscribers)
         self.eval_system = eval_system
         self.eval_user = eval_user
+        self.eval_schema = eval_schema
+        self.model = model
+        self.max_tokens = max_tokens
+        self.per_criterion = per_criterion
+        self.criterion_ttl = criterion_ttl
+        self._decompositions = {}
+        self._criterion_cache = {}   # (company, criterion key) -> (result, evaluated at)
 
-    async def query(self, query: str, company: str, searches: list[str]) -> str:
-        rag = ""
-        for search in searches:
-            search_query = search.format(company=company)
-            search_results = await self.serper.search_async(search_query)
-            rag += f"{search_query}\n{search_results}\n\n"
-        eval_results = await self.llm.chat_completion_async(
-            system_user_message(self.eval_system, self.eval_user.format(company=company, query=query, rag=rag)), 
-            max_tokens=250, 
-            json_response=True
-        )
+    async def evaluate(self, query: str, company: str, rag: str):
+        with tracer.span("eval", "swarm", company=company):
+            eval_results = await self.llm.chat_completion_async(
+                system_user_message(self.eval_system, self.eval_user.format(company=company, query=query, rag=rag)), 
+                model=self.model,
+                max_tokens=self.max_tokens, 
+                json_response=True,
+                schema=self.eval_schema
+            )
         eval_results['final_score'] = int(eval_results['final_score'])
-        print(".", end="", flush=True)
         return eval_results
 
+    async def research(self, query: str, companies: list[str], searches: list[str], run_id: str = None, budget=None, priorities: dict[str, float] = None) -> list:
+        if not self.per_criterion:
+            return await super().research(query, companies, searches, run_id, budget, priorities)
+        plan = await self.decompose(query, searches)
+        # Criteria are fetched and scored one at a time, so this runs as single-stage workers
+        stages = (None, None, lambda company: self.evaluate_criteria(query, company, plan))
+        results = await self._checkpointed(query, companies, searches, stages, False, run_id, budget, priorities)
+        return [result for _, result in results]
+
+    async def decompose(self, query: str, searches: list[str]) -> dict:
+        """Split the query into criteria, each with the searches relevant to it. Done once per (query, searches)."""
+        key = (query, tuple(searches))
+        if key not in self._decompositions:
+            try:
+                with tracer.span("decompose", "swarm"):
+                    response = await self.llm.chat_completion_async(
+                        system_user_message(DEFAULT_DECOMPOSE_SYSTEM, DEFAULT_DECOMPOSE_USER.format(query=query, searches=json.dumps(searches))),
+                        model=self.model,
+                        max_tokens=500,
+                        json_response=True,
+                        schema=DECOMPOSE_SCHEMA
+                    )
+            except Exception as e:
+                # Not worth failing every company over: score the query as a single criterion (not cached, so the next run tries again)
+                self.metrics.inc("errors_total", operation="decompose", error=type(e).__name__)
+                return {"operator": "and", "criteria": [{"criteria": query, "searches": searches}]}
+            criteria = []
+            for criterion in response.get("criteria") or []:
+                text = str(criterion.get("criteria", "")).strip()
+                if text:
+                    relevant = [s for s in criterion.get("searches") or [] if s in searches]
+                    criteria.append({"criteria": text, "searches": relevant or searches})
+            if not criteria:
+                # Nothing usable came back: treat the whole query as one criterion
+                criteria = [{"criteria": query, "searches": searches}]
+            operator = "or" if str(response.get("operator", "and")).lower() == "or" else "and"
+            self._decompositions[key] = {"operator": operator, "criteria": criteria}
+        return self._decompositions[key]
+
+    @staticmethod
+    def _criterion_key(criterion: dict) -> tuple[str, str]:
+        """A criterion is only the same evaluation when it was scored from the same searches."""
+        return criterion["criteria"].lower(), json.dumps(sorted(criterion["searches"]))
+
+    def _cached_criteria(self, company: str, criteria: list[dict]) -> dict:
+        now = time.time()
+        cached = {}
+        for c in criteria:
+            entry = self._criterion_cache.get((company, self._criterion_key(c)))
+            if entry is not None and now - entry[1] < self.criterion_ttl:
+                cached[c["criteria"]] = entry[0]
+        missing = [c for c in criteria if c["criteria"] not in cached]
+        if missing and self.run_store is not None:
+            stored = self.run_store.criterion_scores(company, [self._criterion_key(c) for c in missing], max_age=self.criterion_ttl)
+            for c in missing:
+                key = self._criterion_key(c)
+                if key in stored:
+                    cached[c["criteria"]] = stored[key]
+                    self._criterion_cache[(company, key)] = (stored[key], now)
+        for c in criteria:
+            self.metrics.inc("cache_requests_total", cache="criterion", result="hit" if c["criteria"] in cached else "miss")
+        return cached
+
+    async def evaluate_criterion(self, company: str, criterion: dict, rag: str) -> dict:
+        text = criterion["criteria"]
+        with tracer.span("criterion", "swarm", company=company, criterion=text):
+            response = await self.llm.chat_completion_async(
+                system_user_message(DEFAULT_CRITERION_SYSTEM, DEFAULT_CRITERION_USER.format(company=company, criterion=text, rag=rag)),
+                model=self.model,
+                max_tokens=150,
+                json_response=True,
+                schema=CRITERION_SCHEMA
+            )
+        result = {"score": int(response.get("score", response.get("final_score", 0))), "reason": response.get("reason", "")}
+        key = self._criterion_key(criterion)
+        self._criterion_cache[(company, key)] = (result, time.time())
+        if self.run_store is not None:
+            self.run_store.record_criterion(company, *key, result["score"], result["reason"])
+        return result
+
+    async def evaluate_criteria(self, query: str, company: str, plan: dict) -> dict:
+        """Score a company criterion by criterion, stopping once the final score is settled."""
+        operator, criteria = plan["operator"], plan["criteria"]
+        cached = self._cached_criteria(company, criteria)
+        # Cached criteria cost nothing and may settle the score on their own; then cheapest first
+        ordered = sorted(criteria, key=lambda c: (c["criteria"] not in cached, len(c["searches"])))
+        settled_at = 0 if operator == "and" else 100
+
+        search_results, decomposition = {}, []
+        for criterion in ordered:
+            text = criterion["criteria"]
+            result = cached.get(text)
+            if result is None:
+                missing = [s for s in criterion["searches"] if s not in search_results]
+                if missing:
+                    search_results.update(await self.search(company, missing))
+                result = await self.evaluate_criterion(company, criterion, self.rag(company, criterion["searches"], search_results, text))
+            decomposition.append({"criteria": text, "score": result["score"], "reason": result["reason"]})
+            if result["score"] == settled_at:
+                break
+
+        pick = min if operator == "and" else max
+        deciding = pick(decomposition, key=lambda c: c["score"])
+        return {
+            "company": company,
+            "query": query,
+            "crieria_decomposition": decomposition,
+            "final_score": deciding["score"],
+            "reason": deciding["reason"],
+            "unevaluated_criteria": [c["criteria"] for c in ordered[len(decomposition):]],
+        }
+
+    async def evaluate_packed(self, queries: list[str], company: str, rag: str) -> list:
+        """Evaluate every query in one LLM call over the shared search results."""
+        numbered = "\n".join(f"{i + 1}. {query}" for i, query in enumerate(queries))
+        with tracer.span("eval_packed", "swarm", company=company, queries=len(queries)):
+            response = await self.llm.chat_completion_async(
+                system_user_message(self.eval_system, DEFAULT_PACKED_EVAL_USER.format(company=company, rag=rag, queries=numbered)),
+                model=self.model,
+                max_tokens=self.max_tokens * len(queries),
+                json_response=True,
+                schema=None if self.eval_schema is None else PACKED_EVAL_SCHEMA
+            )
+        answers = response.get("results", [])
+        if len(answers) != len(queries):
+            raise ValueError(f"Expected {len(queries)} packed answers, got {len(answers)}")
+        for answer in answers:
+            answer['final_score'] = int(answer['final_score'])
+        return answers
+
 
 
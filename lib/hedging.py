@@ -0,0 +1,70 @@
+import asyncio
+import time
+from lib.metrics import MetricsRegistry, metrics as default_metrics
+
+
+class Hedger:
+    """
+    Hedged requests for tail latency.
+
+    `run(key, fn, *args)` starts `fn(*args)`; if it hasn't finished after the observed
+    `quantile` (p95 by default) of earlier calls with the same key, an identical second request
+    is started and whichever succeeds first wins. The other one is cancelled. A request that
+    fails doesn't fire a hedge (that would be a retry), but if the hedge is already running it
+    gets to finish. Hedges are capped at `max_rate` of all calls so a provider that is slow
+    across the board isn't sent twice the load.
+
+    Latencies are kept in the `hedged_call_latency` histogram and hedges are counted in
+    `hedged_requests_total` with outcome fired / won / lost.
+    """
+    def __init__(self, name: str, quantile: float = 0.95, min_samples: int = 20, min_delay: float = 0.05, max_rate: float = 0.1, enabled: bool = True, metrics: MetricsRegistry = None):
+        self.name = name
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_rate = max_rate
+        self.enabled = enabled
+        self.metrics = metrics or default_metrics
+        self.calls = 0
+        self.hedges = 0
+
+    def delay(self, key: str) -> float:
+        """How long to wait before hedging a call, or None while there is too little history or too many hedges."""
+        if not self.enabled or self.hedges >= self.max_rate * max(self.calls, 1):
+            return None
+        histogram = self.metrics.histogram("hedged_call_latency", client=self.name, call=key)
+        if histogram is None or histogram.count < self.min_samples:
+            return None
+        return max(self.min_delay, histogram.quantile(self.quantile))
+
+    async def run(self, key: str, fn, *args):
+        self.calls += 1
+        start = time.perf_counter()
+        delay = self.delay(key)
+        primary = asyncio.ensure_future(fn(*args))
+        pending = {primary}
+        hedged, error = False, None
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                if not done:
+                    self.hedges += 1
+                    hedged = True
+                    self.metrics.inc("hedged_requests_total", client=self.name, call=key, outcome="fired")
+                    pending.add(asyncio.ensure_future(fn(*args)))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if hedged:
+                            self.metrics.inc("hedged_requests_total", client=self.name, call=key, outcome="won" if task is not primary else "lost")
+                        # Time since the first request went out: a lower bound on the primary's latency when the hedge won
+                        self.metrics.observe("hedged_call_latency", time.perf_counter() - start, client=self.name, call=key)
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,264 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# USD per million tokens as (input, output); "default" covers models not listed
+TOKEN_PRICING = {
+    "anthropic": {
+        "claude-3-7-sonnet-20250219": (3.0, 15.0),
+        "claude-3-5-haiku-20241022": (0.80, 4.00),
+        "default": (3.0, 15.0),
+    },
+    "openai": {
+        "gpt-4o-mini": (0.30, 1.20),
+        "gpt-4o": (2.50, 10.00),
+        "gpt-4.1": (2.00, 8.00),
+        "gpt-4.1-mini": (0.40, 1.60),
+        "gpt-4.1-nano": (0.10, 0.40),
+        "default": (0.30, 1.20),
+    },
+}
+# USD per request
+REQUEST_PRICING = {
+    "serper": 0.3 / 1000,
+    "firecrawl": 0.0,
+}
+
+# Counters that make up spend, carried between registries by usage() and merge_usage()
+USAGE_COUNTERS = ("input_tokens_total", "output_tokens_total", "requests_total", "cost_usd_total")
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Name of the agent tool currently executing, so provider usage can be attributed to it
+current_tool: ContextVar[str] = ContextVar("current_tool", default="")
+# Research session the current code runs for, so concurrent sessions can be costed separately
+current_session: ContextVar[str] = ContextVar("current_session", default="")
+
+
+def token_cost(provider: str, model: str, input_tokens: int, output_tokens: int) -> float:
+    prices = TOKEN_PRICING.get(provider, {})
+    input_cpm, output_cpm = prices.get(model, prices.get("default", (0.0, 0.0)))
+    return (input_tokens * input_cpm + output_tokens * output_cpm) / 1000000
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None and v != ""))
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by linear interpolation inside the matching bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, count in enumerate(self.counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.max
+            if seen + count >= rank and count:
+                return min(lower + (upper - lower) * (rank - seen) / count, self.max)
+            seen += count
+            lower = upper
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+            "p50": round(self.quantile(0.50), 6),
+            "p95": round(self.quantile(0.95), 6),
+            "p99": round(self.quantile(0.99), 6),
+            "max": round(self.max, 6),
+        }
+
+
+class MetricsRegistry:
+    """
+    Thread-safe registry of counters, gauges and latency histograms shared by every client.
+
+    Series are identified by a metric name plus keyword labels (provider, model, tool, ...).
+    `snapshot()` returns everything as a JSON-serializable dict and `to_prometheus()` renders
+    the Prometheus text exposition format.
+    """
+    def __init__(self, namespace: str = "deep_research"):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            key = _key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self.gauges.setdefault(name, {})[_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            key = _key(labels)
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def get(self, name: str, **labels) -> float:
+        """Sum of a counter over every series matching the given labels."""
+        wanted = set(_key(labels))
+        with self._lock:
+            return sum(v for k, v in self.counters.get(name, {}).items() if wanted <= set(k))
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        with self._lock:
+            return self.histograms.get(name, {}).get(_key(labels))
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Record the latency of the block, and count it as an error if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            self.inc("errors_total", operation=name, error=type(e).__name__, **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def record_tokens(self, provider: str, model: str, input_tokens: int, output_tokens: int):
+        tool, session = current_tool.get(), current_session.get()
+        self.inc("input_tokens_total", input_tokens, provider=provider, model=model, tool=tool, session=session)
+        self.inc("output_tokens_total", output_tokens, provider=provider, model=model, tool=tool, session=session)
+        self.inc("cost_usd_total", token_cost(provider, model, input_tokens, output_tokens), provider=provider, model=model, tool=tool, session=session)
+
+    def record_request(self, provider: str, endpoint: str = "", requests: int = 1):
+        tool, session = current_tool.get(), current_session.get()
+        self.inc("requests_total", requests, provider=provider, endpoint=endpoint, tool=tool, session=session)
+        self.inc("cost_usd_total", requests * REQUEST_PRICING.get(provider, 0.0), provider=provider, tool=tool, session=session)
+
+    def cost(self, **labels) -> float:
+        return self.get("cost_usd_total", **labels)
+
+    def usage(self, clear: bool = False, **labels) -> list[dict]:
+        """Token, request and cost series matching the labels, e.g. for merge_usage() in another
+        process's registry. With clear, the series are removed from this registry."""
+        wanted = set(_key(labels))
+        series = []
+        with self._lock:
+            for name in USAGE_COUNTERS:
+                values = self.counters.get(name, {})
+                for key in [k for k in values if wanted <= set(k)]:
+                    series.append({"name": name, "labels": dict(key), "value": values.pop(key) if clear else values[key]})
+        return series
+
+    def merge_usage(self, series: list[dict]):
+        """Add usage() series recorded elsewhere, attributed to the current tool and session."""
+        context = {"tool": current_tool.get(), "session": current_session.get()}
+        for s in series:
+            self.inc(s["name"], s["value"], **{**s["labels"], **context})
+
+    def snapshot(self) -> dict:
+        def series(values, render=lambda v: v):
+            return [{"labels": dict(k), "value": render(v)} for k, v in values.items()]
+
+        with self._lock:
+            return {
+                "timestamp": time.time(),
+                "counters": {name: series(values) for name, values in self.counters.items()},
+                "gauges": {name: series(values) for name, values in self.gauges.items()},
+                "histograms": {name: series(values, Histogram.to_dict) for name, values in self.histograms.items()},
+            }
+
+    def to_json(self, indent: int = 2) -> str:
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def to_prometheus(self) -> str:
+        def fmt(labels, extra=()):
+            pairs = [*labels, *extra]
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            for name, values in sorted(self.counters.items()):
+                metric = f"{self.namespace}_{name}"
+                lines.append(f"# TYPE {metric} counter")
+                lines.extend(f"{metric}{fmt(k)} {v}" for k, v in values.items())
+            for name, values in sorted(self.gauges.items()):
+                metric = f"{self.namespace}_{name}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.extend(f"{metric}{fmt(k)} {v}" for k, v in values.items())
+            for name, values in sorted(self.histograms.items()):
+                metric = f"{self.namespace}_{name}" if name.endswith("_seconds") else f"{self.namespace}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for k, h in values.items():
+                    cumulative = 0
+                    for bound, count in zip([*h.buckets, "+Inf"], h.counts):
+                        cumulative += count
+                        lines.append(f"{metric}_bucket{fmt(k, [('le', bound)])} {cumulative}")
+                    lines.append(f"{metric}_sum{fmt(k)} {h.sum}")
+                    lines.append(f"{metric}_count{fmt(k)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def report(self) -> str:
+        """Human readable cost and latency summary, grouped by provider and tool."""
+        lines = ["Costs:"]
+        providers = sorted({dict(k).get("provider", "") for k in self.counters.get("cost_usd_total", {})})
+        for provider in providers:
+            lines.append(f"  {provider}: ${round(self.cost(provider=provider), 4)}")
+        tools = sorted({dict(k).get("tool", "") for k in self.counters.get("cost_usd_total", {})} - {""})
+        for tool in tools:
+            lines.append(f"  tool {tool}: ${round(self.cost(tool=tool), 4)}")
+        lines.append(f"  total: ${round(self.cost(), 4)}")
+        schemas = sorted({dict(k).get("schema", "") for k in self.counters.get("structured_outputs_total", {})})
+        if schemas:
+            lines.append("Structured outputs:")
+        for schema in schemas:
+            counts = {o: self.get("structured_outputs_total", schema=schema, outcome=o) for o in ("valid", "repaired", "retried", "lost")}
+            total = sum(counts.values())
+            lines.append(f"  {schema}: n={int(total)} repaired={int(counts['repaired'])} retried={int(counts['retried'])} lost={int(counts['lost'])} ({counts['lost'] / total:.1%})")
+        lines.append("Latency:")
+        with self._lock:
+            for name, values in sorted(self.histograms.items()):
+                for k, h in values.items():
+                    label = ",".join(f"{a}={b}" for a, b in k)
+                    lines.append(f"  {name}[{label}]: n={h.count} p50={h.quantile(0.5):.2f}s p95={h.quantile(0.95):.2f}s max={h.max:.2f}s")
+        return "\n".join(lines)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+
+# Process-wide default registry
+metrics = MetricsRegistry()
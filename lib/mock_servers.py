@@ -0,0 +1,274 @@
+"""
+Local stand-ins for the Serper, OpenAI, Anthropic and Firecrawl HTTP APIs.
+
+The server runs in a separate process so that its CPU use doesn't skew client-side
+measurements. Every provider is served from one port under its usual path:
+
+    Serper      POST {url}/search
+    OpenAI      POST {url}/v1/chat/completions
+    Anthropic   POST {url}/v1/messages (streamed as server-sent events with "stream": true)
+    Firecrawl   POST {url}/v0/scrape
+
+Each provider has its own latency distribution (lognormal around a median), random error
+rate and requests-per-second cap above which it answers 429. OpenAI answers can also be made
+malformed JSON at a given rate. GET {url}/__stats returns
+request, status and connection counts.
+"""
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import random
+import re
+import socket
+import time
+import urllib.request
+from collections import deque
+from aiohttp import web
+
+DEFAULT_CONFIG = {
+    "serper": {"median_latency": 0.4, "sigma": 0.4, "error_rate": 0.0, "rate_limit_rps": None},
+    "openai": {"median_latency": 1.2, "sigma": 0.5, "error_rate": 0.0, "rate_limit_rps": None, "malformed_rate": 0.0},
+    "anthropic": {"median_latency": 3.0, "sigma": 0.5, "error_rate": 0.0, "rate_limit_rps": None},
+    "firecrawl": {"median_latency": 1.0, "sigma": 0.5, "error_rate": 0.0, "rate_limit_rps": None},
+}
+
+
+def _score(text: str) -> int:
+    """Deterministic pseudo score so repeated runs see the same answers."""
+    return int(hashlib.md5(text.encode()).hexdigest(), 16) % 101
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _malform(content: str, rng: random.Random) -> str:
+    """The kinds of broken JSON models return: fenced, wrapped in prose, scores as text, cut off, or none at all."""
+    kind = rng.choice(["fenced", "prose", "text_score", "truncated", "refusal"])
+    if kind == "fenced":
+        return f"```json\n{content}\n```"
+    if kind == "prose":
+        return f"Here is the evaluation: {content} Let me know if you need more."
+    if kind == "text_score":
+        return re.sub(r'"final_score": (\d+)', r'"final_score": "\1/100"', content)
+    if kind == "truncated":
+        return content[:int(len(content) * 0.8)]
+    return "I'm unable to evaluate this company."
+
+
+class _Provider:
+    def __init__(self, name: str, config: dict, rng: random.Random):
+        self.name = name
+        self.config = config
+        self.rng = rng
+        self.window = deque()
+
+    def latency(self) -> float:
+        median = self.config.get("median_latency", 0.0)
+        if median <= 0:
+            return 0.0
+        return self.rng.lognormvariate(0, self.config.get("sigma", 0.0)) * median
+
+    def rate_limited(self) -> bool:
+        rps = self.config.get("rate_limit_rps")
+        if not rps:
+            return False
+        now = time.monotonic()
+        while self.window and now - self.window[0] > 1.0:
+            self.window.popleft()
+        if len(self.window) >= rps:
+            return True
+        self.window.append(now)
+        return False
+
+
+class MockApp:
+    def __init__(self, config: dict = None, seed: int = 0):
+        self.config = {name: {**defaults, **(config or {}).get(name, {})} for name, defaults in DEFAULT_CONFIG.items()}
+        rng = random.Random(seed)
+        self.providers = {name: _Provider(name, cfg, rng) for name, cfg in self.config.items()}
+        self.runner = None
+        self.reset()
+
+    def reset(self):
+        self.stats = {"requests": {}, "statuses": {}, "peak_connections": 0, "connections_seen": set()}
+
+    def build(self) -> web.Application:
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/search", self._wrap("serper", self.serper))
+        app.router.add_post("/v1/chat/completions", self._wrap("openai", self.openai))
+        app.router.add_post("/v1/messages", self._wrap("anthropic", self.anthropic))
+        app.router.add_post("/v0/scrape", self._wrap("firecrawl", self.firecrawl))
+        app.router.add_get("/__stats", self.get_stats)
+        app.router.add_post("/__reset", self.post_reset)
+        return app
+
+    def _wrap(self, name: str, handler):
+        provider = self.providers[name]
+
+        async def wrapped(request: web.Request):
+            self.stats["requests"][name] = self.stats["requests"].get(name, 0) + 1
+            self.stats["connections_seen"].add(id(request.protocol))
+            self.stats["peak_connections"] = max(self.stats["peak_connections"], len(self.runner.server.connections))
+            body = await request.json()
+            await asyncio.sleep(provider.latency())
+            if provider.rate_limited():
+                response = web.json_response({"error": {"message": "Rate limit exceeded", "type": "rate_limit_error"}}, status=429, headers={"retry-after": "1"})
+            elif provider.rng.random() < provider.config.get("error_rate", 0.0):
+                response = web.json_response({"error": {"message": "Internal error", "type": "api_error"}}, status=500)
+            elif name == "anthropic" and isinstance(body, dict) and body.get("stream"):
+                response = await self.anthropic_stream(request, handler(body))
+            else:
+                response = web.json_response(handler(body))
+            key = f"{name}:{response.status}"
+            self.stats["statuses"][key] = self.stats["statuses"].get(key, 0) + 1
+            return response
+        return wrapped
+
+    def serper(self, body):
+        def results(query):
+            return {
+                "searchParameters": {"q": query},
+                "organic": [
+                    {"title": f"{query} - result {i}", "link": f"https://example.com/{_score(query + str(i))}", "snippet": f"Snippet {i} about {query}. Score hint {_score(query + str(i))}."}
+                    for i in range(10)
+                ],
+            }
+        # Serper accepts a list body for batched queries and answers with a list
+        if isinstance(body, list):
+            return [results(item.get("q", "")) for item in body]
+        return results(body.get("q", ""))
+
+    def openai(self, body):
+        prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+        score = _score(prompt)
+        answer = {"company": "", "query": "", "crieria_decomposition": [], "final_score": score, "reason": "Mock evaluation", "answer": "Mock answer", "confidence": score}
+        if '{"results": [' in prompt:
+            # Packed evaluation: one answer per numbered query
+            queries = re.findall(r"^\d+\. (.*)$", prompt, re.MULTILINE)
+            content = json.dumps({"results": [dict(answer, query=q, final_score=_score(prompt + q)) for q in queries]})
+        else:
+            content = json.dumps(answer)
+        provider = self.providers["openai"]
+        if provider.rng.random() < provider.config.get("malformed_rate", 0.0):
+            content = _malform(content, provider.rng)
+        return {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": _tokens(prompt), "completion_tokens": _tokens(content), "total_tokens": _tokens(prompt) + _tokens(content)},
+        }
+
+    def anthropic(self, body):
+        prompt = json.dumps(body.get("messages", []))
+        text = "Mock answer."
+        return {
+            "id": "msg_mock",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", "mock"),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": _tokens(prompt), "output_tokens": _tokens(text)},
+        }
+
+    async def anthropic_stream(self, request: web.Request, message: dict) -> web.StreamResponse:
+        """Send a message as Anthropic's server-sent events, its text a few words per delta."""
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+
+        async def send(event: str, data: dict):
+            await response.write(f"event: {event}\ndata: {json.dumps({'type': event, **data})}\n\n".encode())
+
+        await send("message_start", {"message": {**message, "content": [], "stop_reason": None, "usage": {**message["usage"], "output_tokens": 0}}})
+        for index, block in enumerate(message["content"]):
+            await send("content_block_start", {"index": index, "content_block": {"type": "text", "text": ""}})
+            words = re.findall(r"\S+\s*", block["text"])
+            for i in range(0, len(words), 3):
+                await send("content_block_delta", {"index": index, "delta": {"type": "text_delta", "text": "".join(words[i:i + 3])}})
+            await send("content_block_stop", {"index": index})
+        await send("message_delta", {"delta": {"stop_reason": message["stop_reason"], "stop_sequence": None}, "usage": {"output_tokens": message["usage"]["output_tokens"]}})
+        await send("message_stop", {})
+        await response.write_eof()
+        return response
+
+    def firecrawl(self, body):
+        url = body.get("url", "")
+        return {"success": True, "data": {"markdown": f"# {url}\n\nMock page content.", "metadata": {"title": url, "sourceURL": url}}}
+
+    async def get_stats(self, request):
+        stats = {**self.stats, "connections_seen": len(self.stats["connections_seen"]), "open_connections": len(self.runner.server.connections)}
+        return web.json_response(stats)
+
+    async def post_reset(self, request):
+        self.reset()
+        return web.json_response({"ok": True})
+
+    async def serve(self, port: int, ready=None):
+        self.runner = web.AppRunner(self.build(), access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", port, backlog=4096).start()
+        if ready is not None:
+            ready.set()
+        await asyncio.Event().wait()
+
+
+def _serve(config, seed, port, ready):
+    asyncio.run(MockApp(config, seed).serve(port, ready))
+
+
+class MockServers:
+    """Start the stand-in APIs in a subprocess: `with MockServers(config) as servers: ...`."""
+    def __init__(self, config: dict = None, seed: int = 0, port: int = None):
+        self.config = config
+        self.seed = seed
+        self.port = port
+        self.process = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def openai_base_url(self) -> str:
+        return f"{self.url}/v1"
+
+    @property
+    def firecrawl_base_url(self) -> str:
+        return f"{self.url}/v0"
+
+    def start(self):
+        if self.port is None:
+            with socket.socket() as s:
+                s.bind(("127.0.0.1", 0))
+                self.port = s.getsockname()[1]
+        ready = multiprocessing.Event()
+        self.process = multiprocessing.Process(target=_serve, args=(self.config, self.seed, self.port, ready), daemon=True)
+        self.process.start()
+        if not ready.wait(10):
+            self.stop()
+            raise RuntimeError("Mock servers failed to start")
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+    def stats(self) -> dict:
+        with urllib.request.urlopen(f"{self.url}/__stats") as response:
+            return json.loads(response.read())
+
+    def reset(self):
+        urllib.request.urlopen(urllib.request.Request(f"{self.url}/__reset", method="POST")).read()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,72 @@
+import re
+
+FAST_MODEL = "claude-3-5-haiku-20241022"
+# Tools whose results need little more than a confirmation or a short summary
+SIMPLE_TOOLS = ("get_portfolio", "update_portfolio", "remove_companies", "weight_by", "portfolio_analytics")
+
+_PORTFOLIO_WORDS = re.compile(r"\b(portfolio|weights?|reweight|rebalance|holdings?|positions?|add|remove|drop|equal[- ]weight|drawdown|volatility|returns?|backtest|sharpe)\b", re.I)
+_RESEARCH_WORDS = re.compile(r"\b(find|research|search|screen|identify|look up|news|compare|analy[sz]e|investigate|companies (that|with|who|which)|which companies)\b", re.I)
+
+
+class ModelRouter:
+    """
+    Cascade routing of Agent turns between a fast, cheap model and the primary model.
+
+    A turn goes to `fast_model` when the last message is a short portfolio request with no research
+    in it, or the results of simple tools (portfolio edits and analytics by default). Everything
+    else goes to the primary model: the first turn of a research query (planning), turns after
+    research tools or tool errors, and the forced final answer (synthesis).
+
+    The fast model's reply is kept only if it calls simple tools, or answers directly in a run
+    that hasn't used any other tool. Otherwise the turn is escalated and re-run on the primary
+    model, which happens when the fast model reaches for a research tool, would write up research
+    results, or runs out of tokens.
+    """
+    def __init__(self, fast_model: str = FAST_MODEL, simple_tools: list[str] = SIMPLE_TOOLS, fast_max_tokens: int = 1024, simple_query_words: int = 40):
+        self.fast_model = fast_model
+        self.simple_tools = set(simple_tools)
+        self.fast_max_tokens = fast_max_tokens
+        self.simple_query_words = simple_query_words
+
+    @staticmethod
+    def _current_run(messages: list[dict]) -> list[dict]:
+        """Messages since the user's latest query (tool results don't count as queries)."""
+        for i in range(len(messages) - 1, -1, -1):
+            if messages[i]["role"] == "user" and isinstance(messages[i]["content"], str):
+                return messages[i:]
+        return messages
+
+    def _tools_used(self, messages: list[dict]) -> set[str]:
+        return {
+            block.name
+            for m in self._current_run(messages) if m["role"] == "assistant"
+            for block in m["content"] if getattr(block, "type", None) == "tool_use"
+        }
+
+    def classify(self, messages: list[dict], allow_tools: bool = True) -> tuple[str, str]:
+        """The tier ("fast" or "primary") for the next turn, and why."""
+        if not allow_tools:
+            return "primary", "synthesis"
+        last = messages[-1]
+        if isinstance(last["content"], str):
+            text = last["content"]
+            simple = len(text.split()) <= self.simple_query_words and _PORTFOLIO_WORDS.search(text) and not _RESEARCH_WORDS.search(text)
+            return ("fast", "simple_query") if simple else ("primary", "planning")
+        results = [block for block in last["content"] if isinstance(block, dict) and block.get("type") == "tool_result"]
+        if any(block.get("is_error") for block in results):
+            return "primary", "tool_error"
+        called = {block.name for block in messages[-2]["content"] if getattr(block, "type", None) == "tool_use"}
+        if not called <= self.simple_tools:
+            return "primary", "research_results"
+        return "fast", "simple_tool"
+
+    def escalation(self, response, messages: list[dict]) -> str:
+        """Why a fast-tier response has to be redone by the primary model, or None to keep it."""
+        if response.stop_reason == "max_tokens":
+            return "max_tokens"
+        calls = [block.name for block in response.content if block.type == "tool_use"]
+        if any(name not in self.simple_tools for name in calls):
+            return "needs_research"
+        if not calls and not self._tools_used(messages) <= self.simple_tools:
+            return "synthesis"
+        return None
@@ -1,49 +1,233 @@
 import asyncio
 import json
-from openai import AsyncOpenAI, OpenAI
+import weakref
+from functools import partial
+import openai
+from openai import AsyncOpenAI, OpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+from lib.metrics import MetricsRegistry, TOKEN_PRICING, metrics as default_metrics
+from lib.tracing import tracer
+from lib.hedging import Hedger
+from lib.cassette import Cassette, cassette as default_cassette
+from lib.endpoints import EndpointPool
+from lib.concurrency import note_throttle
+from lib.structured import StructuredOutputError, repair, schema_format
+
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+def _is_failure(error: Exception) -> bool:
+    """Errors that say something about the endpoint rather than the request."""
+    return isinstance(error, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError, asyncio.TimeoutError))
+
 
 class OpenAIClient:
-    def __init__(self, api_key: str):
-        self.sync = OpenAI(api_key=api_key)
-        self.async_client = AsyncOpenAI(api_key=api_key)
+    def __init__(self, api_key: str, base_url: str = None, metrics: MetricsRegistry = None, timeout: float = 60.0, hedge: bool = True, cassette: Cassette = None, endpoints: list[dict] = None):
+        """timeout is the deadline for one call including the SDK's retries; with hedge, async calls
+        slower than the p95 of earlier calls for the same model and size of max_tokens get a duplicate
+        request.
+        cassette records or replays every response (defaults to the one configured by CASSETTE_PATH).
+        endpoints is a list of {"api_key", "base_url", "name"} dicts to balance calls over (default:
+        the JSON list in OPENAI_ENDPOINTS, else just api_key at base_url); see EndpointPool."""
+        self.metrics = metrics or default_metrics
+        self.cassette = cassette or default_cassette
+        self.timeout = timeout
+        self.hedger = Hedger("openai", enabled=hedge, metrics=self.metrics)
+        # base_url also falls back to OPENAI_BASE_URL inside the SDK, e.g. for a local stand-in server
+        self.pool = EndpointPool.from_config("openai", api_key, base_url, endpoints, is_failure=_is_failure, metrics=self.metrics)
+        self._sync = {
+            endpoint: OpenAI(api_key=endpoint.api_key, base_url=endpoint.base_url, timeout=timeout, http_client=DefaultHttpxClient(event_hooks={"response": [partial(self._on_response, endpoint)]}, transport=self.cassette.transport("openai")))
+            for endpoint in self.pool.endpoints
+        }
+        self._async_clients = weakref.WeakKeyDictionary()
+        # Models a server refused structured outputs for; they get JSON mode instead
+        self._no_schema = set()
         self.input_tokens = 0
         self.output_tokens = 0
-        
-    def chat_completion(self, messages: list[dict], model: str = "gpt-4o-mini", temperature: float = 0.0, max_tokens: int = 1000, json_response: bool = False) -> str:
-        response = self.sync.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            response_format={"type": "json_object"} if json_response else None
-        )
-        self.input_tokens += response.usage.prompt_tokens
-        self.output_tokens += response.usage.completion_tokens
-        return response.choices[0].message.content if not json_response else json.loads(response.choices[0].message.content)
-    
-    
-    async def chat_completion_async(self, messages: list[dict], model: str = "gpt-4o-mini", temperature: float = 0.0, max_tokens: int = 1000, json_response: bool = False) -> str:
-        response = await self.async_client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            response_format={"type": "json_object"} if json_response else None
-        )
+
+    @property
+    def sync(self) -> OpenAI:
+        """The client for the first endpoint."""
+        return self._sync[self.pool.primary]
+
+    def async_client(self, endpoint) -> AsyncOpenAI:
+        """The endpoint's async client for the running event loop. Its connection pool can't outlive
+        the loop, and every swarm run (and every thread sharing this client) brings its own asyncio.run."""
+        clients = self._async_clients.setdefault(asyncio.get_running_loop(), {})
+        if endpoint not in clients:
+            clients[endpoint] = AsyncOpenAI(api_key=endpoint.api_key, base_url=endpoint.base_url, timeout=self.timeout, http_client=DefaultAsyncHttpxClient(event_hooks={"response": [partial(self._on_response_async, endpoint)]}, transport=self.cassette.async_transport("openai")))
+        return clients[endpoint]
+
+    def _on_response(self, endpoint, response):
+        self.pool.observe_headers(endpoint, response.headers)
+        # The SDK retries these statuses itself, so each one seen here is a retry (or the final failure)
+        if response.status_code in RETRYABLE_STATUSES:
+            self.metrics.inc("retryable_responses_total", provider="openai", status=response.status_code)
+            note_throttle(response.status_code)
+
+    async def _on_response_async(self, endpoint, response):
+        self._on_response(endpoint, response)
+
+    def _record_usage(self, model: str, response, endpoint):
         self.input_tokens += response.usage.prompt_tokens
         self.output_tokens += response.usage.completion_tokens
-        return response.choices[0].message.content if not json_response else json.loads(response.choices[0].message.content)
-    
+        endpoint.input_tokens += response.usage.prompt_tokens
+        endpoint.output_tokens += response.usage.completion_tokens
+        self.metrics.record_tokens("openai", model, response.usage.prompt_tokens, response.usage.completion_tokens)
+
+    def _create(self, **kwargs):
+        """A chat completion from the best endpoint, moving on to another one if it fails."""
+        tried = []
+        while True:
+            try:
+                with self.pool.use(tried) as endpoint:
+                    tried.append(endpoint)
+                    return self._sync[endpoint].chat.completions.create(**kwargs), endpoint
+            except Exception as e:
+                if not self.pool.failover(e, tried):
+                    raise
+
+    async def _create_async(self, **kwargs):
+        tried = []
+        while True:
+            try:
+                with self.pool.use(tried) as endpoint:
+                    tried.append(endpoint)
+                    return await self.async_client(endpoint).chat.completions.create(**kwargs), endpoint
+            except Exception as e:
+                if not self.pool.failover(e, tried):
+                    raise
+
+    def _response_format(self, model: str, schema: dict = None, json_response: bool = False) -> dict:
+        if schema is not None and model not in self._no_schema:
+            return schema_format(schema.get("title", "response"), schema)
+        return {"type": "json_object"} if json_response or schema is not None else None
+
+    def _schema_rejected(self, model: str, error: Exception, schema: dict) -> bool:
+        """Whether a server rejected structured outputs for the model (e.g. an OpenAI-compatible
+        stand-in without them), in which case it gets JSON mode from now on."""
+        if schema is None or model in self._no_schema or not isinstance(error, openai.BadRequestError):
+            return False
+        if "response_format" not in str(error) and "json_schema" not in str(error):
+            return False
+        self._no_schema.add(model)
+        self.metrics.inc("structured_outputs_unsupported_total", model=model)
+        return True
+
+    def _fit(self, content: str, schema: dict, retried: bool = False):
+        """The response fitted to its schema, counting how: valid as is, repaired locally, valid
+        after the retry, or lost."""
+        name = schema.get("title", "response")
+        try:
+            result = repair(content, schema)
+        except StructuredOutputError:
+            if retried:
+                self.metrics.inc("structured_outputs_total", schema=name, outcome="lost")
+            raise
+        if retried:
+            outcome = "retried"
+        else:
+            try:
+                outcome = "valid" if json.loads(content) == result else "repaired"
+            except json.JSONDecodeError:
+                outcome = "repaired"
+        self.metrics.inc("structured_outputs_total", schema=name, outcome=outcome)
+        return result
+
+    @staticmethod
+    def _retry_messages(messages: list[dict], content: str, error: StructuredOutputError) -> list[dict]:
+        return [
+            *messages,
+            {"role": "assistant", "content": content},
+            {"role": "user", "content": f"That answer can't be used: {error}. Reply with the complete answer as JSON in the required format, and nothing else."},
+        ]
+
+    @staticmethod
+    def _hedge_key(model: str, max_tokens: int) -> str:
+        # Latency grows with the tokens a call may generate, so short and long calls are hedged separately
+        size = "short" if max_tokens <= 256 else "medium" if max_tokens <= 1024 else "long"
+        return f"{model}:{size}"
+
+    def _complete(self, messages: list[dict], model: str, temperature: float, max_tokens: int, schema: dict = None, json_response: bool = False) -> str:
+        rejected = False
+        with tracer.span("openai.chat_completion", "http", model=model), self.metrics.timer("request_latency", provider="openai", model=model):
+            try:
+                response, endpoint = self._create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    response_format=self._response_format(model, schema, json_response)
+                )
+            except openai.BadRequestError as e:
+                if not self._schema_rejected(model, e, schema):
+                    raise
+                rejected = True
+        if rejected:
+            # Retried in JSON mode once the rejected attempt's span and timer have closed
+            return self._complete(messages, model, temperature, max_tokens, schema, json_response)
+        self._record_usage(model, response, endpoint)
+        return response.choices[0].message.content
+
+    async def _complete_async(self, messages: list[dict], model: str, temperature: float, max_tokens: int, schema: dict = None, json_response: bool = False) -> str:
+        rejected = False
+        with tracer.span("openai.chat_completion", "http", model=model), self.metrics.timer("request_latency", provider="openai", model=model):
+            # A hedge picks its own endpoint, usually a less loaded one than the request it duplicates
+            create = lambda: self._create_async(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                response_format=self._response_format(model, schema, json_response)
+            )
+            try:
+                response, endpoint = await asyncio.wait_for(self.hedger.run(self._hedge_key(model, max_tokens), create), self.timeout)
+            except openai.BadRequestError as e:
+                if not self._schema_rejected(model, e, schema):
+                    raise
+                rejected = True
+        if rejected:
+            return await self._complete_async(messages, model, temperature, max_tokens, schema, json_response)
+        self._record_usage(model, response, endpoint)
+        return response.choices[0].message.content
+
+    def chat_completion(self, messages: list[dict], model: str = "gpt-4o-mini", temperature: float = 0.0, max_tokens: int = 1000, json_response: bool = False, schema: dict = None) -> str:
+        """The response text, or the parsed object with json_response. With a JSON schema (its
+        "title" names it), the response is a strict structured output: a response that still
+        doesn't fit is repaired locally (see lib.structured), and only if that fails asked for once
+        more, naming what was wrong. Raises StructuredOutputError if the retry doesn't fit either."""
+        content = self._complete(messages, model, temperature, max_tokens, schema, json_response)
+        if schema is None:
+            return content if not json_response else json.loads(content)
+        try:
+            return self._fit(content, schema)
+        except StructuredOutputError as e:
+            content = self._complete(self._retry_messages(messages, content, e), model, temperature, max_tokens, schema)
+            return self._fit(content, schema, retried=True)
+
+    async def chat_completion_async(self, messages: list[dict], model: str = "gpt-4o-mini", temperature: float = 0.0, max_tokens: int = 1000, json_response: bool = False, schema: dict = None) -> str:
+        """As chat_completion."""
+        content = await self._complete_async(messages, model, temperature, max_tokens, schema, json_response)
+        if schema is None:
+            return content if not json_response else json.loads(content)
+        try:
+            return self._fit(content, schema)
+        except StructuredOutputError as e:
+            content = await self._complete_async(self._retry_messages(messages, content, e), model, temperature, max_tokens, schema)
+            return self._fit(content, schema, retried=True)
+
     async def chat_completion_async_batch(self, messages: list[list[dict]], model: str = "gpt-4o-mini", temperature: float = 0.0, json_response: bool = False) -> list[str]:
         tasks = [self.chat_completion_async(message, model, temperature, json_response=json_response) for message in messages]
         return await asyncio.gather(*tasks)
-    
-    def get_costs(self, input_cpm: float = 0.30, output_cpm: float = 1.20):
+
+    def get_costs(self, input_cpm: float = TOKEN_PRICING["openai"]["default"][0], output_cpm: float = TOKEN_PRICING["openai"]["default"][1]):
+        def costs(input_tokens, output_tokens):
+            return {
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "input_cost": round(input_tokens * input_cpm / 1000000, 4),
+                "output_cost": round(output_tokens * output_cpm / 1000000, 4),
+                "cost": round((input_tokens * input_cpm + output_tokens * output_cpm) / 1000000, 4)
+            }
         return {
-            "input_tokens": self.input_tokens,
-            "output_tokens": self.output_tokens,
-            "input_cost": round(self.input_tokens * input_cpm / 1000000, 4),
-            "output_cost": round(self.output_tokens * output_cpm / 1000000, 4),
-            "cost": round((self.input_tokens * input_cpm + self.output_tokens * output_cpm) / 1000000, 4)
+            **costs(self.input_tokens, self.output_tokens),
+            "keys": {e.name: {**costs(e.input_tokens, e.output_tokens), "requests": e.requests, "errors": e.errors} for e in self.pool.endpoints},
         }
-        
\ No newline at end of file
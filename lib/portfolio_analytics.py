@@ -0,0 +1,274 @@
+import csv
+import json
+import os
+from collections import OrderedDict
+import numpy as np
+from lib.metrics import MetricsRegistry, metrics as default_metrics
+
+DEFAULT_PRICE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "prices")
+TRADING_DAYS = 252
+REBALANCE_PERIODS = {"none": None, "daily": 1, "weekly": 5, "monthly": 21, "quarterly": 63}
+
+
+class PriceHistory:
+    """
+    Daily close history for the symbol universe, held as a memory-mapped returns matrix.
+
+    Prices are read from one CSV per ticker ({price_dir}/{TICKER}.csv with `date,close` columns).
+    The first load aligns every series on a common date index and writes the daily simple
+    returns to `returns.npy` (dates x symbols, float32) next to the CSVs; later loads memory-map
+    that file and only rebuild it when a CSV is newer than the cache.
+    """
+    RETURNS_FILE = "returns.npy"
+    INDEX_FILE = "returns_index.json"
+
+    def __init__(self, price_dir: str = DEFAULT_PRICE_DIR):
+        self.price_dir = price_dir
+        self.returns = None
+        self.dates = []
+        self.symbols = []
+        self.columns = {}
+
+    def available(self) -> bool:
+        """Whether any price CSVs are installed; nothing ships with the repo."""
+        return bool(self._csv_files())
+
+    def _csv_files(self):
+        if not os.path.isdir(self.price_dir):
+            return []
+        return sorted(f for f in os.listdir(self.price_dir) if f.lower().endswith(".csv"))
+
+    def _cache_is_fresh(self, files):
+        returns_path = os.path.join(self.price_dir, self.RETURNS_FILE)
+        index_path = os.path.join(self.price_dir, self.INDEX_FILE)
+        if not (os.path.exists(returns_path) and os.path.exists(index_path)):
+            return False
+        cache_mtime = min(os.path.getmtime(returns_path), os.path.getmtime(index_path))
+        return all(os.path.getmtime(os.path.join(self.price_dir, f)) <= cache_mtime for f in files)
+
+    def _read_csv(self, path):
+        closes = {}
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                date = row.get("date") or row.get("Date")
+                close = row.get("adj_close") or row.get("close") or row.get("Close")
+                if date and close:
+                    closes[date[:10]] = float(close)
+        return closes
+
+    def build(self):
+        """Align all CSVs on one date index and write the returns matrix to disk."""
+        files = self._csv_files()
+        series = {f[:-4].upper(): self._read_csv(os.path.join(self.price_dir, f)) for f in files}
+        series = {symbol: closes for symbol, closes in series.items() if closes}
+        symbols = sorted(series)
+        dates = sorted({date for closes in series.values() for date in closes})
+        row = {date: i for i, date in enumerate(dates)}
+
+        prices = np.full((len(dates), len(symbols)), np.nan)
+        for j, symbol in enumerate(symbols):
+            closes = series[symbol]
+            prices[[row[d] for d in closes], j] = list(closes.values())
+
+        # Carry the last close forward over gaps so a missing day is a 0% return, not a hole
+        filled = np.where(np.isnan(prices), 0, np.arange(len(dates))[:, None])
+        np.maximum.accumulate(filled, axis=0, out=filled)
+        prices = prices[filled, np.arange(len(symbols))]
+
+        returns = np.zeros_like(prices, dtype=np.float32)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            returns[1:] = prices[1:] / prices[:-1] - 1
+        returns[~np.isfinite(returns)] = 0
+
+        np.save(os.path.join(self.price_dir, self.RETURNS_FILE), returns)
+        with open(os.path.join(self.price_dir, self.INDEX_FILE), "w") as f:
+            json.dump({"symbols": symbols, "dates": dates}, f)
+
+    def load(self):
+        """Memory-map the returns matrix, rebuilding it first if the CSVs changed."""
+        files = self._csv_files()
+        if not files:
+            raise FileNotFoundError(f"No price history found in {self.price_dir}")
+        if not self._cache_is_fresh(files):
+            self.build()
+        with open(os.path.join(self.price_dir, self.INDEX_FILE)) as f:
+            index = json.load(f)
+        self.returns = np.load(os.path.join(self.price_dir, self.RETURNS_FILE), mmap_mode="r")
+        self.symbols = index["symbols"]
+        self.dates = index["dates"]
+        self.columns = {symbol: i for i, symbol in enumerate(self.symbols)}
+        return self
+
+    def window(self, tickers: list[str], lookback_days: int):
+        """Return (dates, returns) for the given tickers over the trailing lookback window."""
+        if self.returns is None:
+            self.load()
+        cols = [self.columns[t] for t in tickers]
+        start = max(len(self.dates) - lookback_days, 1)
+        return self.dates[start:], np.asarray(self.returns[start:, cols], dtype=np.float64)
+
+
+class PortfolioAnalytics:
+    PORTFOLIO_ANALYTICS_SCHEMA = {
+        "name": "portfolio_analytics",
+        "description": "Computes return, volatility, max drawdown, risk contributions and a backtest for the current portfolio (or a hypothetical set of weights) from local daily price history",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "weights": {
+                    "type": "object",
+                    "description": "Optional mapping of ticker symbols to weights to evaluate instead of the current portfolio. Use this to try out weight changes before applying them"
+                },
+                "lookback_days": {
+                    "type": "integer",
+                    "description": "Number of trading days of history to evaluate over",
+                    "default": TRADING_DAYS
+                },
+                "rebalance": {
+                    "type": "string",
+                    "description": "Rebalancing schedule for the backtest",
+                    "enum": list(REBALANCE_PERIODS),
+                    "default": "monthly"
+                },
+                "benchmark": {
+                    "type": "string",
+                    "description": "Ticker to compare against",
+                    "default": "SPY"
+                }
+            },
+            "required": []
+        }
+    }
+
+    def __init__(self, portfolio, history: PriceHistory = None, cache_size: int = 128, metrics: MetricsRegistry = None):
+        self.portfolio = portfolio
+        self.history = history or PriceHistory()
+        self.cache_size = cache_size
+        self.metrics = metrics or default_metrics
+        self._cache = OrderedDict()
+
+    def get_schemas_and_functions(self):
+        """Returns a tuple of (schemas, functions) where schemas is a list of schema definitions
+        and functions is a list of corresponding function references bound to this instance.
+        Both are empty when no price history is installed, so the tool isn't offered."""
+        if not self.history.available():
+            return [], []
+        return [self.PORTFOLIO_ANALYTICS_SCHEMA], [self.portfolio_analytics]
+
+    def portfolio_analytics(self, input_json=None):
+        """Evaluate the portfolio (or the given weights) against local price history."""
+        input_json = input_json or {}
+        weights = input_json.get("weights") or self.portfolio.portfolio
+        try:
+            lookback_days = int(input_json.get("lookback_days", TRADING_DAYS))
+        except (TypeError, ValueError):
+            return json.dumps({"error": f"lookback_days must be a whole number of trading days, got {input_json.get('lookback_days')!r}"})
+        if lookback_days < 2:
+            return json.dumps({"error": "lookback_days must be at least 2"})
+        rebalance = input_json.get("rebalance", "monthly")
+        benchmark = input_json.get("benchmark", "SPY")
+        if not weights:
+            return json.dumps({"error": "Portfolio is empty"})
+        if rebalance not in REBALANCE_PERIODS:
+            return json.dumps({"error": f"Unknown rebalance schedule: {rebalance}"})
+
+        # Identical weights and parameters always produce the same report, so serve it from cache
+        key = (tuple(sorted(weights.items())), lookback_days, rebalance, benchmark)
+        if key in self._cache:
+            self.metrics.inc("cache_requests_total", cache="portfolio_analytics", result="hit")
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        self.metrics.inc("cache_requests_total", cache="portfolio_analytics", result="miss")
+
+        try:
+            result = json.dumps(self.analyze(weights, lookback_days, rebalance, benchmark), indent=2)
+        except FileNotFoundError as e:
+            return json.dumps({"error": str(e)})
+
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    def analyze(self, weights: dict[str, float], lookback_days: int = TRADING_DAYS, rebalance: str = "monthly", benchmark: str = "SPY") -> dict:
+        if self.history.returns is None:
+            self.history.load()
+        tickers = [t for t in weights if t in self.history.columns]
+        missing = [t for t in weights if t not in self.history.columns]
+        if not tickers:
+            return {"error": "No price history for any portfolio ticker", "missing": missing}
+
+        w = np.array([weights[t] for t in tickers], dtype=np.float64)
+        gross = w.sum()
+        if gross <= 0:
+            return {"error": "Portfolio weights must sum to a positive value"}
+        w = w / gross
+
+        dates, R = self.history.window(tickers, lookback_days)
+        if len(dates) < 2:
+            return {"error": f"Need at least 2 days of returns, the price history has {len(dates)}"}
+        equity = backtest(R, w, REBALANCE_PERIODS[rebalance])
+        daily = np.diff(equity, prepend=1.0) / np.concatenate(([1.0], equity[:-1]))
+
+        cov = np.cov(R, rowvar=False).reshape(len(tickers), len(tickers)) * TRADING_DAYS
+        variance = float(w @ cov @ w)
+        contributions = w * (cov @ w) / variance if variance > 0 else np.zeros_like(w)
+
+        report = {
+            "start": dates[0],
+            "end": dates[-1],
+            "days": len(dates),
+            "rebalance": rebalance,
+            "normalized_weights": {t: round(float(x), 4) for t, x in zip(tickers, w)},
+            "total_return": round(float(equity[-1] - 1), 4),
+            "annualized_return": round(annualized_return(equity), 4),
+            "annualized_volatility": round(float(daily.std(ddof=1) * np.sqrt(TRADING_DAYS)), 4) if len(daily) > 1 else 0.0,
+            "ex_ante_volatility": round(float(np.sqrt(variance)), 4),
+            "max_drawdown": round(max_drawdown(equity), 4),
+            "risk_contributions": {t: round(float(c), 4) for t, c in sorted(zip(tickers, contributions), key=lambda x: -x[1])},
+        }
+        report["sharpe"] = round(report["annualized_return"] / report["annualized_volatility"], 2) if report["annualized_volatility"] else None
+
+        if benchmark in self.history.columns:
+            _, B = self.history.window([benchmark], lookback_days)
+            bench = B[:, 0]
+            bench_equity = np.cumprod(1 + bench)
+            report["benchmark"] = {
+                "ticker": benchmark,
+                "total_return": round(float(bench_equity[-1] - 1), 4),
+                "max_drawdown": round(max_drawdown(bench_equity), 4),
+                "beta": round(float(np.cov(daily, bench)[0, 1] / bench.var(ddof=1)), 2) if bench.var() > 0 else None,
+            }
+        if gross != 1:
+            report["note"] = f"Weights summed to {gross:.4f} and were normalized to 100%"
+        if missing:
+            report["missing"] = missing
+        return report
+
+
+def backtest(R: np.ndarray, w: np.ndarray, period: int = None) -> np.ndarray:
+    """Equity curve (starting at 1.0) for weights w over returns R, rebalanced every `period` days."""
+    if period is None:
+        # Buy and hold: each position compounds on its own from the starting weights
+        return np.cumprod(1 + R, axis=0) @ w
+    if period == 1:
+        return np.cumprod(1 + R @ w)
+    equity = np.empty(len(R))
+    value = 1.0
+    for start in range(0, len(R), period):
+        block = np.cumprod(1 + R[start:start + period], axis=0) @ w * value
+        equity[start:start + period] = block
+        value = block[-1]
+    return equity
+
+
+def annualized_return(equity: np.ndarray) -> float:
+    years = len(equity) / TRADING_DAYS
+    if years <= 0 or equity[-1] <= 0:
+        return 0.0
+    return float(equity[-1] ** (1 / years) - 1)
+
+
+def max_drawdown(equity: np.ndarray) -> float:
+    peaks = np.maximum.accumulate(np.concatenate(([1.0], equity)))[1:]
+    return float((equity / peaks - 1).min())
@@ -0,0 +1,221 @@
+import asyncio
+import contextvars
+import json
+import re
+import threading
+from lib.metrics import MetricsRegistry, current_tool, metrics as default_metrics
+from lib.symbols import load_symbol_name_map
+
+RESEARCH_TOOLS = ("swarm_research", "swarm_research_multi")
+# Capitalized words that are tickers too, but far more often just words in the agent's text
+NOT_TICKERS = {
+    "A", "I", "AI", "AN", "AM", "AS", "AT", "BE", "BY", "DO", "GO", "HE", "IF", "IN", "IS", "IT", "ME", "MY", "NO", "OF",
+    "ON", "OR", "SO", "TO", "UP", "US", "WE", "ALL", "AND", "ANY", "ARE", "BIG", "CAN", "CEO", "CFO", "CTO", "EV", "EVS",
+    "FOR", "GDP", "HAS", "IPO", "LLM", "NEW", "NOT", "NOW", "ONE", "OUT", "SEC", "THE", "TOP", "TWO", "USA", "USD", "YOU",
+    "ALSO", "BEST", "EPS", "ESG", "ETF", "FAST", "HOLD", "JUST", "LOW", "MOST", "NEXT", "OPEN", "REAL", "SAAS", "SELL",
+    "BUY", "CASH", "LIFE", "LOVE", "MOVE", "PLAY", "NICE", "SAFE", "TRUE", "WELL", "GOOD", "HUGE", "NEAR", "OUR",
+}
+_WORD_TICKER = re.compile(r"(?<![\w$.])([A-Z]{1,5}(?:\.[A-Z])?)(?!\w|\.\w)")
+# "$NVDA", "(NVDA)", "(NASDAQ: NVDA)": unambiguous even for short or common-word tickers
+_MARKED_TICKER = re.compile(r"(?:\$|\((?:[A-Za-z]+:\s*)?)([A-Z]{1,5}(?:\.[A-Z])?)\b")
+_NAME = re.compile(r"[A-Z][\w&'.-]*(?:\s+(?:[A-Z][\w&'.-]*|&|of|and|the)){0,5}")
+_QUOTED = re.compile(r"[\"“'`]([^\"”'`\n]*\{company\}[^\"”'`\n]*)[\"”'`]")
+_JSON_STRING = re.compile(r'"((?:[^"\\]|\\.)*)"')
+_LEGAL_SUFFIX = re.compile(r"(,?\s+(inc|incorporated|corp|corporation|co|company|ltd|limited|plc|llc|lp|sa|s\.a|ag|nv|n\.v|se|holdings?|group|the)\.?)+$", re.I)
+
+
+def _normalize(name: str) -> str:
+    return _LEGAL_SUFFIX.sub("", re.sub(r"\s+", " ", name.strip(" .,;:")).lower()).strip()
+
+
+_index = None
+
+
+def _name_index() -> dict:
+    """Normalized company names (and first words that identify a single company) to symbols."""
+    global _index
+    if _index is None:
+        index, first_words = {}, {}
+        for symbol, name in load_symbol_name_map()["symbol_name_map"].items():
+            normalized = _normalize(name)
+            if not normalized:
+                continue
+            index.setdefault(normalized, symbol)
+            first_words.setdefault(normalized.split()[0], set()).add(symbol)
+        for word, symbols in first_words.items():
+            if len(symbols) == 1 and len(word) >= 5 and word not in index:
+                index[word] = next(iter(symbols))
+        _index = index
+    return _index
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """The event loop prefetches run on, in a daemon thread shared by every prefetcher."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="prefetch", daemon=True).start()
+        return _loop
+
+
+class SearchPrefetcher:
+    """
+    Speculatively warms a SerperClient's search cache from the agent's streamed output, so the
+    swarm_research call that follows a candidate pool mostly hits the cache.
+
+    Fed the text and tool-input deltas of each model turn as they stream, it picks out search
+    templates containing {company} and companies: tickers from symbol_name_map.json (bare ones of
+    two or more letters, or any written as "$NVDA" or "(NVDA)") and company names resolved through
+    it. Every new company x template pair is searched in the background as soon as both are known.
+    Until the agent writes templates in the current run, the ones from its last research call are
+    used, and companies found in text are written the way that call wrote them (as tickers or names).
+
+    At most `max_searches` queries are prefetched per run and `max_templates` templates used.
+    Queries already cached or in flight aren't sent again. Prefetched queries are counted in
+    `prefetch_searches_total` and the ones the swarm used in `prefetch_hits_total` (see SearchCache).
+    """
+    def __init__(self, serper, max_searches: int = 200, max_templates: int = 5, metrics: MetricsRegistry = None):
+        if serper.cache is None:
+            raise ValueError("SearchPrefetcher needs a SerperClient with a cache")
+        self.serper = serper
+        self.max_searches = max_searches
+        self.max_templates = max_templates
+        self.metrics = metrics or default_metrics
+        self.symbols = set(load_symbol_name_map()["all_symbols"])
+        self.previous_templates = []
+        self.use_names = False
+        self.reset()
+
+    def reset(self):
+        """Start a new run: forget its companies and templates, and renew the search budget."""
+        self.companies = {}   # as the swarm will be given them -> None, in order found
+        self.templates = []
+        self.searches = 0
+        self._text = ""
+        self._json = ""
+
+    def _templates(self) -> list[str]:
+        return (self.templates or self.previous_templates)[:self.max_templates]
+
+    def _resolve(self, text: str) -> list[str]:
+        """Companies mentioned in free text, written the way the last research call wrote them."""
+        found = {}
+        for symbol in _MARKED_TICKER.findall(text):
+            if symbol in self.symbols:
+                found[symbol] = symbol
+        for symbol in _WORD_TICKER.findall(text):
+            if symbol in self.symbols and len(symbol) >= 2 and symbol not in NOT_TICKERS:
+                found.setdefault(symbol, symbol)
+        index = _name_index()
+        for match in _NAME.finditer(text):
+            words, i = match.group().split(), 0
+            while i < len(words):
+                # Longest known name starting at each word
+                for n in range(len(words) - i, 0, -1):
+                    name = " ".join(words[i:i + n]).strip(" .,;:")
+                    symbol = index.get(_normalize(name))
+                    if symbol is not None:
+                        found.setdefault(symbol, name)
+                        break
+                i += n
+        return [name if self.use_names else symbol for symbol, name in found.items()]
+
+    def _discover(self, companies: list[str], templates: list[str]):
+        before = self._templates()
+        for template in templates:
+            if template not in self.templates:
+                self.templates.append(template)
+        new_companies = [c for c in dict.fromkeys(companies) if c not in self.companies]
+        self.companies.update(dict.fromkeys(new_companies))
+        current = self._templates()
+        queries = [template.format(company=c) for c in new_companies for template in current]
+        # Templates that are new, or replace the last call's, apply to every company found so far
+        queries += [template.format(company=c) for template in current if template not in before for c in self.companies if c not in new_companies]
+        self._prefetch(queries)
+
+    def feed(self, text: str):
+        """Text streamed by the model; complete lines are scanned as they arrive."""
+        self._text += text
+        lines, _, self._text = self._text.rpartition("\n")
+        if lines:
+            self._scan_text(lines)
+
+    def _scan_text(self, text: str):
+        templates = []
+        for line in text.split("\n"):
+            if "{company}" not in line:
+                continue
+            quoted = _QUOTED.findall(line)
+            templates += quoted or [line.strip().lstrip("-*•0123456789.) ").strip("\"“”'` ")]
+        self._discover(self._resolve(text), [t for t in templates if _valid(t)])
+
+    def feed_json(self, tool_name: str, partial_json: str):
+        """Tool input streamed by the model; for research tools, each complete JSON string is
+        scanned as it arrives."""
+        if tool_name not in RESEARCH_TOOLS:
+            return
+        self._json += partial_json
+        end, companies, templates = 0, [], []
+        index = _name_index()
+        for match in _JSON_STRING.finditer(self._json):
+            end = match.end()
+            value = json.loads(match.group())
+            if "{company}" in value:
+                if _valid(value):
+                    templates.append(value)
+            elif value in self.symbols or _normalize(value) in index:
+                # Exactly as the swarm will get it
+                companies.append(value)
+        self._json = self._json[end:]
+        if companies or templates:
+            self._discover(companies, templates)
+
+    def flush(self):
+        """End of a model turn: scan what's left of the text."""
+        text, self._text, self._json = self._text, "", ""
+        if text.strip():
+            self._scan_text(text)
+
+    def tool_call(self, name: str, tool_input: dict):
+        """Learn from a research call the agent made: its templates and how it writes companies."""
+        if name not in RESEARCH_TOOLS:
+            return
+        if name == "swarm_research":
+            templates = tool_input.get("searches", [])
+        else:
+            templates = [s for q in tool_input.get("queries", []) for s in q.get("searches", [])]
+        if templates:
+            self.previous_templates = list(dict.fromkeys(t for t in templates if _valid(t)))
+        companies = tool_input.get("companies", [])
+        if companies:
+            self.use_names = sum(c in self.symbols for c in companies) < len(companies) / 2
+
+    def _prefetch(self, queries: list[str]):
+        queries = [q for q in dict.fromkeys(queries) if q not in self.serper.cache]
+        queries = queries[:max(self.max_searches - self.searches, 0)]
+        if not queries:
+            return
+        self.searches += len(queries)
+        self.metrics.inc("prefetch_searches_total", len(queries))
+        context = contextvars.copy_context()
+        context.run(current_tool.set, "prefetch")
+        loop = _background_loop()
+        loop.call_soon_threadsafe(self._start, loop, queries, context)
+
+    def _start(self, loop: asyncio.AbstractEventLoop, queries: list[str], context: contextvars.Context):
+        task = loop.create_task(self.serper.search_results_batch_async(queries, speculative=True), context=context)
+        # Failed prefetches just leave the queries to the swarm
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+def _valid(template: str) -> bool:
+    """A template the swarm could format: {company} is its only field."""
+    try:
+        return bool(template.strip()) and template.format(company="x") != template
+    except (KeyError, IndexError, ValueError):
+        return False
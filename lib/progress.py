@@ -0,0 +1,138 @@
+import time
+from collections import deque
+from lib.metrics import Histogram, MetricsRegistry, current_session, metrics as default_metrics
+from lib.budget import spend_totals
+
+
+class Progress:
+    """
+    Live progress of one swarm run, published to subscribers as events.
+
+    Every event is a dict with an `event` type (start, company, skipped, progress, stopped,
+    finish), the run's counts (total, resumed, completed, failed, skipped, in_flight),
+    `companies_per_second` over the last `window` seconds, `eta_seconds`, per-stage latency
+    (search, eval, company) and spend so far. Company events add `company`, `status` and
+    `error`.
+
+    Subscribers are plain callables run synchronously on the event loop, so they should return
+    quickly. A subscriber that returns False, or anything calling `stop()`, ends the run early:
+    companies not yet started are skipped, companies in flight finish.
+    """
+    def __init__(self, swarm: str, total: int, subscribers: list = (), run_id: str = None, resumed: int = 0, window: float = 10.0, metrics: MetricsRegistry = None):
+        self.swarm = swarm
+        self.run_id = run_id
+        self.total = total
+        self.resumed = resumed
+        self.subscribers = list(subscribers)
+        self.window = window
+        self.metrics = metrics or default_metrics
+        # With several sessions sharing the registry, only this session's spend is reported
+        self.session = current_session.get()
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.in_flight = 0
+        self.stopped = None
+        self.stages = {}
+        self.started = time.monotonic()
+        self._samples = deque([(self.started, 0)])
+        self._baseline = spend_totals(self.metrics, session=self.session)
+
+    def _tick(self):
+        now = time.monotonic()
+        self._samples.append((now, self.completed + self.failed))
+        while len(self._samples) > 2 and now - self._samples[1][0] > self.window:
+            self._samples.popleft()
+
+    def rate(self) -> float:
+        """Companies finished per second over the rolling window."""
+        (t0, n0), (t1, n1) = self._samples[0], self._samples[-1]
+        return (n1 - n0) / (t1 - t0) if t1 > t0 else 0.0
+
+    def remaining(self) -> int:
+        return max(self.total - self.resumed - self.completed - self.failed - self.skipped, 0)
+
+    def snapshot(self) -> dict:
+        rate = self.rate()
+        remaining = self.remaining()
+        totals = spend_totals(self.metrics, session=self.session)
+        return {
+            "swarm": self.swarm,
+            "run_id": self.run_id,
+            "total": self.total,
+            "resumed": self.resumed,
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "in_flight": self.in_flight,
+            "elapsed_seconds": round(time.monotonic() - self.started, 3),
+            "companies_per_second": round(rate, 3),
+            "eta_seconds": round(remaining / rate, 1) if rate > 0 else (0.0 if not remaining else None),
+            "stage_latency": {name: {k: h.to_dict()[k] for k in ("count", "mean", "p50", "p95")} for name, h in self.stages.items()},
+            "spent": {k: round(totals[k] - self._baseline[k], 6) for k in totals},
+            "stopped": self.stopped,
+        }
+
+    def emit(self, event: str, **fields):
+        payload = {"event": event, **self.snapshot(), **fields}
+        for subscriber in self.subscribers:
+            try:
+                if subscriber(payload) is False and not self.stopped:
+                    self.stopped = "subscriber"
+            except Exception as e:
+                # A broken UI shouldn't take the run down with it
+                print(f"Progress subscriber {subscriber!r} failed: {e}")
+
+    def stop(self, reason: str = "stopped"):
+        """Ask the swarm to stop starting new companies."""
+        if not self.stopped:
+            self.stopped = reason
+            self.emit("stopped", reason=reason)
+
+    def stage(self, name: str, seconds: float):
+        self.stages.setdefault(name, Histogram()).observe(seconds)
+
+    def record(self, company: str, error: Exception = None):
+        """A company finished, successfully or not."""
+        if error is None:
+            self.completed += 1
+        else:
+            self.failed += 1
+        self._tick()
+        self.emit("company", company=company, status="ok" if error is None else "failed", error=None if error is None else str(error))
+
+    def skip(self, companies: list[str], reason: str):
+        self.skipped += len(companies)
+        self.emit("skipped", companies=list(companies), reason=reason)
+
+    def update(self, completed: int, failed: int, in_flight: int):
+        """Set the counts directly, for runs that are tracked by polling (sharded research)."""
+        self.completed, self.failed, self.in_flight = completed, failed, in_flight
+        self._tick()
+        self.emit("progress")
+
+
+class ConsoleProgress:
+    """The default subscriber: prints the start line, a dot per finished company and errors."""
+    def __init__(self):
+        self._dots = 0
+
+    def __call__(self, event: dict):
+        kind = event["event"]
+        if kind == "start":
+            self._dots = 0
+            if event["resumed"]:
+                print(f"Resuming run {event['run_id']}: {event['resumed']} of {event['total']} companies already done")
+            print(event["message"])
+        if event["completed"] > self._dots:
+            print("." * (event["completed"] - self._dots), end="", flush=True)
+            self._dots = event["completed"]
+        if kind == "company" and event["status"] == "failed":
+            print(f"Error processing {event['company']}: {event['error']}")
+        elif kind == "skipped" and event["reason"] == "deadline_seconds":
+            print(f"\nDeadline reached, skipping {len(event['companies'])} companies")
+        elif kind == "finish":
+            print()
+
+    def __repr__(self):
+        return "ConsoleProgress()"
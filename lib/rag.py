@@ -0,0 +1,160 @@
+import math
+import re
+import zlib
+from collections import Counter
+import numpy as np
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "does", "for", "from", "has", "have", "in", "is",
+    "it", "its", "of", "on", "or", "that", "the", "their", "this", "to", "was", "what", "with",
+}
+# Structured Serper fields are usually the densest evidence, so they rank ahead of plain snippets
+KIND_BOOST = {"answer_box": 2.0, "knowledge_graph": 1.5, "people_also_ask": 1.0, "organic": 1.0}
+
+_MERSENNE = (1 << 61) - 1
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def words(text: str) -> list[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def passages(search_query: str, result: dict, limit: int = 10) -> list[dict]:
+    """Flatten one Serper response into passages, keeping answerBox, knowledgeGraph and peopleAlsoAsk."""
+    found = []
+    box = result.get("answerBox") or {}
+    text = " ".join(str(box[k]) for k in ("title", "answer", "snippet") if box.get(k))
+    if text:
+        found.append({"kind": "answer_box", "text": text, "link": box.get("link", "")})
+    graph = result.get("knowledgeGraph") or {}
+    if graph:
+        parts = [str(graph[k]) for k in ("title", "type", "description") if graph.get(k)]
+        parts += [f"{k}: {v}" for k, v in (graph.get("attributes") or {}).items()]
+        if parts:
+            found.append({"kind": "knowledge_graph", "text": ". ".join(parts), "link": graph.get("descriptionLink", "")})
+    for item in (result.get("organic") or [])[:limit]:
+        found.append({"kind": "organic", "title": item.get("title", ""), "text": item.get("snippet", ""), "link": item.get("link", "")})
+    for item in (result.get("peopleAlsoAsk") or [])[:3]:
+        if item.get("snippet"):
+            found.append({"kind": "people_also_ask", "title": item.get("question", ""), "text": item["snippet"], "link": item.get("link", "")})
+    for p in found:
+        p["search"] = search_query
+    return found
+
+
+class MinHash:
+    """MinHash signatures over word shingles, for estimating Jaccard similarity between snippets."""
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        # Small enough that a * x + b fits in 64 bits for 32-bit shingle hashes
+        self.a = rng.integers(1, 1 << 31, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 32, num_perm, dtype=np.uint64)
+        self.shingle_size = shingle_size
+
+    def shingles(self, text: str) -> set[str]:
+        tokens = words(text)
+        n = self.shingle_size
+        if len(tokens) < n:
+            return {" ".join(tokens)} if tokens else set()
+        return {" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1)}
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.array([zlib.crc32(s.encode()) for s in self.shingles(text)] or [0], dtype=np.uint64)
+        # (a * x + b) mod p for every permutation and shingle, then the minimum per permutation
+        return ((np.outer(self.a, hashes) + self.b[:, None]) % _MERSENNE).min(axis=1)
+
+
+class RagBuilder:
+    """
+    Builds the search context for an LLM call from structured Serper results.
+
+    Passages (answer box, knowledge graph, organic snippets, people-also-ask) are deduplicated
+    with MinHash so near-identical snippets returned by several searches are only sent once,
+    ranked by BM25 relevance to the question being evaluated, and packed into `token_budget`
+    tokens: the best passage of every search first, so no search is crowded out by the others
+    (even if that alone goes over budget), then the rest greedily by score. The kept passages are printed grouped under their search, in the
+    same layout as SerperClient's text output.
+    """
+    def __init__(self, token_budget: int = 600, similarity_threshold: float = 0.7, num_perm: int = 64, shingle_size: int = 3, results_per_search: int = 10, metrics=None):
+        self.token_budget = token_budget
+        self.results_per_search = results_per_search
+        self.similarity_threshold = similarity_threshold
+        self.minhash = MinHash(num_perm, shingle_size)
+        self.metrics = metrics
+
+    def dedupe(self, candidates: list[dict]) -> list[dict]:
+        kept, signatures = [], []
+        for p in candidates:
+            signature = self.minhash.signature(f"{p.get('title', '')} {p['text']}")
+            if signatures and (np.stack(signatures) == signature).mean(axis=1).max() >= self.similarity_threshold:
+                continue
+            kept.append(p)
+            signatures.append(signature)
+        return kept
+
+    def rank(self, candidates: list[dict], question: str) -> list[float]:
+        """BM25 score of every passage against the question, scaled by the passage kind."""
+        terms = [t for t in dict.fromkeys(words(question)) if t not in STOPWORDS]
+        docs = [words(f"{p.get('title', '')} {p['text']}") for p in candidates]
+        if not docs:
+            return []
+        avg_len = sum(map(len, docs)) / len(docs) or 1
+        df = Counter(t for doc in docs for t in set(doc))
+        k1, b = 1.2, 0.75
+        scores = []
+        for p, doc in zip(candidates, docs):
+            tf = Counter(doc)
+            score = sum(
+                math.log(1 + (len(docs) - df[t] + 0.5) / (df[t] + 0.5)) * tf[t] * (k1 + 1) / (tf[t] + k1 * (1 - b + b * len(doc) / avg_len))
+                for t in terms if tf[t]
+            )
+            scores.append((score + 0.1) * KIND_BOOST.get(p["kind"], 1.0))
+        return scores
+
+    def build(self, question: str, results: list[tuple[str, dict]], include_urls: bool = False) -> str:
+        """Context for `question` from (search query, Serper response) pairs."""
+        candidates = [p for search_query, result in results for p in passages(search_query, result, self.results_per_search)]
+        unique = self.dedupe(candidates)
+        scores = self.rank(unique, " ".join([question, *(q for q, _ in results)]))
+
+        order = sorted(range(len(unique)), key=lambda i: -scores[i])
+        best = {}
+        for i in order:
+            best.setdefault(unique[i]["search"], i)
+        chosen = set(best.values())
+        used = sum(estimate_tokens(self.format(unique[i], include_urls)) for i in chosen)
+        for i in order:
+            cost = estimate_tokens(self.format(unique[i], include_urls))
+            if i in chosen or used + cost > self.token_budget:
+                continue
+            chosen.add(i)
+            used += cost
+
+        if self.metrics is not None:
+            self.metrics.inc("rag_passages_total", len(candidates), stage="candidate")
+            self.metrics.inc("rag_passages_total", len(candidates) - len(unique), stage="duplicate")
+            self.metrics.inc("rag_passages_total", len(chosen), stage="packed")
+            self.metrics.inc("rag_tokens_total", sum(estimate_tokens(self.format(p, include_urls)) for p in candidates), stage="candidate")
+            self.metrics.inc("rag_tokens_total", used, stage="packed")
+
+        rag = ""
+        for search_query, _ in results:
+            rag += f"{search_query}\n"
+            rag += "".join(self.format(p, include_urls) for i, p in enumerate(unique) if i in chosen and p["search"] == search_query)
+            rag += "\n"
+        return rag
+
+    @staticmethod
+    def format(passage: dict, include_urls: bool = False) -> str:
+        if passage["kind"] == "answer_box":
+            text = f"Answer: {passage['text']}\n"
+        elif passage["kind"] == "knowledge_graph":
+            text = f"Knowledge graph: {passage['text']}\n"
+        else:
+            text = f"Title: {passage.get('title', '')}\nSnippet: {passage['text']}\n"
+        if include_urls and passage.get("link"):
+            text += f"URL: {passage['link']}\n"
+        return text + "\n"
@@ -1,9 +1,19 @@
 import asyncio
+import threading
+import uuid
 import json
 from lib.serper_client import SerperClient
+from lib.search_cache import SearchCache
 from lib.openai_client import OpenAIClient
 from lib.eval_swarm import EvalSwarm
 from lib.scraper_client import ScraperClient
+from lib.screener import Screener
+from lib.run_store import RunStore, make_run_id
+from lib.swarm_results import SwarmResults
+from lib.budget import Budget, enclosing_budget
+from lib.symbols import load_symbol_name_map
+from lib.metrics import current_session
+from lib.tracing import tracer
 
 class ResearchTools:
     # Schema definitions as class variables
@@ -70,12 +80,54 @@ class ResearchTools:
                 "searches": {
                     "type": "array",
                     "description": "A list of searches required to evaluate the companies against the query. These should be atomic searches. Format them including the company name ie \"{company} net revenue retention rate\" or \"Does {company} have an office in San Antonio\" etc."
+                },
+                "budget": {
+                    "type": "object",
+                    "description": "Optional caps for this run. Companies are researched most-promising first, and if a cap is reached the remaining companies are skipped and the results are marked partial",
+                    "properties": {
+                        "max_dollars": {"type": "number"},
+                        "max_searches": {"type": "integer"},
+                        "max_tokens": {"type": "integer"},
+                        "deadline_seconds": {"type": "number"}
+                    }
                 }
             },
             "required": ["query", "companies", "searches"]
         }
     }
 
+    SWARM_RESEARCH_MULTI_SCHEMA = {
+        "name": "swarm_research_multi",
+        "description": "Like swarm_research, but evaluates several queries over the same companies in one run. Searches shared between queries are only fetched once per company. Returns a company x query score matrix",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "companies": {
+                    "type": "array",
+                    "description": "A list of companies to research"
+                },
+                "queries": {
+                    "type": "array",
+                    "description": "The queries to evaluate, all different, each with the searches it needs (formatted with {company} as in swarm_research)",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "query": {"type": "string"},
+                            "searches": {"type": "array", "items": {"type": "string"}}
+                        },
+                        "required": ["query", "searches"]
+                    }
+                },
+                "pack": {
+                    "type": "boolean",
+                    "description": "Evaluate all queries for a company in a single model call over all of its search results. Cheaper, slightly less precise"
+                },
+                "budget": SWARM_RESEARCH_SCHEMA["input_schema"]["properties"]["budget"]
+            },
+            "required": ["companies", "queries"]
+        }
+    }
+
     SCRAPE_URL_SCHEMA = {
         "name": "scrape_url",
         "description": "Scrapes and cleans content from a given URL, returning the main content and metadata",
@@ -91,12 +143,41 @@ class ResearchTools:
         }
     }
 
-    def __init__(self, openai_api_key, serper_api_key):
-        """Initialize the research tools with API clients."""
-        self._llm = OpenAIClient(api_key=openai_api_key)
-        self._serper = SerperClient(api_key=serper_api_key)
-        self._scraper = ScraperClient()
-        self.swarm = EvalSwarm(self._llm, self._serper, max_workers=50)
+    def __init__(self, openai_api_key, serper_api_key, firecrawl_api_key=None, openai_base_url=None, serper_base_url=None, firecrawl_base_url=None, swarm_processes=1, swarm_budget=None, session_id=None, run_store=None, run_ttl=24 * 3600):
+        """Initialize the research tools with API clients. Base URLs default to the real providers.
+        With swarm_processes > 1, swarm_research is sharded across that many worker processes.
+        swarm_budget caps every swarm_research call (max_dollars, max_searches, max_tokens, deadline_seconds);
+        budgets requested by the agent can only tighten it.
+        Swarm results are kept per session; pass an earlier session_id to pick its results back up.
+        Re-running a swarm in the same session only evaluates companies that are new, reusing
+        results younger than run_ttl seconds; other sessions start afresh. run_store defaults to the
+        shared store in data/.
+        One instance can serve several agent sessions from different threads (see batch.py). Each
+        session set in metrics.current_session sees only its own results, and concurrent swarm
+        runs share the swarm's limits, which are queued fairly across sessions."""
+        self._llm = OpenAIClient(api_key=openai_api_key, base_url=openai_base_url)
+        self._serper = SerperClient(api_key=serper_api_key, base_url=serper_base_url, cache=SearchCache())
+        self._scraper = ScraperClient(api_key=firecrawl_api_key, base_url=firecrawl_base_url)
+        self.run_store = run_store or RunStore(max_age=run_ttl)
+        self.swarm = EvalSwarm(self._llm, self._serper, max_workers=50, run_store=self.run_store)
+        self.screener = Screener()
+        self.swarm_processes = swarm_processes
+        self.swarm_budget = swarm_budget or {}
+        self.session_id = session_id or uuid.uuid4().hex[:12]
+        self._results = {}
+        self._results_lock = threading.Lock()
+
+    def _session(self) -> str:
+        return current_session.get() or self.session_id
+
+    @property
+    def results(self) -> SwarmResults:
+        """Swarm results of the current session."""
+        session_id = self._session()
+        with self._results_lock:
+            if session_id not in self._results:
+                self._results[session_id] = SwarmResults(self.run_store, session_id)
+            return self._results[session_id]
 
     @property
     def llm(self):
@@ -115,18 +196,26 @@ class ResearchTools:
 
     def get_schemas_and_functions(self):
         """Returns a tuple of (schemas, functions) where schemas is a list of schema definitions
-        and functions is a list of corresponding function references bound to this instance."""
+        and functions is a list of corresponding function references bound to this instance.
+        screen_universe is left out unless an attribute file is installed (see AttributeTable)."""
+        screening = self.screener.available()
         schemas = [
             self.PARALLEL_WEBSEARCH_SCHEMA,
             # self.COMPANY_WEBSEARCH_SCHEMA,
+            *([self.screener.schema()] if screening else []),
             self.SWARM_RESEARCH_SCHEMA,
+            self.SWARM_RESEARCH_MULTI_SCHEMA,
+            SwarmResults.QUERY_SWARM_RESULTS_SCHEMA,
             self.SCRAPE_URL_SCHEMA
         ]
         
         functions = [
             self.parallel_websearch,
             # self.company_websearch,
+            *([self.screen_universe] if screening else []),
             self.swarm_research,
+            self.swarm_research_multi,
+            self.query_swarm_results,
             self.scrape_url
         ]
         return schemas, functions
@@ -141,7 +230,8 @@ class ResearchTools:
 
     def parallel_websearch(self, query):
         """Execute parallel web search for the given queries."""
-        return asyncio.run(self._parallel_websearch_async(query['queries']))
+        with tracer.span("parallel_websearch", "research_tools", queries=len(query['queries'])):
+            return asyncio.run(self._parallel_websearch_async(query['queries']))
 
     def company_websearch(self, query):
         """Execute parallel web search for company-specific queries."""
@@ -150,22 +240,117 @@ class ResearchTools:
                   for search_query in query['queries']]
         return asyncio.run(self._parallel_websearch_async(queries))
 
+    def screen_universe(self, query):
+        """Pre-filter the company universe on local structured attributes."""
+        return self.screener.screen_universe(query)
+
+    def _budget(self, requested: dict = None) -> Budget:
+        """Combine the agent's requested budget with the configured caps and what is left of the
+        enclosing budget, keeping the tighter of each."""
+        limits = dict(self.swarm_budget)
+        enclosing = enclosing_budget.get()
+        for key, value in [*(requested or {}).items(), *(enclosing.remaining() if enclosing else {}).items()]:
+            if value is not None:
+                limits[key] = min(value, limits[key]) if limits.get(key) is not None else value
+        return Budget.from_dict(limits) if limits else None
+
+    def _priorities(self, companies):
+        """Research order: companies that scored well before and resolve to a known listing go first."""
+        names = load_symbol_name_map()
+        known = set(names["symbol_name_map"]) | set(names["name_symbol_map"])
+        prior_scores = self.run_store.latest_scores(companies)
+        return {
+            company: (1.0 if company in known else 0.5) + prior_scores.get(company, 50) / 100
+            for company in companies
+        }
+
     def swarm_research(self, query):
         """Execute swarm research for the given query and companies."""
-        results = asyncio.run(self.swarm.research(
-            query['query'], 
-            query['companies'], 
-            query['searches']
-        ))
+        swarm = self.swarm.for_session()
+        budget = self._budget(query.get('budget'))
+        priorities = self._priorities(query['companies']) if budget else None
+        # Same query and searches in the same session means the same run, so companies already evaluated are reused
+        run_id = make_run_id(type(self.swarm).__name__, query['query'], query['searches'], scope=self._session())
+        with tracer.span("swarm_research", "research_tools", companies=len(query['companies'])):
+            if self.swarm_processes > 1:
+                results = asyncio.run(swarm.research_sharded(
+                    query['query'],
+                    query['companies'],
+                    query['searches'],
+                    processes=self.swarm_processes,
+                    job_id=run_id,
+                    budget=budget,
+                    priorities=priorities
+                ))
+            else:
+                results = asyncio.run(swarm.research(
+                    query['query'], 
+                    query['companies'], 
+                    query['searches'],
+                    run_id=run_id,
+                    budget=budget,
+                    priorities=priorities
+                ))
+        self.results.add_run(run_id, query['query'], query['companies'])
         results.sort(key=lambda x: x["final_score"], reverse=True)
 
         # Format results as a string, only including results with score > 50
-        string_result = ""
+        string_result = self._partial_note(budget, len(query['companies']))
         for result in results:
             if result["final_score"] > 50:
                 string_result += json.dumps(result) + "\n"
+        hidden = sum(result["final_score"] <= 50 for result in results)
+        if hidden:
+            string_result += f"{hidden} companies scored 50 or below and are not shown; use query_swarm_results to see them\n"
         return string_result
 
+    def swarm_research_multi(self, query):
+        """Evaluate several queries over the same companies, sharing their searches. Always runs in-process."""
+        swarm = self.swarm.for_session()
+        budget = self._budget(query.get('budget'))
+        priorities = self._priorities(query['companies']) if budget else None
+        queries = query['queries']
+        pack = query.get('pack', False)
+        run_id = make_run_id(type(self.swarm).__name__, json.dumps({"queries": queries, "pack": pack}, sort_keys=True), [], scope=self._session())
+        with tracer.span("swarm_research_multi", "research_tools", companies=len(query['companies']), queries=len(queries)):
+            results = asyncio.run(swarm.research_multi(
+                queries,
+                query['companies'],
+                pack=pack,
+                run_id=run_id,
+                budget=budget,
+                priorities=priorities
+            ))
+        self.results.add_run(run_id, json.dumps([q['query'] for q in queries]), query['companies'])
+
+        # One row per company with a score per query, keeping companies that score > 50 on any query
+        texts = [q['query'] for q in queries]
+        rows = [
+            {
+                "company": company,
+                "scores": [answers[q]["final_score"] for q in texts],
+                "reasons": [answers[q].get("reason", "") for q in texts],
+            }
+            for company, answers in results.items()
+        ]
+        rows.sort(key=lambda row: sum(row["scores"]), reverse=True)
+        string_result = self._partial_note(budget, len(query['companies']))
+        string_result += json.dumps({"queries": texts}) + "\n"
+        for row in rows:
+            if max(row["scores"]) > 50:
+                string_result += json.dumps(row) + "\n"
+        return string_result
+
+    def query_swarm_results(self, query):
+        """Filter, sort and page the swarm results of this session."""
+        return self.results.query_swarm_results(query)
+
+    def _partial_note(self, budget: Budget, total: int) -> str:
+        if not budget or not budget.skipped:
+            return ""
+        return (f"PARTIAL RESULTS: budget exhausted ({budget.exhausted}). {len(budget.skipped)} of {total} companies were not evaluated: {json.dumps(budget.skipped)}\n"
+                f"Budget: {json.dumps(budget.summary())}\n")
+
     def scrape_url(self, query):
         """Scrape and clean content from a given URL."""
         result = self._scraper.scrape_url(query['url'])
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+DEFAULT_RUN_STORE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "swarm_runs.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    swarm TEXT,
+    query TEXT,
+    searches TEXT,
+    total INTEGER,
+    status TEXT,
+    created_at REAL,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id TEXT,
+    company TEXT,
+    status TEXT,
+    result TEXT,
+    error TEXT,
+    finished_at REAL,
+    PRIMARY KEY (run_id, company)
+);
+CREATE TABLE IF NOT EXISTS session_runs (
+    session_id TEXT,
+    run_id TEXT,
+    added_at REAL,
+    PRIMARY KEY (session_id, run_id)
+);
+CREATE TABLE IF NOT EXISTS criterion_scores (
+    company TEXT,
+    criterion TEXT,
+    searches TEXT,
+    score INTEGER,
+    reason TEXT,
+    finished_at REAL,
+    PRIMARY KEY (company, criterion, searches)
+);
+"""
+
+
+def make_run_id(swarm: str, query: str, searches: list[str], scope: str = None) -> str:
+    """Stable id for a (swarm, query, search templates) combination, within a scope such as a
+    research session if given."""
+    key = json.dumps([swarm, query, searches] + ([scope] if scope else []))
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+class RunStore:
+    """
+    SQLite-backed checkpoint store for swarm runs.
+
+    Every company result is committed as soon as it completes, so a crashed or interrupted run
+    loses nothing; re-running with the same run id only evaluates companies that aren't done yet.
+    With max_age (seconds), older results are stale: they aren't reused, so those companies are
+    evaluated again.
+    The database uses WAL mode so another process can read run status while a swarm is writing.
+    """
+    def __init__(self, path: str = DEFAULT_RUN_STORE_PATH, max_age: float = None):
+        self.path = path
+        self.max_age = max_age
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(criterion_scores)")]
+        if columns and "searches" not in columns:
+            # Scores from before they were keyed by their searches can't be told apart; drop them
+            self.conn.execute("DROP TABLE criterion_scores")
+        self.conn.executescript(SCHEMA)
+
+    def start_run(self, run_id: str, swarm: str, query: str, searches: list[str], total: int):
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO runs VALUES (?, ?, ?, ?, ?, 'running', ?, ?) "
+                "ON CONFLICT(run_id) DO UPDATE SET total = MAX(total, excluded.total), status = 'running', updated_at = excluded.updated_at",
+                (run_id, swarm, query, json.dumps(searches), total, now, now),
+            )
+
+    def finish_run(self, run_id: str, status: str = "done"):
+        with self._lock:
+            self.conn.execute("UPDATE runs SET status = ?, updated_at = ? WHERE run_id = ?", (status, time.time(), run_id))
+
+    def record(self, run_id: str, company: str, result=None, error: str = None):
+        status = "failed" if error else "done"
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (run_id, company, status, json.dumps(result) if result is not None else None, error, time.time()),
+            )
+            self.conn.execute("UPDATE runs SET updated_at = ? WHERE run_id = ?", (time.time(), run_id))
+
+    def _since(self) -> float:
+        return time.time() - self.max_age if self.max_age is not None else 0.0
+
+    def completed(self, run_id: str) -> dict:
+        """Map of company -> result for every company already done in this run (and not stale)."""
+        with self._lock:
+            rows = self.conn.execute("SELECT company, result FROM results WHERE run_id = ? AND status = 'done' AND finished_at >= ?", (run_id, self._since())).fetchall()
+        return {company: json.loads(result) for company, result in rows}
+
+    def add_to_session(self, session_id: str, run_id: str):
+        with self._lock:
+            self.conn.execute("INSERT OR IGNORE INTO session_runs VALUES (?, ?, ?)", (session_id, run_id, time.time()))
+
+    def session_runs(self, session_id: str) -> list[tuple[str, str]]:
+        """(run_id, query) for every run used in a session, oldest first."""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT s.run_id, r.query FROM session_runs s JOIN runs r ON r.run_id = s.run_id WHERE s.session_id = ? ORDER BY s.added_at",
+                (session_id,),
+            ).fetchall()
+
+    def criterion_scores(self, company: str, criteria: list[tuple[str, str]], max_age: float = None) -> dict:
+        """Cached {"score", "reason"} for each of the company's (criterion, searches) pairs that has
+        been evaluated within max_age seconds (default: the store's max_age)."""
+        if not criteria:
+            return {}
+        since = time.time() - max_age if max_age is not None else self._since()
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT criterion, searches, score, reason FROM criterion_scores WHERE company = ? AND finished_at >= ?",
+                (company, since),
+            ).fetchall()
+        wanted = set(criteria)
+        return {(criterion, searches): {"score": score, "reason": reason} for criterion, searches, score, reason in rows if (criterion, searches) in wanted}
+
+    def record_criterion(self, company: str, criterion: str, searches: str, score: int, reason: str):
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO criterion_scores VALUES (?, ?, ?, ?, ?, ?)", (company, criterion, searches, score, reason, time.time()))
+
+    def latest_scores(self, companies: list[str]) -> dict:
+        """Most recent final_score recorded for each company across all runs, where there is one."""
+        scores = {}
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT company, result FROM results WHERE status = 'done' AND finished_at >= ? AND company IN ({','.join('?' * len(companies))}) ORDER BY finished_at",
+                (self._since(), *companies),
+            ).fetchall() if companies else []
+        for company, result in rows:
+            score = json.loads(result).get("final_score") if result else None
+            if isinstance(score, (int, float)):
+                scores[company] = score
+        return scores
+
+    def status(self, run_id: str) -> dict:
+        with self._lock:
+            run = self.conn.execute("SELECT swarm, query, total, status, created_at, updated_at FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            counts = dict(self.conn.execute("SELECT status, COUNT(*) FROM results WHERE run_id = ? GROUP BY status", (run_id,)).fetchall())
+        if run is None:
+            return None
+        swarm, query, total, status, created_at, updated_at = run
+        done, failed = counts.get("done", 0), counts.get("failed", 0)
+        return {
+            "run_id": run_id,
+            "swarm": swarm,
+            "query": query,
+            "status": status,
+            "total": total,
+            "done": done,
+            "failed": failed,
+            "pending": max(total - done - failed, 0),
+            "elapsed_seconds": round(updated_at - created_at, 1),
+        }
+
+    def runs(self, limit: int = 20) -> list[dict]:
+        with self._lock:
+            ids = [r[0] for r in self.conn.execute("SELECT run_id FROM runs ORDER BY updated_at DESC LIMIT ?", (limit,)).fetchall()]
+        return [self.status(run_id) for run_id in ids]
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    # python -m lib.run_store [db_path] [run_id]: show run progress, safe to use while a swarm is running
+    store = RunStore(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_RUN_STORE_PATH)
+    print(json.dumps(store.status(sys.argv[2]) if len(sys.argv) > 2 else store.runs(), indent=2))
@@ -3,19 +3,24 @@ import logging
 from typing import Dict, Any, Optional
 import requests
 from urllib.parse import urlparse
+from lib.metrics import MetricsRegistry, metrics as default_metrics
+from lib.tracing import tracer
+from lib.cassette import Cassette, cassette as default_cassette
 
 class ScraperClient:
-    def __init__(self, api_key: str = None):
-        """Initialize the scraper client with Firecrawl API key."""
+    def __init__(self, api_key: str = None, base_url: str = None, metrics: MetricsRegistry = None, cassette: Cassette = None):
+        """Initialize the scraper client with Firecrawl API key. Requests go through the cassette when one is configured."""
         self.api_key = api_key or os.environ.get("FIRECRAWL_API_KEY")
         if not self.api_key:
             raise ValueError("Firecrawl API key must be provided either directly or via FIRECRAWL_API_KEY environment variable")
         
-        self.base_url = "https://api.firecrawl.dev/v0"
+        self.base_url = (base_url or os.environ.get("FIRECRAWL_BASE_URL") or "https://api.firecrawl.dev/v0").rstrip("/")
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        self.metrics = metrics or default_metrics
+        self.session = (cassette or default_cassette).session("firecrawl")
 
     def scrape_url(self, url: str) -> Dict[str, Any]:
         """
@@ -38,17 +43,19 @@ class ScraperClient:
                 return {"error": "Invalid URL format"}
 
             # Make request to Firecrawl API
-            response = requests.post(
-                f"{self.base_url}/scrape",
-                headers=self.headers,
-                json={
-                    "url": url,
-                    "pageOptions": {
-                        "onlyMainContent": True,  # Ignore navs, footers, etc.
-                        "includeMetadata": True   # Get title and other metadata
+            self.metrics.record_request("firecrawl", "scrape")
+            with tracer.span("firecrawl.scrape", "http", url=url), self.metrics.timer("request_latency", provider="firecrawl"):
+                response = self.session.post(
+                    f"{self.base_url}/scrape",
+                    headers=self.headers,
+                    json={
+                        "url": url,
+                        "pageOptions": {
+                            "onlyMainContent": True,  # Ignore navs, footers, etc.
+                            "includeMetadata": True   # Get title and other metadata
+                        }
                     }
-                }
-            )
+                )
             
             if response.status_code != 200:
                 error_msg = f"Firecrawl API request failed with status {response.status_code}: {response.text}"
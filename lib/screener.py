@@ -0,0 +1,236 @@
+import copy
+import csv
+import json
+import os
+import numpy as np
+from lib.symbols import active_instruments, load_symbol_name_map
+
+DEFAULT_ATTRIBUTES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "attributes.csv")
+
+SUFFIXES = {"k": 1e3, "m": 1e6, "b": 1e9, "t": 1e12}
+
+
+def parse_number(value) -> float:
+    """Parse numbers like 1500, "2.5B", "300m" or "4%" into floats."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().replace(",", "").replace("$", "").lower()
+    if text.endswith("%"):
+        return float(text[:-1]) / 100
+    if text and text[-1] in SUFFIXES:
+        return float(text[:-1]) * SUFFIXES[text[-1]]
+    return float(text)
+
+
+class AttributeTable:
+    """
+    Column-oriented per-ticker attribute table over the symbol universe.
+
+    Rows are the union of `symbols.active_instruments`, the tickers in symbol_name_map.json and
+    any ticker in the attributes CSV (one row per ticker, `ticker` column plus any attributes such
+    as sector, market_cap or dividend_yield). Numeric columns are stored as float arrays with NaN
+    for unknown values, everything else as lowercase string arrays, so predicates evaluate as
+    whole-column NumPy operations. A column is numeric when most of its values are numbers; the
+    cells that aren't are left unknown and listed in `invalid` as {column: {ticker: value}}.
+    """
+    def __init__(self, path: str = DEFAULT_ATTRIBUTES_PATH):
+        self.path = path
+        self.tickers = None
+        self.names = None
+        self.numeric = {}
+        self.categorical = {}
+        self.invalid = {}
+
+    def load(self):
+        names = load_symbol_name_map()["symbol_name_map"]
+        rows = {}
+        if os.path.exists(self.path):
+            with open(self.path, newline="") as f:
+                for row in csv.DictReader(f):
+                    ticker = (row.pop("ticker", None) or row.pop("symbol", None) or "").strip().upper()
+                    if ticker:
+                        rows[ticker] = row
+
+        tickers = list(dict.fromkeys([*active_instruments, *names, *rows]))
+        self.tickers = np.array(tickers)
+        self.names = np.array([rows.get(t, {}).get("name") or names.get(t, t) for t in tickers])
+
+        columns = {c for row in rows.values() for c in row if c and c != "name"}
+        for column in sorted(columns):
+            values = [rows.get(t, {}).get(column) or "" for t in tickers]
+            numbers, invalid = [], {}
+            for ticker, value in zip(tickers, values):
+                try:
+                    numbers.append(parse_number(value) if value.strip() else np.nan)
+                except ValueError:
+                    numbers.append(np.nan)
+                    invalid[ticker] = value
+            if len(invalid) * 2 < sum(1 for v in values if v.strip()):
+                self.numeric[column] = np.array(numbers)
+                if invalid:
+                    self.invalid[column] = invalid
+                    print(f"Warning: {len(invalid)} values of numeric column {column} in {self.path} aren't numbers, e.g. {next(iter(invalid.items()))}")
+            else:
+                self.categorical[column] = np.array([v.strip().lower() for v in values])
+        return self
+
+    @property
+    def fields(self) -> list[str]:
+        return sorted([*self.numeric, *self.categorical])
+
+
+class Screener:
+    SCREEN_UNIVERSE_SCHEMA = {
+        "name": "screen_universe",
+        "description": "Instantly filters the local universe of listed companies on structured attributes and returns the matching companies. Use this before swarm_research so only plausible candidates are researched; the returned companies list can be passed straight to swarm_research",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "filters": {
+                    "type": "array",
+                    "description": "Conditions that must all hold, e.g. {\"field\": \"name\", \"op\": \"contains\", \"value\": \"bank\"} or, for a numeric field, {\"op\": \"between\", \"value\": [\"2B\", \"10B\"]}. Numbers accept K/M/B/T suffixes and percentages",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "field": {"type": "string"},
+                            "op": {"type": "string", "enum": [">", ">=", "<", "<=", "==", "!=", "between", "in", "not_in", "contains"]},
+                            "value": {}
+                        },
+                        "required": ["field", "op", "value"]
+                    }
+                },
+                "sort_by": {
+                    "type": "string",
+                    "description": "Numeric field to sort the results by (descending)"
+                },
+                "limit": {
+                    "type": "integer",
+                    "description": "Maximum number of companies to return",
+                    "default": 100
+                }
+            },
+            "required": ["filters"]
+        }
+    }
+
+    NUMERIC_OPS = {
+        ">": np.greater,
+        ">=": np.greater_equal,
+        "<": np.less,
+        "<=": np.less_equal,
+        "==": np.equal,
+        "!=": np.not_equal,
+    }
+
+    def __init__(self, table: AttributeTable = None):
+        self.table = table or AttributeTable()
+        self._loaded = False
+        self._compiled = {}
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.table.load()
+            self._loaded = True
+
+    def available(self) -> bool:
+        """Whether an attribute file with any attributes beyond ticker and name is installed."""
+        self._ensure_loaded()
+        return bool(self.table.fields)
+
+    def schema(self) -> dict:
+        """SCREEN_UNIVERSE_SCHEMA advertising only the fields the attribute table actually has."""
+        self._ensure_loaded()
+        schema = copy.deepcopy(self.SCREEN_UNIVERSE_SCHEMA)
+        numeric, categorical = sorted(self.table.numeric), sorted(["ticker", "name", *self.table.categorical])
+        fields = f"Text fields: {', '.join(categorical)}." + (f" Numeric fields: {', '.join(numeric)}." if numeric else " No numeric attributes are installed.")
+        schema["description"] += f". {fields}"
+        properties = schema["input_schema"]["properties"]
+        properties["filters"]["items"]["properties"]["field"]["enum"] = [*categorical, *numeric]
+        if numeric:
+            properties["sort_by"]["enum"] = numeric
+        else:
+            del properties["sort_by"]
+        return schema
+
+    def compile(self, predicate: dict):
+        """Compile one {field, op, value} predicate into a function returning a boolean mask."""
+        field, op, value = predicate["field"], predicate["op"], predicate["value"]
+        if field in ("ticker", "name"):
+            column = np.char.lower(self.table.tickers if field == "ticker" else self.table.names)
+            return self._compile_categorical(column, op, value)
+        if field in self.table.numeric:
+            column = self.table.numeric[field]
+            if op == "between":
+                low, high = (parse_number(v) for v in value)
+                return lambda: (column >= low) & (column <= high)
+            if op in ("in", "not_in"):
+                targets = np.array([parse_number(v) for v in value])
+                mask = np.isin(column, targets)
+                return lambda: mask if op == "in" else ~mask & ~np.isnan(column)
+            if op in self.NUMERIC_OPS:
+                target = parse_number(value)
+                return lambda: self.NUMERIC_OPS[op](column, target) & ~np.isnan(column)
+            raise ValueError(f"Operator {op} is not supported for numeric field {field}")
+        if field in self.table.categorical:
+            return self._compile_categorical(self.table.categorical[field], op, value)
+        raise ValueError(f"Unknown field: {field}. Available fields: {', '.join(['ticker', 'name', *self.table.fields])}")
+
+    def _compile_categorical(self, column: np.ndarray, op: str, value):
+        if op in ("in", "not_in"):
+            targets = [str(v).lower() for v in value]
+            return lambda: np.isin(column, targets) if op == "in" else ~np.isin(column, targets) & (column != "")
+        if op == "==":
+            return lambda: column == str(value).lower()
+        if op == "!=":
+            return lambda: (column != str(value).lower()) & (column != "")
+        if op == "contains":
+            return lambda: np.char.find(column, str(value).lower()) >= 0
+        raise ValueError(f"Operator {op} is not supported for text fields")
+
+    def screen(self, filters: list[dict], sort_by: str = None, limit: int = 100) -> tuple[list[dict], int]:
+        self._ensure_loaded()
+        mask = np.ones(len(self.table.tickers), dtype=bool)
+        for predicate in filters:
+            key = json.dumps(predicate, sort_keys=True)
+            if key not in self._compiled:
+                self._compiled[key] = self.compile(predicate)
+            mask &= self._compiled[key]()
+        indices = np.flatnonzero(mask)
+
+        if sort_by:
+            if sort_by not in self.table.numeric:
+                raise ValueError(f"Can only sort by a numeric field: {', '.join(self.table.numeric)}")
+            keys = self.table.numeric[sort_by][indices]
+            # NaNs sort last
+            indices = indices[np.argsort(np.where(np.isnan(keys), -np.inf, keys))[::-1]]
+
+        fields = list(dict.fromkeys([p["field"] for p in filters if p["field"] not in ("ticker", "name")] + ([sort_by] if sort_by else [])))
+        rows = []
+        for i in indices[:limit]:
+            row = {"ticker": str(self.table.tickers[i]), "name": str(self.table.names[i])}
+            for field in fields:
+                if field in self.table.numeric:
+                    value = self.table.numeric[field][i]
+                    row[field] = None if np.isnan(value) else float(value)
+                else:
+                    row[field] = str(self.table.categorical[field][i]) or None
+            rows.append(row)
+        return rows, int(mask.sum())
+
+    def screen_universe(self, query):
+        """Filter the universe on structured attributes and return candidates for swarm_research."""
+        try:
+            rows, matched = self.screen(query["filters"], query.get("sort_by"), int(query.get("limit", 100)))
+        except (ValueError, TypeError, KeyError) as e:
+            return json.dumps({"error": str(e)})
+        result = {
+            "matched": matched,
+            "returned": len(rows),
+            "companies": [row["name"] for row in rows],
+            "results": rows,
+        }
+        fields = {p.get("field") for p in query["filters"]} | {query.get("sort_by")}
+        warnings = [f"{len(self.table.invalid[f])} companies have a {f} that isn't a number and were treated as unknown" for f in sorted(fields & set(self.table.invalid))]
+        if warnings:
+            result["warnings"] = warnings
+        return json.dumps(result)
@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from lib.metrics import MetricsRegistry, metrics as default_metrics
+
+
+class SearchCache:
+    """
+    In-memory cache of raw Serper results by query string, shared by everything using one
+    SerperClient (swarms, parallel_websearch and the speculative prefetcher) across threads.
+
+    A query that is already being fetched isn't sent again: later callers wait for the first
+    one's result. Only successful results are cached and shared; if the request fails or is
+    cancelled, the callers waiting for it fetch the query themselves. Entries expire after `ttl`
+    seconds and the least recently used are evicted beyond `max_entries`.
+
+    Lookups are counted in `cache_requests_total{cache="serper"}` as hit, pending or miss, and
+    lookups answered by a speculative prefetch in `prefetch_hits_total`.
+    """
+    def __init__(self, max_entries: int = 10000, ttl: float = 3600.0, metrics: MetricsRegistry = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.metrics = metrics or default_metrics
+        self._entries = OrderedDict()   # query -> [expires, result, speculative]
+        self._pending = {}              # query -> (Future, speculative)
+        self._lock = threading.Lock()
+
+    def _live(self, query: str):
+        entry = self._entries.get(query)
+        if entry is not None and entry[0] < time.monotonic():
+            del self._entries[query]
+            return None
+        return entry
+
+    def __contains__(self, query: str) -> bool:
+        with self._lock:
+            return query in self._pending or self._live(query) is not None
+
+    def claim(self, queries: list[str], speculative: bool = False) -> tuple[dict, dict, list]:
+        """
+        Split queries into cached results ({query: result}), queries someone else is fetching
+        ({query: Future}) and queries the caller now owns and must `fill` or `release`.
+        """
+        hits, waiting, owned = {}, {}, []
+        prefetched = 0
+        with self._lock:
+            for query in dict.fromkeys(queries):
+                entry = self._live(query)
+                if entry is not None:
+                    self._entries.move_to_end(query)
+                    hits[query] = entry[1]
+                    if entry[2] and not speculative:
+                        entry[2] = False
+                        prefetched += 1
+                elif query in self._pending:
+                    future, was_speculative = self._pending[query]
+                    waiting[query] = future
+                    if was_speculative and not speculative:
+                        self._pending[query] = (future, False)
+                        prefetched += 1
+                else:
+                    self._pending[query] = (Future(), speculative)
+                    owned.append(query)
+        for result, count in (("hit", len(hits)), ("pending", len(waiting)), ("miss", len(owned))):
+            if count:
+                self.metrics.inc("cache_requests_total", count, cache="serper", result=result)
+        if prefetched:
+            self.metrics.inc("prefetch_hits_total", prefetched)
+        return hits, waiting, owned
+
+    def fill(self, query: str, result):
+        """Store an owned query's result (an exception counts as a failure) and wake its waiters."""
+        if isinstance(result, BaseException):
+            return self.release(query)
+        with self._lock:
+            future, speculative = self._pending.pop(query, (None, False))
+            self._entries[query] = [time.monotonic() + self.ttl, result, speculative]
+            self._entries.move_to_end(query)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def release(self, query: str):
+        """Give up an owned query without a result; its waiters get None and fetch it themselves."""
+        with self._lock:
+            future, _ = self._pending.pop(query, (None, False))
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
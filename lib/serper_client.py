@@ -1,24 +1,88 @@
 import asyncio
-import requests
+import json
+import time
 import aiohttp
 import os
+import requests
+from lib.metrics import MetricsRegistry, REQUEST_PRICING, metrics as default_metrics
+from lib.tracing import tracer
+from lib.hedging import Hedger
+from lib.cassette import Cassette, cassette as default_cassette
+from lib.endpoints import EndpointPool
+from lib.concurrency import note_throttle
+from lib.search_cache import SearchCache
+
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class SerperError(Exception):
+    def __init__(self, status: int, text: str):
+        super().__init__(f"Serper API request failed with status {status}: {text}")
+        self.status = status
+
+
+def _is_failure(error: Exception) -> bool:
+    """Errors that say something about the endpoint rather than the request."""
+    if isinstance(error, SerperError):
+        return error.status in RETRYABLE_STATUSES
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError, requests.RequestException))
 
 class SerperClient:
-    def __init__(self, api_key: str = None):
-        self.api_key = api_key or os.environ.get("SERPER_API_KEY")
-        if not self.api_key:
-            raise ValueError("Serper API key must be provided either directly or via SERPER_API_KEY environment variable")
-        self.headers = {
-            "X-API-KEY": self.api_key,
+    def __init__(self, api_key: str = None, base_url: str = None, metrics: MetricsRegistry = None, batch_size: int = 100, timeout: float = 30.0, hedge: bool = True, cassette: Cassette = None, endpoints: list[dict] = None, cache: SearchCache = None):
+        """batch_size is the most queries sent in one array-body request by the batch methods.
+        timeout is the deadline for one request; with hedge, async requests slower than the p95
+        of earlier ones get a duplicate request. cassette records or replays every response
+        (defaults to the one configured by CASSETTE_PATH). endpoints is a list of {"api_key",
+        "base_url", "name"} dicts to balance searches over (default: the JSON list in
+        SERPER_ENDPOINTS, else just api_key at base_url); see EndpointPool. With a cache, batch
+        searches are served from it when they can be."""
+        self.metrics = metrics or default_metrics
+        api_key = api_key or os.environ.get("SERPER_API_KEY")
+        base_url = base_url or os.environ.get("SERPER_BASE_URL") or "https://google.serper.dev"
+        self.pool = EndpointPool.from_config("serper", api_key, base_url, endpoints, is_failure=_is_failure, metrics=self.metrics)
+        for endpoint in self.pool.endpoints:
+            if not endpoint.api_key:
+                raise ValueError("Serper API key must be provided either directly or via SERPER_API_KEY environment variable")
+            endpoint.base_url = endpoint.base_url.rstrip("/")
+        self.api_key = self.pool.primary.api_key
+        self.base_url = self.pool.primary.base_url
+        self.searches = 0
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.hedger = Hedger("serper", enabled=hedge, metrics=self.metrics)
+        self.cassette = cassette or default_cassette
+        self.session = self.cassette.session("serper")
+        self.cache = cache
+
+    @staticmethod
+    def _headers(endpoint) -> dict:
+        return {
+            "X-API-KEY": endpoint.api_key,
             "Content-Type": "application/json"
         }
-        self.searches = 0
+
+    def _get(self, query: str, tried: list):
+        with self.pool.use(tried) as endpoint:
+            tried.append(endpoint)
+            response = self.session.get(f"{endpoint.base_url}/search", params={"q": query}, headers=self._headers(endpoint), timeout=self.timeout)
+            self.pool.observe_headers(endpoint, response.headers)
+            if response.status_code != 200:
+                raise SerperError(response.status_code, response.text)
+            self.searches += 1
+            endpoint.searches += 1
+            self.metrics.record_request("serper", "search")
+            return response
 
     def search(self, query: str, limit: int = 5, include_urls: bool = False) -> str:
-        response = requests.get(f"https://google.serper.dev/search?q={query}", headers=self.headers)
-        self.searches += 1
-        if response.status_code != 200:
-            raise Exception(f"Serper API request failed with status {response.status_code}: {response.text}")
+        tried = []
+        with tracer.span("serper.search", "http", query=query), self.metrics.timer("request_latency", provider="serper"):
+            while True:
+                try:
+                    response = self._get(query, tried)
+                    break
+                except Exception as e:
+                    if not self.pool.failover(e, tried):
+                        raise
         result = response.json()
         search_context = ""
         if "organic" in result:
@@ -31,43 +95,140 @@ class SerperClient:
         return search_context
     
     async def search_async(self, query: str, limit: int = 5, include_urls: bool = False) -> str:
-        async with aiohttp.ClientSession() as session:
-            self.searches += 1
-            async with session.post(
-                "https://google.serper.dev/search",
-                headers=self.headers,
-                json={"q": query}
-            ) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f"Serper API request failed with status {response.status}: {error_text}")
-                
-                result = await response.json()
-                
-                # Extract relevant information from search results
-                search_context = ""
-                if "organic" in result:
-                    for result in result["organic"][:limit]:  # Use top 10 results
-                        search_context += f"Title: {result.get('title', '')}\n"
-                        search_context += f"Snippet: {result.get('snippet', '')}\n"
-                        if include_urls:
-                            search_context += f"URL: {result.get('link', '')}\n"
-                        search_context += "\n"
-                
-                return search_context
+        return self.format_results(await self.search_results_async(query), limit, include_urls)
+
+    async def search_results_async(self, query: str) -> dict:
+        """The raw Serper response, including answerBox, knowledgeGraph and peopleAlsoAsk."""
+        with tracer.span("serper.search", "http", query=query):
+            return await self._post({"q": query}, 1)
+
+    async def search_results_batch_async(self, queries: list[str], speculative: bool = False) -> list:
+        """
+        Raw responses for many queries, sent as array-body requests of up to batch_size queries.
+        A query that fails gets its exception in place of a result, so it can't fail the others.
+        With a cache, cached queries and queries already in flight aren't sent again; speculative
+        marks prefetches, so later real lookups count as prefetch hits.
+        """
+        if self.cache is None:
+            return await self._search_batch(queries)
+        hits, waiting, owned = self.cache.claim(queries, speculative)
+        results = dict(hits)
+        if owned:
+            try:
+                fetched = await self._search_batch(owned)
+            except BaseException:
+                for query in owned:
+                    self.cache.release(query)
+                raise
+            for query, result in zip(owned, fetched):
+                self.cache.fill(query, result)
+                results[query] = result
+        retry = []
+        for query, future in waiting.items():
+            # Shielded: being cancelled here mustn't cancel the fetch other callers are waiting for
+            result = await asyncio.shield(asyncio.wrap_future(future))
+            if result is None:
+                retry.append(query)
+            else:
+                results[query] = result
+        if retry:
+            # Whoever was fetching these gave up or failed
+            results.update(zip(retry, await self.search_results_batch_async(retry, speculative)))
+        return [results[query] for query in queries]
+
+    async def _search_batch(self, queries: list[str]) -> list:
+        batches = [queries[i:i + self.batch_size] for i in range(0, len(queries), self.batch_size)]
+        # _batch returns failures in place; this only guards against anything it missed
+        results = await asyncio.gather(*(self._batch(batch) for batch in batches), return_exceptions=True)
+        results = [[batch_result] * len(batch) if isinstance(batch_result, BaseException) else batch_result for batch, batch_result in zip(batches, results)]
+        return [result for batch in results for result in batch]
+
+    async def _batch(self, queries: list[str]) -> list:
+        if len(queries) == 1:
+            return await asyncio.gather(self.search_results_async(queries[0]), return_exceptions=True)
+        try:
+            with tracer.span("serper.batch", "http", queries=len(queries)):
+                body = await self._post([{"q": query} for query in queries], len(queries))
+            if not isinstance(body, list) or len(body) != len(queries):
+                raise ValueError(f"Serper batch returned {len(body) if isinstance(body, list) else 'no'} results for {len(queries)} queries")
+        except Exception as e:
+            if isinstance(e, SerperError) and e.status in (408, 429) or isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError)):
+                # Throttled or unreachable: sending the queries one by one would only make it worse
+                return [e] * len(queries)
+            # A server error, a short answer or one bad query spoiled the batch; send the queries individually
+            return await asyncio.gather(*(self.search_results_async(query) for query in queries), return_exceptions=True)
+        return [result if isinstance(result, dict) and "error" not in result else ValueError(f"Serper returned no results: {result}") for result in body]
+
+    async def _post(self, body, queries: int):
+        # Single searches and batches have very different latencies, so they are hedged separately
+        key = "search" if queries == 1 else "batch"
+        with self.metrics.timer("request_latency", provider="serper"):
+            return await self.hedger.run(key, self._send, body, queries)
+
+    async def _send(self, body, queries: int):
+        """Post to the best endpoint, moving on to another one if it fails."""
+        tried = []
+        while True:
+            try:
+                with self.pool.use(tried) as endpoint:
+                    tried.append(endpoint)
+                    return await self._send_to(endpoint, body, queries)
+            except Exception as e:
+                if not self.pool.failover(e, tried):
+                    raise
+
+    async def _send_to(self, endpoint, body, queries: int):
+        url = f"{endpoint.base_url}/search"
+        if self.cassette.replaying:
+            played = self.cassette.play("POST", url, json.dumps(body))
+            await asyncio.sleep(played["delay"])
+            status, headers, content = played["status"], played["headers"], played["content"]
+        else:
+            start = time.perf_counter()
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+                async with session.post(url, headers=self._headers(endpoint), json=body) as response:
+                    status, headers, content = response.status, response.headers, await response.read()
+                    if self.cassette.recording:
+                        self.cassette.record("serper", "POST", url, json.dumps(body), status, response.headers, content, time.perf_counter() - start)
+        self.pool.observe_headers(endpoint, headers)
+        if status != 200:
+            if status in RETRYABLE_STATUSES:
+                self.metrics.inc("retryable_responses_total", provider="serper", status=status)
+                note_throttle(status)
+            raise SerperError(status, content.decode(errors="replace"))
+        # Serper bills per successful query, including queries inside a batch
+        self.searches += queries
+        endpoint.searches += queries
+        self.metrics.record_request("serper", "search", queries)
+        return json.loads(content)
+
+    @staticmethod
+    def format_results(result: dict, limit: int = 5, include_urls: bool = False) -> str:
+        # Extract relevant information from search results
+        search_context = ""
+        if "organic" in result:
+            for result in result["organic"][:limit]:  # Use top 10 results
+                search_context += f"Title: {result.get('title', '')}\n"
+                search_context += f"Snippet: {result.get('snippet', '')}\n"
+                if include_urls:
+                    search_context += f"URL: {result.get('link', '')}\n"
+                search_context += "\n"
+
+        return search_context
     
     async def search_async_batch(self, queries: list[str], limit: int = 5, include_urls: bool = False) -> list[str]:
-        tasks = [self.search_async(query, limit, include_urls) for query in queries]
-        results = await asyncio.gather(*tasks)
+        results = await self.search_results_batch_async(queries)
+        results = [f"Search failed: {result}\n" if isinstance(result, Exception) else self.format_results(result, limit, include_urls) for result in results]
         paired = list(zip(queries, results))
         formatted = [f"Query: {query}\n\n{result}" for query, result in paired]
         str = "\n\n\n".join(formatted)
         return str
     
-    def get_costs(self, cpk: float = 0.3):
+    def get_costs(self, cpk: float = REQUEST_PRICING["serper"] * 1000):
         return {
             "searches": self.searches,
             "cost":round(self.searches * cpk / 1000, 4),
+            "keys": {e.name: {"searches": e.searches, "cost": round(e.searches * cpk / 1000, 4), "requests": e.requests, "errors": e.errors} for e in self.pool.endpoints},
         }
 
 
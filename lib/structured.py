@@ -0,0 +1,149 @@
+import json
+import re
+
+# Left out of the schema sent to the API: the title becomes its name, and strict mode rejects the
+# limits, which repair() enforces locally instead
+_UNSUPPORTED = ("title", "minimum", "maximum")
+_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.I)
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+class StructuredOutputError(ValueError):
+    """A model response that can't be made to fit its schema."""
+
+
+def schema_format(name: str, schema: dict) -> dict:
+    """The response_format for a strict structured output: every property is required and no
+    others are allowed, as strict mode demands."""
+    def strict(node):
+        node = {k: v for k, v in node.items() if k not in _UNSUPPORTED}
+        if node.get("type") == "object":
+            node["properties"] = {k: strict(v) for k, v in node["properties"].items()}
+            node["required"] = list(node["properties"])
+            node["additionalProperties"] = False
+        elif node.get("type") == "array":
+            node["items"] = strict(node["items"])
+        return node
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": strict(schema)}}
+
+
+def _close(text: str) -> str:
+    """Close the strings, arrays and objects left open by a truncated response."""
+    stack, in_string, escaped = [], False, False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+    text = text + '"' if in_string else text
+    # A dangling key or comma can't be completed, so drop it
+    text = re.sub(r',\s*"[^"]*"\s*:?\s*$|[,:]\s*$', "", text)
+    return text + "".join(reversed(stack))
+
+
+def parse(text: str):
+    """JSON from a model response, tolerating code fences, prose around the object, trailing
+    commas and truncation."""
+    if not isinstance(text, str):
+        return text
+    text = _FENCE.sub("", text.strip())
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    start = text.find("{")
+    if start < 0:
+        raise StructuredOutputError("no JSON object in the response")
+    end = text.rfind("}")
+    candidates = [text[start:end + 1]] if end > start else []
+    candidates.append(_close(text[start:]))
+    for candidate in candidates:
+        candidate = re.sub(r",\s*([}\]])", r"\1", candidate)
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+    raise StructuredOutputError("response is not valid JSON")
+
+
+def _normal(key: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", str(key).lower())
+
+
+def coerce(value, schema: dict, path: str = "$"):
+    """Fit a parsed value to the schema: numbers from strings like "85/100" or "85%", clamped to
+    minimum/maximum; keys matched ignoring case and punctuation, or by a unique near miss ("score"
+    for "final_score"); a lone value where a list belongs;
+    missing strings and lists left empty. Raises StructuredOutputError for anything else missing
+    or unusable. Keys the schema doesn't know are kept."""
+    kind = schema.get("type")
+    if kind == "object":
+        if isinstance(value, list) and len(value) == 1:
+            value = value[0]
+        if not isinstance(value, dict):
+            raise StructuredOutputError(f"{path} should be an object")
+        by_key = {_normal(k): k for k in value}
+        properties = schema["properties"]
+        if not any(_normal(k) in by_key for k in properties):
+            # The answer wrapped in a single key, e.g. {"answer": {...}}
+            nested = [v for v in value.values() if isinstance(v, dict)]
+            if len(nested) == 1:
+                return coerce(nested[0], schema, path)
+        known = {_normal(k) for k in properties}
+        result = {k: v for k, v in value.items() if _normal(k) not in known}
+        for key, spec in properties.items():
+            source = by_key.get(_normal(key))
+            if source is None:
+                # A unique near miss such as "score" for "final_score", or the other way round
+                near = [k for n, k in by_key.items() if n not in known and (_normal(key) in n or n in _normal(key))]
+                source = near[0] if len(near) == 1 else None
+            if source is not None and value[source] is not None:
+                result[key] = coerce(value[source], spec, f"{path}.{key}")
+            elif spec.get("type") == "string":
+                result[key] = ""
+            elif spec.get("type") == "array":
+                result[key] = []
+            else:
+                raise StructuredOutputError(f"{path}.{key} is missing")
+        return result
+    if kind == "array":
+        items = value if isinstance(value, list) else [value]
+        return [coerce(item, schema["items"], f"{path}[{i}]") for i, item in enumerate(items)]
+    if kind in ("integer", "number"):
+        if isinstance(value, bool):
+            raise StructuredOutputError(f"{path} should be a number")
+        if isinstance(value, str):
+            match = _NUMBER.search(value)
+            if match is None:
+                raise StructuredOutputError(f"{path} should be a number, got {value!r}")
+            value = float(match.group())
+        if not isinstance(value, (int, float)):
+            raise StructuredOutputError(f"{path} should be a number")
+        value = min(max(value, schema.get("minimum", value)), schema.get("maximum", value))
+        return int(round(value)) if kind == "integer" else value
+    if kind == "string":
+        value = value if isinstance(value, str) else json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+        if "enum" in schema:
+            if value.strip().lower() not in schema["enum"]:
+                raise StructuredOutputError(f"{path} should be one of {schema['enum']}")
+            return value.strip().lower()
+        return value
+    if kind == "boolean":
+        if isinstance(value, str) and value.lower() in ("true", "false"):
+            return value.lower() == "true"
+        return bool(value)
+    return value
+
+
+def repair(text, schema: dict):
+    """A response as an object that fits the schema, or StructuredOutputError saying what's wrong."""
+    return coerce(parse(text), schema)
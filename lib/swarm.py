@@ -1,65 +1,376 @@
 import asyncio
+import copy
+import json
+import multiprocessing
+import threading
 from abc import ABC, abstractmethod
 from lib.openai_client import OpenAIClient
 from lib.serper_client import SerperClient
 from collections import deque
 from time import time
+from lib.tracing import tracer
+from lib.run_store import RunStore, make_run_id
+from lib.work_queue import WorkQueue, DEFAULT_QUEUE_PATH
+from lib.budget import Budget
+from lib.concurrency import AdaptiveConcurrency, THROTTLE_ERRORS, tracked_throttles
+from lib.rag import RagBuilder
+from lib.progress import Progress, ConsoleProgress
 
 class RateLimiter:
     def __init__(self, max_requests: int, time_window: float):
         self.max_requests = max_requests
         self.time_window = time_window
         self.requests = deque()
-        
+        # Shared by the swarms of every session, which may run on different threads
+        self._lock = threading.Lock()
+
     async def acquire(self):
-        now = time()
-        # Remove old requests outside the time window
-        while self.requests and now - self.requests[0] > self.time_window:
-            self.requests.popleft()
-            
-        if len(self.requests) >= self.max_requests:
-            # Wait until the oldest request expires
-            wait_time = self.requests[0] + self.time_window - now
-            if wait_time > 0:
-                await asyncio.sleep(wait_time)
-                
-        self.requests.append(now)
+        with self._lock:
+            now = time()
+            # Remove old requests outside the time window
+            while self.requests and now - self.requests[0] > self.time_window:
+                self.requests.popleft()
+
+            wait_time = 0.0
+            if len(self.requests) >= self.max_requests:
+                # Wait until the request max_requests back expires, reserving that moment
+                wait_time = max(0.0, self.requests[-self.max_requests] + self.time_window - now)
+            self.requests.append(now + wait_time)
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
 
 class Swarm(ABC):
     def __init__(self, 
                  llm: OpenAIClient, 
                  serper: SerperClient,
                  max_workers: int = 50,
-                 requests_per_second: int = 50
+                 requests_per_second: int = 50,
+                 run_store: RunStore = None,
+                 concurrency: AdaptiveConcurrency = None,
+                 llm_requests_per_second: int = None,
+                 pipeline: bool = True,
+                 pipeline_buffer: int = 100,
+                 rag_builder: RagBuilder = None,
+                 deadline_seconds: float = None,
+                 subscribers: list = None
                  ):
+        """deadline_seconds caps every research call: companies still queued or in flight when it
+        passes are cancelled and reported as skipped, so one straggler can't hold up the swarm.
+        Per-request deadlines and hedging are set on the LLM and Serper clients.
+        subscribers receive the progress events of every run (see Progress); by default progress
+        is printed to the console."""
         self.llm = llm
         self.serper = serper
+        # Upper bound on concurrent companies; the adaptive controller decides how many actually run
         self.max_workers = max_workers
+        self.run_store = run_store
         self.rate_limiter = RateLimiter(requests_per_second, 1.0)
+        self.metrics = llm.metrics
+        self.concurrency = concurrency or AdaptiveConcurrency(max_limit=max_workers, name=type(self).__name__, metrics=self.metrics)
+        # The LLM stage of the pipeline gets its own limits so slow evals don't hold up searches
+        self.llm_rate_limiter = RateLimiter(llm_requests_per_second or requests_per_second, 1.0)
+        self.llm_concurrency = AdaptiveConcurrency(max_limit=max_workers, name=f"{type(self).__name__}.llm", metrics=self.metrics)
+        self.pipeline = pipeline
+        self.pipeline_buffer = pipeline_buffer
+        self.rag_builder = rag_builder or RagBuilder(metrics=self.metrics)
+        self.deadline_seconds = deadline_seconds
+        self.subscribers = [ConsoleProgress()] if subscribers is None else list(subscribers)
+        # Progress of the current (or last) run
+        self.progress = None
+        self.in_flight = 0
+
+    def for_session(self) -> "Swarm":
+        """A copy of this swarm for one session's runs, so several sessions can research at once.
+        It shares the clients, run store, caches and the concurrency and rate limits (which queue
+        work fairly across sessions), but has its own progress and subscriber list."""
+        swarm = copy.copy(self)
+        swarm.subscribers = list(self.subscribers)
+        swarm.progress = None
+        swarm.in_flight = 0
+        return swarm
+
+    def subscribe(self, callback):
+        """Send the progress events of later runs to callback(event). Return False from it to stop a run early."""
+        self.subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+    async def search(self, company: str, searches: list[str]) -> dict[str, dict]:
+        """Run the distinct searches for one company, returning raw Serper results keyed by search template."""
+        searches = list(dict.fromkeys(searches))
+        with tracer.span("rag", "swarm", company=company, searches=len(searches)):
+            results = await self.serper.search_results_batch_async([search.format(company=company) for search in searches])
+        failed = [r for r in results if isinstance(r, Exception)]
+        if failed and len(failed) == len(results):
+            raise failed[0]
+        # Some searches failing still leaves usable evidence from the others
+        return {search: {} if isinstance(r, Exception) else r for search, r in zip(searches, results)}
+
+    def rag(self, company: str, searches: list[str], search_results: dict[str, dict], question: str = "") -> str:
+        """Deduplicated, relevance-ranked context from the given searches, packed into the RAG token budget."""
+        pairs = [(search.format(company=company), search_results[search]) for search in dict.fromkeys(searches)]
+        return self.rag_builder.build(f"{company} {question}", pairs)
+
+    async def fetch(self, company: str, searches: list[str], question: str = "") -> str:
+        """Run the searches for one company and build its RAG context for the question."""
+        return self.rag(company, searches, await self.search(company, searches), question)
 
     @abstractmethod
-    async def query(self, query: str, company: str, searches: list[str]) -> str:
-        """Process a single company query. Must be implemented by subclasses."""
+    async def evaluate(self, query: str, company: str, rag: str):
+        """Answer the query for one company from its RAG context. Must be implemented by subclasses."""
         pass
 
-    async def _worker(self, query: str, searches: list[str], company_queue: asyncio.Queue, result_queue: asyncio.Queue):
+    async def query(self, query: str, company: str, searches: list[str]):
+        """Process a single company query: fetch, then evaluate."""
+        return await self.evaluate(query, company, await self.fetch(company, searches, query))
+
+    async def evaluate_packed(self, queries: list[str], company: str, rag: str) -> list:
+        """Answer several queries for one company from a shared RAG context, one result per query.
+        Subclasses can override this to answer them all in a single LLM call."""
+        return list(await asyncio.gather(*(self.evaluate(query, company, rag) for query in queries)))
+
+    async def _gated(self, controller: AdaptiveConcurrency, limiter: RateLimiter, fn, *args):
+        """Run fn(*args) inside a concurrency slot and after a rate limit token, reporting the outcome to the controller."""
+        await controller.acquire()
+        try:
+            # Acquire rate limit token before making the request
+            with tracer.span("rate_limit_wait", "swarm"):
+                await limiter.acquire()
+        except BaseException:
+            controller.release()
+            raise
+        start, error = time(), None
+        try:
+            with tracked_throttles() as throttles:
+                return await fn(*args)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            controller.release()
+            if not isinstance(error, asyncio.CancelledError):
+                controller.observe(
+                    time() - start,
+                    throttled=isinstance(error, THROTTLE_ERRORS) or bool(throttles),
+                    failed=error is not None,
+                )
+
+    async def _done(self, company: str, result_queue: asyncio.Queue, run_id: str = None, result=None, error: Exception = None):
+        swarm = type(self).__name__
+        self.progress.record(company, error)
+        if error is not None:
+            self.metrics.inc("swarm_companies_total", swarm=swarm, status="failed")
+            if run_id:
+                self.run_store.record(run_id, company, error=f"{type(error).__name__}: {error}")
+            await result_queue.put((company, None))
+        else:
+            self.metrics.inc("swarm_companies_total", swarm=swarm, status="ok")
+            if run_id:
+                self.run_store.record(run_id, company, result)
+            await result_queue.put((company, result))
+
+    def _admit(self, company: str, budget: Budget = None) -> bool:
+        """Whether a company may start; if the run was stopped or its budget is spent, it is recorded as skipped."""
+        if self.progress.stopped:
+            reason = self.progress.stopped
+        elif budget is not None and not budget.allows(self.in_flight):
+            reason = budget.exhausted
+        else:
+            return True
+        if budget is not None:
+            budget.skipped.append(company)
+        self.progress.skip([company], reason)
+        return False
+
+    def _started(self):
+        self.in_flight += 1
+        self.progress.in_flight = self.in_flight
+        self.metrics.set_gauge("swarm_in_flight", self.in_flight, swarm=type(self).__name__)
+
+    def _stopped(self, company: str, budget: Budget = None, finished: bool = True):
+        self.in_flight -= 1
+        self.progress.in_flight = self.in_flight
+        self.metrics.set_gauge("swarm_in_flight", self.in_flight, swarm=type(self).__name__)
+        if budget is not None and finished:
+            budget.finished.add(company)
+
+    async def _worker(self, process, company_queue: asyncio.Queue, result_queue: asyncio.Queue, run_id: str = None, budget: Budget = None):
+        swarm = type(self).__name__
         while True:
+            company = await company_queue.get()
+            if company is None:  # Poison pill to stop worker
+                company_queue.task_done()
+                break
             try:
-                company = await company_queue.get()
-                if company is None:  # Poison pill to stop worker
-                    break
-                
-                # Acquire rate limit token before making the request
-                await self.rate_limiter.acquire()
-                result = await self.query(query, company, searches)
-                await result_queue.put(result)
+                self.metrics.set_gauge("swarm_queue_depth", company_queue.qsize(), swarm=swarm)
+                if not self._admit(company, budget):
+                    continue
+                self._started()
+                start = time()
+                try:
+                    with tracer.span("company", "swarm", company=company), self.metrics.timer("swarm_company_latency", swarm=swarm):
+                        result = await self._gated(self.concurrency, self.rate_limiter, process, company)
+                    self.progress.stage("company", time() - start)
+                except asyncio.CancelledError:
+                    self._stopped(company, budget, finished=False)
+                    raise
+                except Exception:
+                    self._stopped(company, budget)
+                    raise
+                self._stopped(company, budget)
+                await self._done(company, result_queue, run_id, result)
             except Exception as e:
-                print(f"Error processing {company}: {e}")
-                await result_queue.put(None)
+                await self._done(company, result_queue, run_id, error=e)
             finally:
                 company_queue.task_done()
 
-    async def research(self, query: str, companies: list[str], searches: list[str]) -> list[tuple[str, str, str]]:
+    async def _search_stage(self, fetch, company_queue: asyncio.Queue, rag_queue: asyncio.Queue, result_queue: asyncio.Queue, run_id: str = None, budget: Budget = None):
+        swarm = type(self).__name__
+        while True:
+            company = await company_queue.get()
+            if company is None:
+                break
+            self.metrics.set_gauge("swarm_queue_depth", company_queue.qsize(), swarm=swarm)
+            if not self._admit(company, budget):
+                continue
+            self._started()
+            start = time()
+            try:
+                rag = await self._gated(self.concurrency, self.rate_limiter, fetch, company)
+                self.progress.stage("search", time() - start)
+                # Blocks while the eval stage is behind, which keeps buffered RAG bundles bounded
+                await rag_queue.put((company, rag, start))
+            except asyncio.CancelledError:
+                self._stopped(company, budget, finished=False)
+                raise
+            except Exception as e:
+                self._stopped(company, budget)
+                await self._done(company, result_queue, run_id, error=e)
+
+    async def _eval_stage(self, evaluate, rag_queue: asyncio.Queue, result_queue: asyncio.Queue, run_id: str = None, budget: Budget = None):
+        swarm = type(self).__name__
+        while True:
+            item = await rag_queue.get()
+            if item is None:
+                break
+            company, rag, start = item
+            self.metrics.set_gauge("swarm_rag_buffered", rag_queue.qsize(), swarm=swarm)
+            eval_start = time()
+            try:
+                result = await self._gated(self.llm_concurrency, self.llm_rate_limiter, evaluate, company, rag)
+                self.progress.stage("eval", time() - eval_start)
+            except asyncio.CancelledError:
+                self._stopped(company, budget, finished=False)
+                raise
+            except Exception as e:
+                self._stopped(company, budget)
+                await self._done(company, result_queue, run_id, error=e)
+                continue
+            self._stopped(company, budget)
+            self.metrics.observe("swarm_company_latency", time() - start, swarm=swarm)
+            self.progress.stage("company", time() - start)
+            await self._done(company, result_queue, run_id, result)
+
+    def _pipelined(self) -> bool:
+        # A swarm that replaces query() itself can't be split into fetch and evaluate stages
+        return self.pipeline and "query" not in vars(self) and type(self).query is Swarm.query
+
+    async def research(self, query: str, companies: list[str], searches: list[str], run_id: str = None, budget: Budget = None, priorities: dict[str, float] = None) -> list[tuple[str, str, str]]:
+        """
+        Run query for every company. With a budget, companies are dispatched in priority order
+        (highest first) until a cap would be exceeded; the rest are left out of the results and
+        listed in budget.skipped.
+        """
+        stages = (
+            lambda company: self.fetch(company, searches, query),
+            lambda company, rag: self.evaluate(query, company, rag),
+            lambda company: self.query(query, company, searches),
+        )
+        results = await self._checkpointed(query, companies, searches, stages, self._pipelined(), run_id, budget, priorities)
+        return [result for _, result in results]
+
+    async def research_multi(self, queries: list[dict], companies: list[str], pack: bool = False, run_id: str = None, budget: Budget = None, priorities: dict[str, float] = None) -> dict[str, dict]:
+        """
+        Run several {"query", "searches"} pairs over the same companies in one pass.
+
+        Each company's searches are the union of every pair's searches, so a search shared by
+        several queries is fetched once. Each query is then evaluated on the results of its own
+        searches, or with pack=True all queries go to the model together over the shared context.
+        Returns {company: {query: result}} for the companies that completed, so the queries must
+        be distinct.
+        """
+        searches = list(dict.fromkeys(search for q in queries for search in q["searches"]))
+        texts = [q["query"] for q in queries]
+        repeated = [text for text in dict.fromkeys(texts) if texts.count(text) > 1]
+        if repeated:
+            raise ValueError(f"Queries must be distinct; repeated: {json.dumps(repeated)}")
+        packed = pack and len(queries) > 1
+        # Packed and separate evaluations answer differently, so they resume as different runs
+        if run_id is None and self.run_store is not None:
+            run_id = make_run_id(type(self).__name__, json.dumps({"queries": texts, "pack": packed}), searches)
+
+        async def evaluate(company, search_results):
+            if packed:
+                answers = await self.evaluate_packed(texts, company, self.rag(company, searches, search_results, " ".join(texts)))
+            else:
+                answers = await asyncio.gather(*(
+                    self.evaluate(q["query"], company, self.rag(company, q["searches"], search_results, q["query"])) for q in queries
+                ))
+            return dict(zip(texts, answers))
+
+        stages = (lambda company: self.search(company, searches), evaluate, None)
+        results = await self._checkpointed(json.dumps(texts), companies, searches, stages, self.pipeline, run_id, budget, priorities)
+        return dict(results)
+
+    def _deadline(self, budget: Budget = None) -> Budget:
+        """Apply the swarm's deadline to a run's budget, creating a deadline-only budget if it has none."""
+        if self.deadline_seconds is None:
+            return budget
+        if budget is None:
+            return Budget(deadline_seconds=self.deadline_seconds, metrics=self.metrics)
+        if budget.deadline_seconds is None or budget.deadline_seconds > self.deadline_seconds:
+            budget.deadline_seconds = self.deadline_seconds
+        return budget
+
+    async def _checkpointed(self, query: str, companies: list[str], searches: list[str], stages: tuple, pipelined: bool, run_id: str = None, budget: Budget = None, priorities: dict[str, float] = None) -> list[tuple[str, object]]:
+        """Order companies, resume from the run store and run the rest, returning (company, result) pairs."""
+        if priorities:
+            companies = sorted(companies, key=lambda c: -priorities.get(c, 0.0))
+        budget = self._deadline(budget)
+        if budget is not None:
+            budget.searches_per_company = len(searches)
+
+        # With a run store, resume the run: companies finished by an earlier attempt are not redone
+        done = {}
+        if self.run_store is not None:
+            run_id = run_id or make_run_id(type(self).__name__, query, searches)
+            done = self.run_store.completed(run_id)
+            self.run_store.start_run(run_id, type(self).__name__, query, searches, len(companies))
+        else:
+            run_id = None
+
+        todo = [c for c in companies if c not in done]
+        self.progress = Progress(type(self).__name__, len(companies), self.subscribers, run_id, len(companies) - len(todo), metrics=self.metrics)
+        try:
+            results = await self._research(todo, *stages, pipelined=pipelined, run_id=run_id, budget=budget, searches=len(searches))
+        except BaseException:
+            if run_id:
+                self.run_store.finish_run(run_id, "interrupted")
+            self.progress.emit("finish", status="interrupted")
+            raise
+        status = "done" if len(results) == len(todo) and not (budget and budget.skipped) else "partial"
+        if run_id:
+            self.run_store.finish_run(run_id, status)
+        self.progress.emit("finish", status=status)
+        return [(c, done[c]) for c in companies if c in done] + results
+
+    async def _research(self, companies: list[str], fetch, evaluate, process=None, pipelined: bool = True, run_id: str = None, budget: Budget = None, searches: int = 0) -> list[tuple[str, object]]:
+        if process is None:
+            async def process(company):
+                return await evaluate(company, await fetch(company))
+
         # Create queues for companies and results
         company_queue = asyncio.Queue()
         result_queue = asyncio.Queue()
@@ -68,31 +379,163 @@ class Swarm(ABC):
         for company in companies:
             await company_queue.put(company)
             
+        # One worker per company up to the ceiling; the concurrency controllers gate how many run at once
+        num_workers = min(len(companies), self.max_workers)
+
         # Add poison pills to stop workers
-        for _ in range(self.max_workers):
+        for _ in range(num_workers):
             await company_queue.put(None)
             
-        # Create worker tasks
-        workers = [
-            asyncio.create_task(self._worker(query, searches, company_queue, result_queue))
-            for _ in range(self.max_workers)
-        ]
-        
-        print(f"Starting research: {len(companies)} companies with {self.max_workers} workers")
-        
+        if pipelined:
+            # Search workers feed a bounded queue of RAG bundles that the eval workers drain, so
+            # searches for the next companies overlap the LLM calls for the previous ones
+            rag_queue = asyncio.Queue(maxsize=self.pipeline_buffer)
+            searchers = [
+                asyncio.create_task(self._search_stage(fetch, company_queue, rag_queue, result_queue, run_id, budget))
+                for _ in range(num_workers)
+            ]
+            evaluators = [
+                asyncio.create_task(self._eval_stage(evaluate, rag_queue, result_queue, run_id, budget))
+                for _ in range(num_workers)
+            ]
+            workers = searchers + evaluators
+
+            async def finished():
+                await asyncio.gather(*searchers)
+                for _ in evaluators:
+                    await rag_queue.put(None)
+                await asyncio.gather(*evaluators)
+            message = f"Starting pipelined research: {len(companies)} companies, {num_workers} search and {num_workers} eval workers"
+        else:
+            # Create worker tasks
+            workers = [
+                asyncio.create_task(self._worker(process, company_queue, result_queue, run_id, budget))
+                for _ in range(num_workers)
+            ]
+            finished = company_queue.join
+            message = f"Starting research: {len(companies)} companies with {num_workers} workers (concurrency limit {int(self.concurrency.limit)})"
+        self.progress.emit("start", message=message, workers=num_workers, pipelined=pipelined)
+
         # Wait for all companies to be processed
-        await company_queue.join()
-        
-        # Cancel any remaining workers
-        for worker in workers:
-            worker.cancel()
+        try:
+            with tracer.span("swarm.research", "swarm", companies=len(companies), searches=searches, workers=num_workers, pipelined=pipelined):
+                timeout = budget.remaining_seconds() if budget is not None else None
+                try:
+                    await asyncio.wait_for(finished(), timeout)
+                except asyncio.TimeoutError:
+                    # Deadline hit: abandon whatever is queued or still in flight
+                    budget.exhausted = "deadline_seconds"
+                    abandoned = [c for c in companies if c not in budget.finished and c not in budget.skipped]
+                    budget.skipped.extend(abandoned)
+                    self.progress.skip(abandoned, "deadline_seconds")
+        finally:
+            # Cancel any remaining workers, also when the research itself was cancelled (e.g. Ctrl-C),
+            # so their in-flight HTTP requests are closed before this returns
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if pipelined:
+                # Bundles fetched but never evaluated
+                while not rag_queue.empty():
+                    item = rag_queue.get_nowait()
+                    if item is not None:
+                        self._stopped(item[0], budget, finished=False)
             
         # Collect results
         results = []
         while not result_queue.empty():
-            result = await result_queue.get()
+            company, result = await result_queue.get()
             if result is not None:
-                results.append(result)
-                
-        print()  # New line at the end
-        return results 
\ No newline at end of file
+                results.append((company, result))
+        return results
+
+    async def research_sharded(self, query: str, companies: list[str], searches: list[str], processes: int = 4, queue_path: str = DEFAULT_QUEUE_PATH, job_id: str = None, poll_interval: float = 1.0, budget: Budget = None, priorities: dict[str, float] = None) -> list:
+        """
+        Like research(), but spread the companies over worker processes through a shared WorkQueue.
+
+        Each process runs max_workers concurrent companies; the requests_per_second limit is
+        enforced globally across all of them. Extra workers on other hosts can join the same
+        queue with `python -m lib.swarm_worker`. Only the built-in swarm types with default
+        prompts can be sharded, since workers rebuild the swarm from its class name.
+        """
+        from lib.swarm_worker import SWARMS, worker_main
+        swarm = type(self).__name__
+        if swarm not in SWARMS:
+            raise ValueError(f"{swarm} cannot be run sharded; workers only know {', '.join(SWARMS)}")
+
+        if priorities:
+            companies = sorted(companies, key=lambda c: -priorities.get(c, 0.0))
+        budget = self._deadline(budget)
+        job_id = job_id or make_run_id(swarm, query, searches)
+        # Worker processes report their spend through the queue; it is merged into this registry while polling
+        self.progress = Progress(swarm, len(companies), self.subscribers, job_id, metrics=self.metrics)
+        if budget is not None:
+            # Spend arrives a poll late, so cap the submission up front from the estimate
+            budget.searches_per_company = len(searches)
+            allowed = budget.affordable(len(companies))
+            budget.skipped.extend(companies[allowed:])
+            if companies[allowed:]:
+                self.progress.skip(companies[allowed:], budget.exhausted)
+            companies = companies[:allowed]
+
+        # Queue calls wait on SQLite's write lock, which the workers hold too, so they run off the event loop
+        queue = await asyncio.to_thread(WorkQueue, queue_path)
+        await asyncio.to_thread(queue.submit, job_id, swarm, query, searches, companies)
+
+        ctx = multiprocessing.get_context("spawn")
+        kwargs = {
+            "openai_endpoints": self.llm.pool.config(),
+            "serper_endpoints": self.serper.pool.config(),
+        }
+        workers = [
+            ctx.Process(target=worker_main, args=(queue_path, self.max_workers, self.rate_limiter.max_requests, job_id), kwargs=kwargs, daemon=True)
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        self.progress.emit("start", message=f"Starting sharded research: {len(companies)} companies across {processes} processes (job {job_id})", workers=processes * self.max_workers, pipelined=False)
+
+        try:
+            with tracer.span("swarm.research_sharded", "swarm", companies=len(companies), processes=processes):
+                while any(worker.is_alive() for worker in workers):
+                    await asyncio.sleep(poll_interval)
+                    self.metrics.merge_usage(await asyncio.to_thread(queue.take_usage, job_id))
+                    if budget is not None and budget.remaining_seconds() == 0:
+                        budget.exhausted = "deadline_seconds"
+                        break
+                    counts = await asyncio.to_thread(queue.progress, job_id)
+                    self.metrics.set_gauge("swarm_queue_depth", counts["pending"], swarm=swarm)
+                    self.metrics.set_gauge("swarm_in_flight", counts["claimed"], swarm=swarm)
+                    self.progress.update(counts["done"], counts["failed"], counts["claimed"])
+                    if self.progress.stopped:
+                        break
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+                worker.join()
+            self.metrics.merge_usage(await asyncio.to_thread(queue.take_usage, job_id))
+
+        counts = await asyncio.to_thread(queue.progress, job_id)
+        self.progress.update(counts["done"], counts["failed"], 0)
+        completed = await asyncio.to_thread(queue.completed, job_id)
+        results = [completed[c] for c in companies if c in completed]
+        status = "done" if len(results) == len(companies) and not (budget and budget.skipped) else "partial"
+        reason = "deadline_seconds" if budget is not None and budget.exhausted == "deadline_seconds" else self.progress.stopped
+        if reason:
+            finished = {c for c, in await asyncio.to_thread(queue.read, "SELECT company FROM tasks WHERE job_id = ? AND status IN ('done', 'failed')", (job_id,))}
+            abandoned = [c for c in companies if c not in finished]
+            if budget is not None:
+                budget.skipped.extend(abandoned)
+            self.progress.skip(abandoned, reason)
+            status = "partial"
+        if self.run_store is not None:
+            # Checkpoint into the run store too, so sharded runs are resumable and queryable like in-process ones
+            self.run_store.start_run(job_id, swarm, query, searches, len(companies))
+            for company, result in completed.items():
+                self.run_store.record(job_id, company, result)
+            self.run_store.finish_run(job_id, status)
+        self.metrics.inc("swarm_companies_total", counts["done"], swarm=swarm, status="ok")
+        self.metrics.inc("swarm_companies_total", counts["failed"], swarm=swarm, status="failed")
+        self.progress.emit("finish", status=status)
+        return results
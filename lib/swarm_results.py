@@ -0,0 +1,121 @@
+import json
+import numpy as np
+from lib.run_store import RunStore
+
+SORTS = ("score_desc", "score_asc", "company")
+
+
+class SwarmResults:
+    """
+    Every swarm result of one research session, kept column-wise so it can be re-filtered,
+    sorted and paged without new API calls.
+
+    There is one row per (run, company, query); a run is identified by its query, search
+    templates and session (see ResearchTools), so rows are keyed by (query, searches, company)
+    and never include another session's results. Runs are persisted through the
+    RunStore and linked to the session id, so the table is rebuilt when the session is resumed.
+    """
+    QUERY_SWARM_RESULTS_SCHEMA = {
+        "name": "query_swarm_results",
+        "description": "Filters, sorts and pages every swarm_research / swarm_research_multi result from this session, including the low scores swarm_research leaves out. No new searches are run, so use it to revisit earlier results (e.g. the 40-50 score band) instead of re-running a swarm",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "query": {"type": "string", "description": "Only results for swarm queries containing this text (case-insensitive)"},
+                "companies": {"type": "array", "items": {"type": "string"}, "description": "Only these companies"},
+                "min_score": {"type": "number"},
+                "max_score": {"type": "number"},
+                "sort": {"type": "string", "enum": list(SORTS), "description": "Defaults to score_desc"},
+                "offset": {"type": "integer", "description": "Rows to skip, for paging"},
+                "limit": {"type": "integer", "description": "Maximum rows to return (default 50)"}
+            }
+        }
+    }
+
+    def __init__(self, run_store: RunStore, session_id: str):
+        self.run_store = run_store
+        self.session_id = session_id
+        self.columns = {"run_id": [], "query": [], "company": [], "result": []}
+        self.scores = np.empty(0)
+        self._index = {}
+        for run_id, query in run_store.session_runs(session_id):
+            self._add(run_id, query, run_store.completed(run_id))
+
+    def __len__(self):
+        return len(self.columns["company"])
+
+    def add_run(self, run_id: str, query: str, companies: list[str] = None):
+        """Link a finished run to the session and load its results from the run store, only for the
+        companies this session submitted to it when given."""
+        self.run_store.add_to_session(self.session_id, run_id)
+        results = self.run_store.completed(run_id)
+        if companies is not None:
+            results = {company: results[company] for company in companies if company in results}
+        self._add(run_id, query, results)
+
+    def _add(self, run_id: str, query: str, results: dict):
+        scores = []
+        for company, result in results.items():
+            # Multi-query runs store {query: result} per company; they get one row per query
+            multi = all(isinstance(answer, dict) for answer in result.values())
+            answers = result.items() if multi else [(query, result)]
+            for row_query, answer in answers:
+                key = (run_id, company, row_query)
+                if key in self._index:
+                    self.columns["result"][self._index[key]] = answer
+                    self.scores[self._index[key]] = answer.get("final_score", np.nan)
+                    continue
+                self._index[key] = len(self)
+                self.columns["run_id"].append(run_id)
+                self.columns["query"].append(row_query)
+                self.columns["company"].append(company)
+                self.columns["result"].append(answer)
+                scores.append(answer.get("final_score", np.nan))
+        self.scores = np.concatenate([self.scores, np.array(scores, dtype=float)])
+
+    def select(self, query: str = None, companies: list[str] = None, min_score: float = None, max_score: float = None,
+               sort: str = "score_desc", offset: int = 0, limit: int = 50) -> tuple[list[dict], int]:
+        """Matching rows for one page, plus the total number of matches."""
+        if sort not in SORTS:
+            raise ValueError(f"Unknown sort {sort!r}; expected one of {', '.join(SORTS)}")
+        mask = np.ones(len(self), dtype=bool)
+        if min_score is not None:
+            mask &= self.scores >= min_score
+        if max_score is not None:
+            mask &= self.scores <= max_score
+        if query:
+            needle = query.lower()
+            mask &= np.array([needle in q.lower() for q in self.columns["query"]], dtype=bool)
+        if companies:
+            wanted = {c.lower() for c in companies}
+            mask &= np.array([c.lower() in wanted for c in self.columns["company"]], dtype=bool)
+
+        rows = np.flatnonzero(mask)
+        if sort == "company":
+            rows = rows[np.argsort(np.array(self.columns["company"], dtype=object)[rows], kind="stable")]
+        else:
+            # NaN scores sort last either way
+            scores = self.scores[rows]
+            order = np.argsort(np.where(np.isnan(scores), np.inf, -scores if sort == "score_desc" else scores), kind="stable")
+            rows = rows[order]
+
+        page = [
+            {
+                "company": self.columns["company"][i],
+                "query": self.columns["query"][i],
+                "final_score": self.columns["result"][i].get("final_score"),
+                "reason": self.columns["result"][i].get("reason", ""),
+            }
+            for i in rows[offset:offset + limit]
+        ]
+        return page, len(rows)
+
+    def query_swarm_results(self, query):
+        """Filter, sort and page this session's swarm results."""
+        try:
+            offset, limit = int(query.get("offset", 0)), int(query.get("limit", 50))
+            rows, total = self.select(query.get("query"), query.get("companies"), query.get("min_score"), query.get("max_score"),
+                                      query.get("sort", "score_desc"), offset, limit)
+        except (ValueError, TypeError) as e:
+            return json.dumps({"error": str(e)})
+        return json.dumps({"total": total, "offset": offset, "returned": len(rows), "results": rows})
@@ -0,0 +1,121 @@
+"""
+Swarm worker: pulls companies from a shared WorkQueue, runs the swarm's query for each one and
+pushes the results back. Swarm.research_sharded starts these as local processes; on other hosts
+start them by hand against the same queue (API keys and base URLs, or OPENAI_ENDPOINTS and
+SERPER_ENDPOINTS, come from the environment):
+
+    python -m lib.swarm_worker --queue data/swarm_queue.sqlite --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import socket
+import time
+from lib.openai_client import OpenAIClient
+from lib.serper_client import SerperClient
+from lib.eval_swarm import EvalSwarm
+from lib.answer_swarm import AnswerSwarm
+from lib.work_queue import WorkQueue, SharedRateLimiter, DEFAULT_QUEUE_PATH
+from lib.concurrency import AdaptiveConcurrency, THROTTLE_ERRORS, tracked_throttles
+from lib.metrics import current_session, metrics
+
+SWARMS = {"EvalSwarm": EvalSwarm, "AnswerSwarm": AnswerSwarm}
+
+
+async def run_worker(queue_path: str = DEFAULT_QUEUE_PATH,
+                     concurrency: int = 50,
+                     requests_per_second: int = 50,
+                     job_id: str = None,
+                     batch: int = 4,
+                     exit_when_idle: bool = True,
+                     poll_interval: float = 0.5,
+                     openai_api_key: str = None,
+                     serper_api_key: str = None,
+                     openai_base_url: str = None,
+                     serper_base_url: str = None,
+                     openai_endpoints: list[dict] = None,
+                     serper_endpoints: list[dict] = None):
+    queue = WorkQueue(queue_path)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    llm = OpenAIClient(api_key=openai_api_key or os.environ.get("OPENAI_API_KEY"), base_url=openai_base_url, endpoints=openai_endpoints)
+    serper = SerperClient(api_key=serper_api_key, base_url=serper_base_url, endpoints=serper_endpoints)
+    # One limiter row in the queue database enforces the rate across every worker process
+    limiter = SharedRateLimiter(queue_path, requests_per_second)
+    # `concurrency` is the ceiling; the controller adapts how many tasks actually run at once
+    controller = AdaptiveConcurrency(max_limit=concurrency, name="swarm_worker", metrics=llm.metrics)
+    swarms, jobs = {}, {}
+
+    def swarm_for(job: dict):
+        if job["swarm"] not in swarms:
+            swarms[job["swarm"]] = SWARMS[job["swarm"]](llm, serper)
+        return swarms[job["swarm"]]
+
+    async def run_task(claimed_job: str, company: str):
+        """Run one claimed task in a controller slot the dispatcher already holds."""
+        start = time.monotonic()
+        # Label the task's spend so it can be handed to the submitting process with its result
+        session = f"{worker_id}:{claimed_job}:{company}"
+        token = current_session.set(session)
+        try:
+            if claimed_job not in jobs:
+                jobs[claimed_job] = await asyncio.to_thread(queue.job, claimed_job)
+            job = jobs[claimed_job]
+            await limiter.acquire()
+            with tracked_throttles() as throttles:
+                result = await swarm_for(job).query(job["query"], company, job["searches"])
+            await asyncio.to_thread(queue.complete, claimed_job, company, result, metrics.usage(clear=True, session=session))
+            controller.observe(time.monotonic() - start, throttled=bool(throttles))
+        except Exception as e:
+            print(f"Error processing {company}: {e}")
+            await asyncio.to_thread(queue.fail, claimed_job, company, f"{type(e).__name__}: {e}", metrics.usage(clear=True, session=session))
+            controller.observe(time.monotonic() - start, throttled=isinstance(e, THROTTLE_ERRORS) or bool(throttles), failed=True)
+        finally:
+            current_session.reset(token)
+            controller.release()
+
+    # One dispatcher claims work only for free controller slots, so the process never holds more
+    # claims than it is running (claims left waiting would time out and run twice elsewhere).
+    # Queue calls block on SQLite's write lock, so they run off the event loop.
+    running = set()
+    while True:
+        await controller.acquire()
+        slots = 1
+        while slots < batch and controller.try_acquire():
+            slots += 1
+        try:
+            claimed = await asyncio.to_thread(queue.claim, worker_id, slots, job_id)
+        except BaseException:
+            claimed = []
+            raise
+        finally:
+            # Hand back the slots nothing was claimed for
+            for _ in range(slots - len(claimed)):
+                controller.release()
+        for claimed_job, company in claimed:
+            task = asyncio.create_task(run_task(claimed_job, company))
+            running.add(task)
+            task.add_done_callback(running.discard)
+        if claimed:
+            continue
+        counts = await asyncio.to_thread(queue.progress, job_id) if job_id is not None else {}
+        busy = sum(counts.get(s, 0) for s in ("pending", "claimed"))
+        if exit_when_idle and not busy:
+            break
+        await asyncio.sleep(poll_interval)
+    await asyncio.gather(*running)
+
+
+def worker_main(*args, **kwargs):
+    """Process entry point used by Swarm.research_sharded."""
+    asyncio.run(run_worker(*args, **kwargs))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests-per-second", type=int, default=50, help="Global rate shared by all workers on this queue")
+    parser.add_argument("--job", default=None, help="Only work on this job id")
+    parser.add_argument("--forever", action="store_true", help="Keep polling for new work instead of exiting when idle")
+    args = parser.parse_args()
+    worker_main(args.queue, args.concurrency, args.requests_per_second, args.job, exit_when_idle=not args.forever)
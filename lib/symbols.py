@@ -1,3 +1,7 @@
+import json
+import os
+from functools import lru_cache
+
 all_etfs = ["VOO", "SPY", "QQQ", "SCHD", "SQQQ", "JEPI", "VTI", "TMF", "TQQQ", "UVXY", "IVV", "TSLY", "VGT", "JEPQ",
             "LABU", "SPYI", "DIA", "VYM", "SPXU", "QYLD"]
 
@@ -380,4 +384,14 @@ all_by_three_month_average_trading_volume = \
      'ATAK', 'GPAC', 'BBU', 'ATAQ', 'CLGN', 'ICG', 'ALTU', 'SWSS', 'ARM', 'RDDT', 'ALAB', 'IBTA']
 
 active_instruments = all_by_three_month_average_trading_volume
-active_etfs = all_etfs
\ No newline at end of file
+active_etfs = all_etfs
+
+
+SYMBOL_NAME_MAP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "symbol_name_map.json")
+
+
+@lru_cache(maxsize=1)
+def load_symbol_name_map(path: str = SYMBOL_NAME_MAP_PATH) -> dict:
+    """Load symbol_name_map.json (symbol_name_map, name_symbol_map, all_symbols, all_names)."""
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,130 @@
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+_NULL_SPAN = nullcontext()
+
+
+class _Trace:
+    """The events and tracks recorded for one session."""
+    def __init__(self, name: str):
+        self.name = name
+        self.events = []
+        self.tracks = {}
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter_ns()
+
+
+class Tracer:
+    """
+    Span recorder that writes Chrome trace / Perfetto JSON (open in ui.perfetto.dev or chrome://tracing).
+
+    Spans are recorded as complete ("X") events. Each asyncio task gets its own track so that
+    concurrent swarm workers and searches show up side by side instead of overlapping on one
+    thread. When tracing is disabled `span()` returns a shared no-op context manager, so
+    instrumented code pays one context variable lookup per span.
+
+    Set TRACE_DIR in the environment (or pass trace_dir) to write one trace file per session.
+    The trace being recorded is held in a context variable, so sessions running at once on
+    different threads (as in batch.py) each get their own buffer and file; tasks and threads
+    started from a session with its context (asyncio tasks, asyncio.to_thread) record into it.
+    """
+    def __init__(self, trace_dir: str = None):
+        self.trace_dir = trace_dir or os.environ.get("TRACE_DIR")
+        self._current: ContextVar[_Trace] = ContextVar(f"trace_{id(self)}", default=None)
+        self._sessions = itertools.count(1)
+
+    @property
+    def enabled(self) -> bool:
+        return self._current.get() is not None
+
+    @property
+    def events(self) -> list:
+        trace = self._current.get()
+        return trace.events if trace else []
+
+    def now(self) -> float:
+        """Current trace timestamp in microseconds, for use with complete()."""
+        trace = self._current.get()
+        return (time.perf_counter_ns() - trace.origin) / 1000 if trace else 0.0
+
+    def _track(self, trace: _Trace) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key = id(task) if task else threading.get_ident()
+        with trace.lock:
+            if key not in trace.tracks:
+                track = len(trace.tracks) + 1
+                trace.tracks[key] = track
+                name = task.get_name() if task else threading.current_thread().name
+                trace.events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": track, "args": {"name": name}})
+            return trace.tracks[key]
+
+    def start(self, name: str = "session"):
+        """Record a new trace in the current context."""
+        self._current.set(_Trace(f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(self._sessions)}"))
+
+    def stop(self, path: str = None) -> str:
+        """Stop recording the current context's trace and write it to path (or the session file in trace_dir)."""
+        trace = self._current.get()
+        self._current.set(None)
+        path = path or os.path.join(self.trace_dir, f"trace-{trace.name}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with trace.lock:
+            events = list(trace.events)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return path
+
+    @contextmanager
+    def session(self, name: str = "session"):
+        """Trace everything inside the block to one file when a trace directory is configured.
+        Nested sessions record into the outer one."""
+        if not self.trace_dir or self.enabled:
+            yield
+            return
+        self.start(name)
+        try:
+            yield
+        finally:
+            print(f"Trace written to {self.stop()}")
+
+    def span(self, name: str, cat: str = "", **args):
+        trace = self._current.get()
+        if trace is None:
+            return _NULL_SPAN
+        return self._span(trace, name, cat, args)
+
+    @contextmanager
+    def _span(self, trace, name, cat, args):
+        track = self._track(trace)
+        start = self.now()
+        try:
+            yield args
+        except BaseException as e:
+            args["error"] = type(e).__name__
+            raise
+        finally:
+            self.complete(name, start, self.now() - start, cat, track, **args)
+
+    def complete(self, name: str, start_us: float, duration_us: float, cat: str = "", track: int = None, **args):
+        """Record a span whose start and duration were measured by the caller."""
+        trace = self._current.get()
+        if trace is None:
+            return
+        event = {"name": name, "cat": cat, "ph": "X", "ts": start_us, "dur": duration_us, "pid": os.getpid(), "tid": track or self._track(trace)}
+        if args:
+            event["args"] = args
+        with trace.lock:
+            trace.events.append(event)
+
+
+# Process-wide default tracer
+tracer = Tracer()
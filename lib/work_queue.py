@@ -0,0 +1,193 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_QUEUE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "swarm_queue.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    swarm TEXT,
+    query TEXT,
+    searches TEXT,
+    created_at REAL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    job_id TEXT,
+    company TEXT,
+    status TEXT DEFAULT 'pending',
+    worker TEXT,
+    attempts INTEGER DEFAULT 0,
+    claimed_at REAL,
+    result TEXT,
+    error TEXT,
+    PRIMARY KEY (job_id, company)
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, claimed_at);
+CREATE TABLE IF NOT EXISTS task_usage (
+    job_id TEXT,
+    company TEXT,
+    usage TEXT,
+    merged INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS task_usage_merged ON task_usage (job_id, merged);
+CREATE TABLE IF NOT EXISTS rate_limits (
+    name TEXT PRIMARY KEY,
+    tokens REAL,
+    updated_at REAL
+);
+"""
+
+
+class _SQLite:
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def read(self, sql: str, args: tuple = ()) -> list:
+        with self._lock:
+            return self.conn.execute(sql, args).fetchall()
+
+    def transaction(self, fn):
+        """Run fn(conn) inside BEGIN IMMEDIATE so concurrent processes serialize on the write lock."""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self.conn)
+                self.conn.execute("COMMIT")
+                return result
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+
+class WorkQueue(_SQLite):
+    """
+    SQLite-backed queue of (job, company) tasks shared by swarm worker processes.
+
+    Workers claim small batches of pending companies, run them and write results back. Claims
+    that aren't completed within `claim_timeout` (a crashed worker) are handed out again.
+    The spend of every attempt (MetricsRegistry.usage() series) is stored with its task, for the
+    submitting process to merge into its own registry with take_usage().
+    Several hosts can share the queue when the database sits on a filesystem with working
+    locks; otherwise run the workers on the host that owns the file.
+    """
+    def __init__(self, path: str = DEFAULT_QUEUE_PATH, claim_timeout: float = 300.0, max_attempts: int = 3):
+        super().__init__(path)
+        self.claim_timeout = claim_timeout
+        self.max_attempts = max_attempts
+
+    def submit(self, job_id: str, swarm: str, query: str, searches: list[str], companies: list[str]):
+        def submit(conn):
+            conn.execute("INSERT OR IGNORE INTO jobs VALUES (?, ?, ?, ?, ?)", (job_id, swarm, query, json.dumps(searches), time.time()))
+            conn.executemany("INSERT OR IGNORE INTO tasks (job_id, company) VALUES (?, ?)", [(job_id, c) for c in companies])
+            # Failed tasks get another chance when the job is resubmitted
+            conn.execute("UPDATE tasks SET status = 'pending', attempts = 0 WHERE job_id = ? AND status = 'failed'", (job_id,))
+        self.transaction(submit)
+
+    def job(self, job_id: str) -> dict:
+        rows = self.read("SELECT swarm, query, searches FROM jobs WHERE job_id = ?", (job_id,))
+        row = rows[0] if rows else None
+        return {"job_id": job_id, "swarm": row[0], "query": row[1], "searches": json.loads(row[2])} if row else None
+
+    def claim(self, worker: str, batch: int = 1, job_id: str = None) -> list[tuple[str, str]]:
+        """Claim up to `batch` pending (or abandoned) tasks, returning (job_id, company) pairs."""
+        def claim(conn):
+            now = time.time()
+            rows = conn.execute(
+                "SELECT rowid, job_id, company FROM tasks WHERE (status = 'pending' OR (status = 'claimed' AND claimed_at < ?))"
+                + (" AND job_id = ?" if job_id else "") + " LIMIT ?",
+                (now - self.claim_timeout, *([job_id] if job_id else []), batch),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE tasks SET status = 'claimed', worker = ?, claimed_at = ?, attempts = attempts + 1 WHERE rowid = ?",
+                [(worker, now, rowid) for rowid, _, _ in rows],
+            )
+            return [(job, company) for _, job, company in rows]
+        return self.transaction(claim)
+
+    @staticmethod
+    def _record_usage(conn, job_id: str, company: str, usage: list[dict]):
+        if usage:
+            conn.execute("INSERT INTO task_usage (job_id, company, usage) VALUES (?, ?, ?)", (job_id, company, json.dumps(usage)))
+
+    def complete(self, job_id: str, company: str, result, usage: list[dict] = None):
+        def complete(conn):
+            conn.execute(
+                "UPDATE tasks SET status = 'done', result = ?, error = NULL WHERE job_id = ? AND company = ?",
+                (json.dumps(result), job_id, company),
+            )
+            self._record_usage(conn, job_id, company, usage)
+        self.transaction(complete)
+
+    def fail(self, job_id: str, company: str, error: str, usage: list[dict] = None):
+        def fail(conn):
+            # Retry on another claim until max_attempts, then give up on the company
+            conn.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, error = ? WHERE job_id = ? AND company = ?",
+                (self.max_attempts, error, job_id, company),
+            )
+            self._record_usage(conn, job_id, company, usage)
+        self.transaction(fail)
+
+    def take_usage(self, job_id: str) -> list[dict]:
+        """Usage series recorded for the job's tasks since the last call, each handed out once."""
+        def take(conn):
+            rows = conn.execute("SELECT rowid, usage FROM task_usage WHERE job_id = ? AND merged = 0", (job_id,)).fetchall()
+            conn.executemany("UPDATE task_usage SET merged = 1 WHERE rowid = ?", [(rowid,) for rowid, _ in rows])
+            return [s for _, usage in rows for s in json.loads(usage)]
+        return self.transaction(take)
+
+    def progress(self, job_id: str) -> dict:
+        counts = dict(self.read("SELECT status, COUNT(*) FROM tasks WHERE job_id = ? GROUP BY status", (job_id,)))
+        return {status: counts.get(status, 0) for status in ("pending", "claimed", "done", "failed")}
+
+    def completed(self, job_id: str) -> dict:
+        """Map of company -> result for every finished task of a job."""
+        return {c: json.loads(r) for c, r in self.read("SELECT company, result FROM tasks WHERE job_id = ? AND status = 'done'", (job_id,))}
+
+    def results(self, job_id: str, companies: list[str] = None) -> list:
+        rows = self.completed(job_id)
+        order = companies if companies is not None else list(rows)
+        return [rows[c] for c in order if c in rows]
+
+
+class SharedRateLimiter(_SQLite):
+    """
+    Token bucket stored in SQLite so the request rate is enforced across every worker process.
+
+    Drop-in for swarm.RateLimiter: `await limiter.acquire()`.
+    """
+    def __init__(self, path: str = DEFAULT_QUEUE_PATH, max_requests: int = 50, time_window: float = 1.0, name: str = "swarm"):
+        super().__init__(path)
+        self.rate = max_requests / time_window
+        self.capacity = max_requests
+        self.name = name
+
+    def _take(self) -> float:
+        """Take a token if one is available; otherwise return how long to wait for the next one."""
+        def take(conn):
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated_at FROM rate_limits WHERE name = ?", (self.name,)).fetchone()
+            tokens = self.capacity if row is None else min(self.capacity, row[0] + (now - row[1]) * self.rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+            if wait == 0.0:
+                tokens -= 1
+            conn.execute("INSERT OR REPLACE INTO rate_limits VALUES (?, ?, ?)", (self.name, tokens, now))
+            return wait
+        return self.transaction(take)
+
+    async def acquire(self):
+        while True:
+            wait = await asyncio.to_thread(self._take)
+            if wait == 0.0:
+                return
+            await asyncio.sleep(wait)
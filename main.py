@@ -1,3 +1,9 @@
+import os
 from agentic_parallel_web import agent
+from lib.metrics import metrics
 
-agent.input_loop()
\ No newline at end of file
+agent.input_loop()
+print(metrics.report())
+if os.environ.get("METRICS_PATH"):
+    with open(os.environ["METRICS_PATH"], "w") as f:
+        f.write(metrics.to_json())
\ No newline at end of file
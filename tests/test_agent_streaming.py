@@ -0,0 +1,21 @@
+import unittest
+
+import anthropic.types
+import pydantic
+
+import lib.agent  # noqa: F401  builds the SDK's response models on import
+
+
+class ResponseModelsTest(unittest.TestCase):
+    def test_response_models_are_built_on_import(self):
+        # Models the SDK left to build on first use would be built by whichever stream got there
+        # first, racing the others (see lib.agent._build_response_models)
+        models = [model for model in vars(anthropic.types).values()
+                  if isinstance(model, type) and issubclass(model, pydantic.BaseModel)]
+        self.assertIn(anthropic.types.Message, models)
+        self.assertIn(anthropic.types.RawMessageStartEvent, models)
+        self.assertEqual([model.__name__ for model in models if not model.__pydantic_complete__], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import json
+import os
+import tempfile
+import unittest
+
+# batch.py builds the agent's clients on import, which only checks that keys are set; nothing is sent
+for key in ("ANTHROPIC_API_KEY", "OPENAI_API_KEY", "SERPER_API_KEY", "FIRECRAWL_API_KEY"):
+    os.environ.setdefault(key, "test")
+
+from batch import load_done, load_queries  # noqa: E402
+
+
+class BatchResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def write(self, name: str, lines: list) -> str:
+        path = os.path.join(self.dir.name, name)
+        with open(path, "w") as f:
+            f.write("\n".join(line if isinstance(line, str) else json.dumps(line) for line in lines) + "\n")
+        return path
+
+    def test_missing_output_means_nothing_done(self):
+        self.assertEqual(load_done(os.path.join(self.dir.name, "missing.jsonl")), set())
+
+    def test_only_done_ids_are_skipped(self):
+        path = self.write("out.jsonl", [
+            {"id": "a", "status": "done"},
+            {"id": "b", "status": "failed"},
+            "",
+            {"id": "c", "status": "skipped"},
+        ])
+        self.assertEqual(load_done(path), {"a"})
+
+    def test_last_record_for_an_id_wins(self):
+        path = self.write("out.jsonl", [
+            {"id": "a", "status": "failed"},
+            {"id": "a", "status": "done"},
+            {"id": "b", "status": "done"},
+            {"id": "b", "status": "failed"},
+        ])
+        self.assertEqual(load_done(path), {"a"})
+
+    def test_queries_without_ids_resume_by_query(self):
+        path = self.write("queries.jsonl", [{"query": "q1"}, {"query": "q2", "id": "mine"}, ""])
+        first, second = load_queries(path)
+        self.assertEqual(second["id"], "mine")
+        # Ids made from the query text are stable, so a rerun skips the same queries
+        self.assertEqual(first["id"], load_queries(path)[0]["id"])
+        out = self.write("out.jsonl", [{"id": first["id"], "status": "done"}])
+        self.assertEqual([q["query"] for q in load_queries(path) if q["id"] not in load_done(out)], ["q2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+
+from lib.budget import Budget, spend_totals
+from lib.metrics import REQUEST_PRICING, MetricsRegistry, current_session
+
+
+class BudgetTest(unittest.TestCase):
+    def setUp(self):
+        self.metrics = MetricsRegistry()
+
+    def finish(self, budget: Budget, company: str, searches: int = 1, tokens: int = 0):
+        self.metrics.record_request("serper", "search", searches)
+        if tokens:
+            self.metrics.record_tokens("openai", "gpt-4o-mini", tokens, 0)
+        budget.finished.add(company)
+
+    def test_spend_is_measured_from_creation(self):
+        self.metrics.record_request("serper", "search", 5)
+        budget = Budget(max_searches=10, metrics=self.metrics)
+        self.metrics.record_request("serper", "search", 2)
+        self.assertEqual(budget.spent()["searches"], 2)
+        self.assertAlmostEqual(budget.spent()["dollars"], 2 * REQUEST_PRICING["serper"])
+
+    def test_allows_projects_in_flight_companies(self):
+        budget = Budget(max_searches=10, searches_per_company=2, metrics=self.metrics)
+        self.assertTrue(budget.allows(in_flight=4))
+        self.assertFalse(budget.allows(in_flight=5))
+        self.assertEqual(budget.exhausted, "max_searches")
+        # Once exhausted, it stays exhausted
+        self.assertFalse(budget.allows())
+
+    def test_estimate_switches_to_live_average(self):
+        budget = Budget(max_searches=10, searches_per_company=1, metrics=self.metrics)
+        self.finish(budget, "A", searches=3)
+        self.finish(budget, "B", searches=3)
+        self.assertEqual(budget.per_company()["searches"], 3)
+        # 6 spent + 3 for the next company fits, 6 + 3 * 2 doesn't
+        self.assertTrue(budget.allows())
+        self.assertFalse(budget.allows(in_flight=1))
+
+    def test_affordable(self):
+        budget = Budget(max_searches=10, searches_per_company=3, metrics=self.metrics)
+        self.assertEqual(budget.affordable(2), 2)
+        self.assertIsNone(budget.exhausted)
+        self.assertEqual(budget.affordable(5), 3)
+        self.assertEqual(budget.exhausted, "max_searches")
+
+    def test_token_cap(self):
+        budget = Budget(max_tokens=5000, metrics=self.metrics)
+        self.finish(budget, "A", tokens=3000)
+        self.assertFalse(budget.allows())
+        self.assertEqual(budget.exhausted, "max_tokens")
+
+    def test_deadline(self):
+        budget = Budget(deadline_seconds=0, metrics=self.metrics)
+        self.assertFalse(budget.allows())
+        self.assertEqual(budget.exhausted, "deadline_seconds")
+        self.assertEqual(budget.remaining_seconds(), 0.0)
+        self.assertIsNone(Budget(metrics=self.metrics).remaining_seconds())
+
+    def test_remaining_only_lists_set_caps(self):
+        budget = Budget(max_searches=10, max_dollars=1.0, metrics=self.metrics)
+        self.metrics.record_request("serper", "search", 4)
+        remaining = budget.remaining()
+        self.assertEqual(set(remaining), {"max_searches", "max_dollars"})
+        self.assertEqual(remaining["max_searches"], 6)
+        self.metrics.record_request("serper", "search", 20)
+        self.assertEqual(budget.remaining()["max_searches"], 0)
+
+    def test_only_its_own_session_counts(self):
+        token = current_session.set("one")
+        try:
+            budget = Budget(max_searches=10, metrics=self.metrics)
+            current_session.set("two")
+            self.metrics.record_request("serper", "search", 50)
+            self.assertEqual(budget.spent()["searches"], 0)
+            self.assertTrue(budget.allows())
+            current_session.set("one")
+            self.metrics.record_request("serper", "search", 3)
+            self.assertEqual(budget.spent()["searches"], 3)
+        finally:
+            current_session.reset(token)
+
+    def test_from_dict_ignores_unset_limits(self):
+        budget = Budget.from_dict({"max_searches": 5, "max_dollars": None, "other": 1}, metrics=self.metrics)
+        self.assertEqual(budget.max_searches, 5)
+        self.assertIsNone(budget.max_dollars)
+
+    def test_spend_totals_by_label(self):
+        self.metrics.record_request("serper", "search", 2)
+        self.metrics.record_tokens("openai", "gpt-4o-mini", 100, 20)
+        totals = spend_totals(self.metrics)
+        self.assertEqual(totals["searches"], 2)
+        self.assertEqual(totals["tokens"], 120)
+        self.assertEqual(spend_totals(self.metrics, session="elsewhere")["searches"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+from unittest import mock
+
+from lib.metrics import MetricsRegistry
+from lib.search_cache import SearchCache
+
+
+class SearchCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.metrics = MetricsRegistry()
+        self.cache = SearchCache(metrics=self.metrics)
+
+    def requests(self, result: str) -> int:
+        return self.metrics.get("cache_requests_total", cache="serper", result=result)
+
+    def test_claim_fill_then_hit(self):
+        hits, waiting, owned = self.cache.claim(["a", "b", "a"])
+        self.assertEqual((hits, waiting, owned), ({}, {}, ["a", "b"]))
+        self.cache.fill("a", {"organic": []})
+        self.cache.fill("b", {"organic": [1]})
+        hits, waiting, owned = self.cache.claim(["a", "b"])
+        self.assertEqual(hits, {"a": {"organic": []}, "b": {"organic": [1]}})
+        self.assertEqual((waiting, owned), ({}, []))
+        self.assertEqual((self.requests("miss"), self.requests("hit")), (2, 2))
+
+    def test_waiters_get_the_owners_result(self):
+        _, _, owned = self.cache.claim(["a"])
+        _, waiting, again = self.cache.claim(["a"])
+        self.assertEqual((owned, again), (["a"], []))
+        self.assertFalse(waiting["a"].done())
+        self.assertIn("a", self.cache)
+        self.cache.fill("a", {"organic": []})
+        self.assertEqual(waiting["a"].result(timeout=0), {"organic": []})
+        self.assertEqual(self.requests("pending"), 1)
+
+    def test_release_hands_the_query_back(self):
+        self.cache.claim(["a"])
+        _, waiting, _ = self.cache.claim(["a"])
+        self.cache.release("a")
+        # Waiters get None and fetch the query themselves; nothing is cached
+        self.assertIsNone(waiting["a"].result(timeout=0))
+        self.assertNotIn("a", self.cache)
+        self.assertEqual(self.cache.claim(["a"])[2], ["a"])
+
+    def test_failed_result_is_not_cached(self):
+        self.cache.claim(["a"])
+        _, waiting, _ = self.cache.claim(["a"])
+        self.cache.fill("a", ValueError("no results"))
+        self.assertIsNone(waiting["a"].result(timeout=0))
+        self.assertNotIn("a", self.cache)
+
+    def test_entries_expire(self):
+        cache = SearchCache(ttl=10, metrics=self.metrics)
+        with mock.patch("lib.search_cache.time.monotonic", return_value=100.0):
+            cache.claim(["a"])
+            cache.fill("a", {})
+        with mock.patch("lib.search_cache.time.monotonic", return_value=105.0):
+            self.assertIn("a", cache)
+        with mock.patch("lib.search_cache.time.monotonic", return_value=111.0):
+            self.assertNotIn("a", cache)
+
+    def test_least_recently_used_are_evicted(self):
+        cache = SearchCache(max_entries=2, metrics=self.metrics)
+        for query in ("a", "b"):
+            cache.claim([query])
+            cache.fill(query, {})
+        cache.claim(["a"])  # a hit makes "a" the most recently used
+        cache.claim(["c"])
+        cache.fill("c", {})
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+
+    def test_prefetch_hits_are_counted_once(self):
+        self.cache.claim(["a", "b"], speculative=True)
+        self.cache.fill("a", {})
+        # "a" was prefetched and is cached, "b" is still being prefetched
+        self.cache.claim(["a", "b"])
+        self.cache.claim(["a", "b"])
+        self.assertEqual(self.metrics.get("prefetch_hits_total"), 2)
+        # Speculative lookups never count as prefetch hits
+        self.cache.claim(["c"], speculative=True)
+        self.cache.fill("c", {})
+        self.cache.claim(["c"], speculative=True)
+        self.assertEqual(self.metrics.get("prefetch_hits_total"), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import asyncio
+import unittest
+
+from lib.metrics import MetricsRegistry
+from lib.search_cache import SearchCache
+from lib.serper_client import SerperClient, SerperError
+
+
+def result(query: str) -> dict:
+    return {"searchParameters": {"q": query}, "organic": [{"title": query}]}
+
+
+class SerperBatchTest(unittest.TestCase):
+    """_batch and search_results_batch_async over a fake _post, so nothing is sent."""
+    def setUp(self):
+        self.metrics = MetricsRegistry()
+        self.client = SerperClient("key", base_url="http://127.0.0.1:9", metrics=self.metrics, hedge=False, batch_size=3)
+        self.posts = []
+
+    def serve(self, batch=None, single=None):
+        """Answer batches with batch(queries) and single searches with single(query)."""
+        async def post(body, queries):
+            self.posts.append(body)
+            if isinstance(body, list):
+                return batch([item["q"] for item in body])
+            return single(body["q"])
+        self.client._post = post
+
+    def run_batch(self, queries):
+        return asyncio.run(self.client.search_results_batch_async(queries))
+
+    def test_batch_results_in_order(self):
+        self.serve(batch=lambda queries: [result(q) for q in queries])
+        results = self.run_batch(["a", "b", "c", "d", "e"])
+        self.assertEqual([r["searchParameters"]["q"] for r in results], ["a", "b", "c", "d", "e"])
+        # batch_size=3: one batch of three, one of two
+        self.assertEqual([len(body) for body in self.posts], [3, 2])
+
+    def test_failed_query_in_a_batch_fails_alone(self):
+        self.serve(batch=lambda queries: [{"error": "bad query"} if q == "b" else result(q) for q in queries])
+        a, b, c = self.run_batch(["a", "b", "c"])
+        self.assertEqual((a["organic"], c["organic"]), ([{"title": "a"}], [{"title": "c"}]))
+        self.assertIsInstance(b, ValueError)
+
+    def test_server_error_falls_back_to_single_searches(self):
+        def batch(queries):
+            raise SerperError(500, "internal error")
+
+        def single(query):
+            if query == "b":
+                raise SerperError(400, "bad query")
+            return result(query)
+        self.serve(batch, single)
+        a, b, c = self.run_batch(["a", "b", "c"])
+        self.assertEqual((a["organic"], c["organic"]), ([{"title": "a"}], [{"title": "c"}]))
+        self.assertIsInstance(b, SerperError)
+        self.assertEqual(len(self.posts), 4)
+
+    def test_short_answer_falls_back_to_single_searches(self):
+        self.serve(batch=lambda queries: [result(queries[0])], single=result)
+        results = self.run_batch(["a", "b", "c"])
+        self.assertEqual([r["searchParameters"]["q"] for r in results], ["a", "b", "c"])
+        self.assertEqual(len(self.posts), 4)
+
+    def test_throttled_batch_is_not_split(self):
+        def batch(queries):
+            raise SerperError(429, "slow down")
+        self.serve(batch, single=result)
+        results = self.run_batch(["a", "b", "c"])
+        self.assertTrue(all(isinstance(r, SerperError) and r.status == 429 for r in results))
+        self.assertEqual(len(self.posts), 1)
+
+    def test_one_failing_batch_leaves_the_others(self):
+        def batch(queries):
+            if "d" in queries:
+                raise SerperError(429, "slow down")
+            return [result(q) for q in queries]
+        self.serve(batch)
+        results = self.run_batch(["a", "b", "c", "d", "e"])
+        self.assertEqual([isinstance(r, dict) for r in results], [True, True, True, False, False])
+
+    def test_failures_are_not_cached(self):
+        self.client.cache = SearchCache(metrics=self.metrics)
+        self.serve(batch=lambda queries: [{"error": "bad query"} if q == "b" else result(q) for q in queries])
+        self.run_batch(["a", "b", "c"])
+        self.assertIn("a", self.client.cache)
+        self.assertNotIn("b", self.client.cache)
+        # Only the failed query is sent again
+        self.serve(single=result)
+        a, b, c = self.run_batch(["a", "b", "c"])
+        self.assertEqual(self.posts[-1], {"q": "b"})
+        self.assertEqual(b["organic"], [{"title": "b"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+
+from lib.structured import StructuredOutputError, repair, schema_format
+
+SCORE = {"type": "integer", "minimum": 0, "maximum": 100}
+CRITERION = {"title": "criterion", "type": "object", "properties": {"score": SCORE, "reason": {"type": "string"}}}
+DECOMPOSITION = {
+    "title": "decomposition",
+    "type": "object",
+    "properties": {
+        "operator": {"type": "string", "enum": ["and", "or"]},
+        "criteria": {"type": "array", "items": {"type": "object", "properties": {"criteria": {"type": "string"}}}},
+    },
+}
+
+
+class RepairTest(unittest.TestCase):
+    def test_valid_json_is_unchanged(self):
+        self.assertEqual(repair('{"score": 70, "reason": "r"}', CRITERION), {"score": 70, "reason": "r"})
+
+    def test_code_fences_and_surrounding_prose(self):
+        text = 'Here you go:\n```json\n{"score": 70, "reason": "r"}\n```'
+        self.assertEqual(repair(text, CRITERION), {"score": 70, "reason": "r"})
+        self.assertEqual(repair('Sure. {"score": 70, "reason": "r"} Hope that helps', CRITERION), {"score": 70, "reason": "r"})
+
+    def test_trailing_comma(self):
+        self.assertEqual(repair('{"score": 70, "reason": "r",}', CRITERION), {"score": 70, "reason": "r"})
+
+    def test_truncated_response_is_closed(self):
+        self.assertEqual(repair('{"score": 70, "reason": "strong mar', CRITERION), {"score": 70, "reason": "strong mar"})
+        # A dangling key can't be completed, so it is dropped and the missing string left empty
+        self.assertEqual(repair('{"score": 70, "reas', CRITERION), {"score": 70, "reason": ""})
+
+    def test_numbers_from_strings_are_clamped(self):
+        self.assertEqual(repair('{"score": "85/100", "reason": "r"}', CRITERION)["score"], 85)
+        self.assertEqual(repair('{"score": "92.6%", "reason": "r"}', CRITERION)["score"], 93)
+        self.assertEqual(repair('{"score": 140, "reason": "r"}', CRITERION)["score"], 100)
+        self.assertEqual(repair('{"score": -5, "reason": "r"}', CRITERION)["score"], 0)
+
+    def test_keys_matched_loosely(self):
+        self.assertEqual(repair('{"Score": 70, "REASON": "r"}', CRITERION), {"score": 70, "reason": "r"})
+        self.assertEqual(repair('{"final_score": 70, "reason": "r"}', CRITERION)["score"], 70)
+
+    def test_wrapped_answer_and_lone_list_item(self):
+        self.assertEqual(repair('{"answer": {"score": 70, "reason": "r"}}', CRITERION), {"score": 70, "reason": "r"})
+        self.assertEqual(repair('[{"score": 70, "reason": "r"}]', CRITERION), {"score": 70, "reason": "r"})
+
+    def test_enum_and_single_value_for_list(self):
+        result = repair('{"operator": " AND ", "criteria": {"criteria": "profitable"}}', DECOMPOSITION)
+        self.assertEqual(result, {"operator": "and", "criteria": [{"criteria": "profitable"}]})
+
+    def test_unknown_keys_are_kept(self):
+        self.assertEqual(repair('{"score": 70, "reason": "r", "extra": 1}', CRITERION), {"score": 70, "reason": "r", "extra": 1})
+
+    def test_unusable_responses_raise(self):
+        for text in ("no json here", '{"reason": "r"}', '{"score": "high", "reason": "r"}', '{"score": true, "reason": "r"}'):
+            with self.subTest(text=text), self.assertRaises(StructuredOutputError):
+                repair(text, CRITERION)
+        with self.assertRaises(StructuredOutputError):
+            repair('{"operator": "xor", "criteria": []}', DECOMPOSITION)
+
+    def test_error_names_the_field(self):
+        with self.assertRaisesRegex(StructuredOutputError, r"\$\.score"):
+            repair('{"reason": "r"}', CRITERION)
+
+
+class SchemaFormatTest(unittest.TestCase):
+    def test_strict_schema(self):
+        response_format = schema_format("criterion", CRITERION)
+        self.assertEqual(response_format["type"], "json_schema")
+        schema = response_format["json_schema"]["schema"]
+        self.assertTrue(response_format["json_schema"]["strict"])
+        self.assertEqual(schema["required"], ["score", "reason"])
+        self.assertFalse(schema["additionalProperties"])
+        # Limits are enforced by repair() instead
+        self.assertEqual(schema["properties"]["score"], {"type": "integer"})
+        self.assertNotIn("title", schema)
+
+    def test_nested_objects_are_strict(self):
+        items = schema_format("decomposition", DECOMPOSITION)["json_schema"]["schema"]["properties"]["criteria"]["items"]
+        self.assertEqual(items["required"], ["criteria"])
+        self.assertFalse(items["additionalProperties"])
+
+
+if __name__ == "__main__":
+    unittest.main()